@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Job incremental del resumen de reportes (pagos_resumen)
+Ejecución: python actualizar_reportes.py [--lote 500]
+
+Recalcula las horas que los triggers marcaron como pendientes desde la
+última ejecución, por lotes de --lote horas hasta vaciar la cola. Pensado
+para cron:
+
+    */5 * * * * cd /home/ubuntu/pagos && venv/bin/python actualizar_reportes.py
+
+Si otro proceso (otro cron o /admin/reportes) ya está actualizando, termina
+sin hacer nada. Requiere migrate_reportes.py.
+"""
+
+import sys
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import db_pool  # noqa: E402
+from reportes import actualizar_resumen, HORAS_POR_LOTE  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula las horas pendientes de pagos_resumen")
+    parser.add_argument("--lote", type=int, default=HORAS_POR_LOTE, help="Horas por transacción")
+    args = parser.parse_args()
+
+    inicio = time.monotonic()
+    total = 0
+    try:
+        with db_pool.conexion() as conn:
+            while True:
+                horas = actualizar_resumen(conn, args.lote)
+                if horas is None:
+                    print("⚠️  Otro proceso está actualizando el resumen; nada que hacer")
+                    return
+                total += horas
+                if horas < args.lote:
+                    break
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    print(f"✅ {total} horas recalculadas en {(time.monotonic() - inicio) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
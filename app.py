@@ -1,23 +1,43 @@
-import psycopg2
 import re
 import os
-import pandas as pd
+import time
+import sqlite3
+import psycopg2
 import pytz
 import secrets
-from flask import Flask, request, render_template_string, redirect, url_for, session, send_file, jsonify
+import gzip
+import hashlib
+import hmac
+from flask import Flask, request, redirect, url_for, session, jsonify, Response, stream_with_context, send_from_directory
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from cryptography.fernet import Fernet
 from datetime import datetime, timedelta
-from io import BytesIO
+from decimal import Decimal
+from urllib.parse import urlencode
 from dotenv import load_dotenv, set_key
 import logging
 
 # Importar funciones del API BDV
 from banco_api import validar_pago_bdv, registrar_pago_validado
 from templates_bdv import HTML_VALIDAR_BDV
+from montos import normalizar_monto
+from busqueda import construir_filtro
+from canje import canjear_pago, canjear_lote
+from reportes import actualizar_resumen, consultar_reporte, AGRUPACIONES
+from extractor import extraer_candidatos, recargar_motor, obtener_bancos, ReglasBancoError
+from exportacion import (
+    construir_filtro_exportacion, iterar_filas, generar_csv, escribir_excel, transmitir_archivo, borrar_archivo,
+    SEPARADORES, FILAS_POR_HOJA
+)
+import db_pool
+import consultas
+import limites_sqlite  # noqa: F401  (registra sqlite:// como almacenamiento de Flask-Limiter)
+import metricas
+import perfiles
+from cola_webhook import ColaWebhook
 
 # --- GENERACIÓN AUTOMÁTICA DE CLAVES ---
 def generar_claves_automaticas():
@@ -65,6 +85,8 @@ def generar_claves_automaticas():
 generar_claves_automaticas()
 load_dotenv(override=True)
 app = Flask(__name__)
+metricas.instrumentar(app)  # Primero: su after_request corre el último y mide la respuesta completa
+perfiles.instalar(app, lambda: bool(session.get('logged_in')))  # Sin efecto con PERFILES=0
 
 # Obtener SECRET_KEY (ya garantizada por la función anterior)
 secret_key = os.getenv("SECRET_KEY")
@@ -73,9 +95,19 @@ app.secret_key = secret_key
 # Configurar CORS
 CORS(app, resources={
     r"/validar-pago-bdv": {"origins": "*"},
-    r"/verificar": {"origins": "*"}
+    r"/verificar": {"origins": "*"},
+    r"/api/v1/verificar": {"origins": "*"}
 })
 
+# RATELIMIT_ENABLED=0 solo para pruebas de carga locales (benchmarks/carga.py)
+app.config["RATELIMIT_ENABLED"] = os.getenv("RATELIMIT_ENABLED", "1") == "1"
+# Contadores compartidos por todos los workers (limites_sqlite.py); redis://... para varias máquinas
+app.config["RATELIMIT_STORAGE_URI"] = os.getenv(
+    "RATELIMIT_STORAGE_URI", "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "limites.db")
+)
+app.config["RATELIMIT_STRATEGY"] = os.getenv("RATELIMIT_STRATEGY", "sliding-window-counter")
+# Si el almacenamiento falla, límites por worker en memoria hasta que se recupere
+app.config["RATELIMIT_IN_MEMORY_FALLBACK_ENABLED"] = True
 limiter = Limiter(app=app, key_func=get_remote_address, default_limits=["200 per day", "50 per hour"])
 
 # Configurar logging
@@ -108,15 +140,19 @@ def validar_comanda(comanda):
         return False
     return bool(re.match(r'^[A-Za-z0-9\-#]+$', comanda))
 
-def validar_monto(monto):
+def validar_monto(monto, formato="auto"):
     """Valida formato de monto (numérico con máximo 2 decimales)"""
     if not monto or not isinstance(monto, str):
         return False
+    val = normalizar_monto(monto, formato)
+    return val is not None and Decimal("0.01") <= val <= Decimal("999999999.99")
+
+def parsear_fecha(texto):
+    """Convierte YYYY-MM-DD a date (None si está vacío o es inválido)"""
     try:
-        val = float(monto.replace('.', '').replace(',', '.'))
-        return 0.01 <= val <= 999999999.99
-    except:
-        return False
+        return datetime.strptime(texto.strip(), "%Y-%m-%d").date()
+    except (ValueError, AttributeError):
+        return None
 
 def obtener_ip_real():
     """Obtiene la IP real considerando proxies"""
@@ -139,27 +175,22 @@ def desencriptar_dato(dato):
     except:
         return None
 
-# --- CONEXIÓN BASE DE DATOS (CON VALIDACIÓN) ---
+# --- CONEXIÓN BASE DE DATOS (POOL COMPARTIDO) ---
 def get_db_connection():
-    """Obtiene conexión a BD con manejo de errores"""
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASS"),
-            port=os.getenv("DB_PORT", "5432"),
-            sslmode="require" if "neon.tech" in (os.getenv("DB_HOST") or "") else "disable",
-            connect_timeout=5
-        )
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Error de conexión BD: {e}")
-        raise Exception("Error de conexión a la base de datos")
+    """Presta una conexión del pool compartido (usar con ``with``)"""
+    return db_pool.conexion()
 
-# --- EXTRACTOR INTELIGENTE (v16 - MEJORADO) ---
+# --- EXTRACTOR INTELIGENTE (v18 - REGLAS EN bancos.json, ver extractor.py) ---
 def extractor_inteligente(texto):
-    """Extrae pagos de texto con validación"""
+    """Extrae pagos de texto con validación (mide el tiempo por banco detectado en /metrics)"""
+    inicio = time.perf_counter()
+    pagos_detectados = _extraer_pagos(texto)
+    banco = pagos_detectados[0]["banco"] if pagos_detectados else "ninguno"
+    metricas.EXTRACTOR_SEGUNDOS.labels(banco).observe(time.perf_counter() - inicio)
+    return pagos_detectados
+
+def _extraer_pagos(texto):
+    """Extracción y validación de los candidatos del motor de reglas"""
     texto_limpio = texto.replace('"', '').replace('\\n', ' ').replace('\n', ' ').strip()
     pagos_detectados = []
     
@@ -168,42 +199,31 @@ def extractor_inteligente(texto):
         logger.warning("Texto excesivamente largo en extractor")
         return []
     
-    patrones = {
-        "BDV": (r"BDV|PagomovilBDV", r"(?:del|tlf|desde el tlf)\s*(\d+)", r"(?:por|Bs\.?|Monto:)\s*([\d.]+,\d{2})", r"Ref:\s*(\d+)"),
-        "BANESCO": (r"Banesco", r"(?:de|desde|tlf)\s*(\d+)", r"(?:Bs\.?|Monto:?)\s*([\d.]+,\d{2})", r"Ref:\s*(\d+)"),
-        "SOFITASA": (r"SOFITASA", r"Telf\.?([\d*]+)", r"Bs\.?\s*([\d,.]+)", r"Ref[:\s]*(\d+)"),
-        "BINANCE": (r"Binance", r"(?:from|de)\s+(.*?)\s", r"([\d.]+)\s*USDT", r"(?:ID|Order)[:\s]+(\d+)"),
-        "PLAZA": (r"Plaza", r"Celular\s+([\d]+)", r"(?:BS\.?|por)\s*([\d,.]+)", r"Ref[\.:]\s*(\d+)")
-    }
-
-    for banco, (key, re_emi, re_mon, re_ref) in patrones.items():
-        if re.search(key, texto_limpio, re.IGNORECASE):
-            m_emi = re.search(re_emi, texto_limpio, re.IGNORECASE)
-            m_mon = re.search(re_mon, texto_limpio, re.IGNORECASE)
-            m_ref = re.search(re_ref, texto_limpio, re.IGNORECASE)
+    for candidato in extraer_candidatos(texto_limpio):
+        referencia = candidato["referencia"]
+        
+        if referencia:
+            # Validar referencia extraída
+            if not validar_referencia(referencia):
+                logger.warning(f"Referencia inválida detectada: {referencia}")
+                continue
             
-            if m_ref:
-                referencia = m_ref.group(1)
-                
-                # Validar referencia extraída
-                if not validar_referencia(referencia):
-                    logger.warning(f"Referencia inválida detectada: {referencia}")
-                    continue
-                
-                monto_raw = m_mon.group(1) if m_mon else "0,00"
-                
-                # Validar monto
-                if not validar_monto(monto_raw):
-                    logger.warning(f"Monto inválido detectado: {monto_raw}")
-                    continue
-                
-                pagos_detectados.append({
-                    "banco": banco, 
-                    "emisor": m_emi.group(1) if m_emi else "S/D", 
-                    "monto": monto_raw, 
-                    "referencia": referencia,
-                    "original": texto_limpio[:500]  # Limitar texto almacenado
-                })
+            monto_raw = candidato["monto"] or "0,00"
+            
+            # Validar monto
+            if not validar_monto(monto_raw, candidato["formato_monto"]):
+                logger.warning(f"Monto inválido detectado: {monto_raw}")
+                continue
+            
+            pagos_detectados.append({
+                "banco": candidato["banco"], 
+                "emisor": candidato["emisor"] or "S/D", 
+                "monto": monto_raw, 
+                "monto_num": normalizar_monto(monto_raw, candidato["formato_monto"]),
+                "moneda": candidato["moneda"],
+                "referencia": referencia,
+                "original": texto_limpio[:500]  # Limitar texto almacenado
+            })
     
     return pagos_detectados
 
@@ -245,9 +265,32 @@ input:focus { border-color: var(--primary); background: #fdfdfd; }
 '''
 
 # --- VISTAS HTML ---
-HTML_LOGIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1"><style>''' + CSS_FINAL + '''</style></head><body><div style="display:flex; align-items:center; justify-content:center; min-height:100vh; background: radial-gradient(circle at top, #004481 0%, #001a33 100%); padding: 20px;"><div class="card" style="width:100%; max-width:420px; border:none;"> <h1 style="color:var(--primary); margin-bottom:5px;">SISTEMAS MV</h1><p style="color:#777; margin-bottom:25px;">Control Administrativo v2026</p><form method="POST"><input type="password" name="password" placeholder="PIN de Seguridad" style="margin-bottom:20px;" autofocus required><button class="btn btn-primary" style="width:100%;">ENTRAR AL SISTEMA</button></form>{% if error %}<p class="error-msg">{{ error }}</p>{% endif %}<hr style="margin:25px 0; border:0; border-top:1px solid #eee;"><a href="/" class="btn btn-light" style="width:100%;">🔍 IR AL VERIFICADOR</a></div></div></body></html>'''
+# Estilos del panel (paginación y buscador)
+CSS_ADMIN = '''
+.pagination { display: flex; justify-content: center; align-items: center; gap: 10px; margin: 25px 0; flex-wrap: wrap; }
+.pagination a, .pagination span { padding: 10px 15px; border-radius: 8px; text-decoration: none; font-weight: 600; transition: 0.3s; }
+.pagination a { background: white; color: var(--primary); border: 2px solid var(--primary); }
+.pagination a:hover { background: var(--primary); color: white; }
+.pagination .active { background: var(--primary); color: white; border: 2px solid var(--primary); }
+.pagination .disabled { background: #f0f0f0; color: #999; border: 2px solid #ddd; cursor: not-allowed; }
+.pagination-info { text-align: center; color: #666; font-size: 14px; margin: 15px 0; }
+.per-page-selector { display: flex; justify-content: center; align-items: center; gap: 10px; margin: 15px 0; }
+.per-page-selector select { padding: 8px 12px; border-radius: 8px; border: 2px solid #ddd; font-size: 14px; cursor: pointer; }
+.search-form { display: flex; gap: 10px; align-items: center; }
+.search-form input[type="text"] { flex: 1; }
+.search-form button { white-space: nowrap; }
+'''
+
+# Hoja de estilos compartida: se sirve una sola vez como archivo estático con caché inmutable.
+# La huella del contenido va en la URL, así que cualquier cambio del CSS genera una URL nueva.
+ESTILOS = (CSS_FINAL + CSS_ADMIN).encode("utf-8")
+ESTILOS_HUELLA = hashlib.sha256(ESTILOS).hexdigest()[:16]
+ESTILOS_GZIP = gzip.compress(ESTILOS, 9)
+CSS_LINK = f'<link rel="stylesheet" href="/estilos.{ESTILOS_HUELLA}.css">'
 
-HTML_PORTAL = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1"><style>''' + CSS_FINAL + '''</style></head><body><div class="container"><div style="max-width:550px; margin: 40px auto 0; padding: 0 20px;"><div class="nav-header"><a href="/" class="btn btn-light">🔄 Recargar</a><a href="/login" class="btn btn-primary">⚙️ Acceso Admin</a></div><div class="card"><h2>Verificar Transacción</h2><p style="color:#888; font-size:14px; margin-bottom:25px;">Ingrese los datos para validar su comanda</p><form method="POST" action="/verificar"><input type="text" name="ref" placeholder="Últimos 6 dígitos o Referencia completa" style="margin-bottom:15px;" required minlength="6"><input type="text" name="comanda" placeholder="Nro de Comanda / Orden" style="margin-bottom:25px;" required><button class="btn btn-primary" style="width:100%; padding:18px;">VALIDAR AHORA</button></form>
+HTML_LOGIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1">''' + CSS_LINK + '''</head><body><div style="display:flex; align-items:center; justify-content:center; min-height:100vh; background: radial-gradient(circle at top, #004481 0%, #001a33 100%); padding: 20px;"><div class="card" style="width:100%; max-width:420px; border:none;"> <h1 style="color:var(--primary); margin-bottom:5px;">SISTEMAS MV</h1><p style="color:#777; margin-bottom:25px;">Control Administrativo v2026</p><form method="POST"><input type="password" name="password" placeholder="PIN de Seguridad" style="margin-bottom:20px;" autofocus required><button class="btn btn-primary" style="width:100%;">ENTRAR AL SISTEMA</button></form>{% if error %}<p class="error-msg">{{ error }}</p>{% endif %}<hr style="margin:25px 0; border:0; border-top:1px solid #eee;"><a href="/" class="btn btn-light" style="width:100%;">🔍 IR AL VERIFICADOR</a></div></div></body></html>'''
+
+HTML_PORTAL = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1">''' + CSS_LINK + '''</head><body><div class="container"><div style="max-width:550px; margin: 40px auto 0; padding: 0 20px;"><div class="nav-header"><a href="/" class="btn btn-light">🔄 Recargar</a><a href="/login" class="btn btn-primary">⚙️ Acceso Admin</a></div><div class="card"><h2>Verificar Transacción</h2><p style="color:#888; font-size:14px; margin-bottom:25px;">Ingrese los datos para validar su comanda</p><form method="POST" action="/verificar"><input type="text" name="ref" placeholder="Últimos 6 dígitos o Referencia completa" style="margin-bottom:15px;" required minlength="6"><input type="text" name="comanda" placeholder="Nro de Comanda / Orden" style="margin-bottom:25px;" required><button class="btn btn-primary" style="width:100%; padding:18px;">VALIDAR AHORA</button></form>
 {% if resultado %}
     <div class="notif-pago notif-{{ resultado.clase }}">
         <div style="display:flex; align-items:center; gap:10px;"><strong style="font-size:18px;">{{ resultado.titulo }}</strong></div>
@@ -265,34 +308,21 @@ HTML_PORTAL = '''<!DOCTYPE html><html><head><meta name="viewport" content="width
 {% endif %}
 </div></div></div></body></html>'''
 
-HTML_ADMIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1"><style>''' + CSS_FINAL + '''
-.pagination { display: flex; justify-content: center; align-items: center; gap: 10px; margin: 25px 0; flex-wrap: wrap; }
-.pagination a, .pagination span { padding: 10px 15px; border-radius: 8px; text-decoration: none; font-weight: 600; transition: 0.3s; }
-.pagination a { background: white; color: var(--primary); border: 2px solid var(--primary); }
-.pagination a:hover { background: var(--primary); color: white; }
-.pagination .active { background: var(--primary); color: white; border: 2px solid var(--primary); }
-.pagination .disabled { background: #f0f0f0; color: #999; border: 2px solid #ddd; cursor: not-allowed; }
-.pagination-info { text-align: center; color: #666; font-size: 14px; margin: 15px 0; }
-.per-page-selector { display: flex; justify-content: center; align-items: center; gap: 10px; margin: 15px 0; }
-.per-page-selector select { padding: 8px 12px; border-radius: 8px; border: 2px solid #ddd; font-size: 14px; cursor: pointer; }
-.search-form { display: flex; gap: 10px; align-items: center; }
-.search-form input[type="text"] { flex: 1; }
-.search-form button { white-space: nowrap; }
-</style></head><body><div class="container"><div class="nav-header"><h2>Panel de Control</h2><div style="display:flex; gap:10px; flex-wrap:wrap;"><a href="/" class="btn btn-light">🔍 Verificador</a><a href="/admin/exportar" class="btn btn-success">📊 Excel</a><a href="/logout" class="btn btn-danger">🚪 Salir</a></div></div>
+HTML_ADMIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1">''' + CSS_LINK + '''</head><body><div class="container"><div class="nav-header"><h2>Panel de Control</h2><div style="display:flex; gap:10px; flex-wrap:wrap;"><a href="/" class="btn btn-light">🔍 Verificador</a><a href="/admin/reportes" class="btn btn-light">📈 Reportes</a><a href="/admin/perfiles" class="btn btn-light">🔬 Perfiles</a><a href="/admin/exportar" class="btn btn-success">📊 Excel</a><a href="/admin/exportar?formato=csv" class="btn btn-light">📄 CSV</a><a href="/logout" class="btn btn-danger">🚪 Salir</a></div></div>
 
 <div class="pagination-info">
     {% if paginacion.search %}
         Resultados de búsqueda: <strong>{{ paginacion.total_registros }}</strong> registros encontrados
         <br>
-        <a href="/admin?page=1&per_page={{ paginacion.per_page }}" class="btn btn-light" style="margin-top:10px;">❌ Limpiar búsqueda</a>
+        <a href="/admin?per_page={{ paginacion.per_page }}" class="btn btn-light" style="margin-top:10px;">❌ Limpiar búsqueda</a>
     {% else %}
-        Mostrando <strong>{{ paginacion.inicio_registro }}</strong> a <strong>{{ paginacion.fin_registro }}</strong> de <strong>{{ paginacion.total_registros }}</strong> registros
+        Mostrando <strong>{{ paginacion.inicio_registro }}</strong> a <strong>{{ paginacion.fin_registro }}</strong> de <strong>{% if paginacion.aproximado %}≈{% endif %}{{ paginacion.total_registros }}</strong> registros
     {% endif %}
 </div>
 
 <div class="per-page-selector">
     <label>Registros por página:</label>
-    <select onchange="window.location.href='/admin?page=1&per_page='+this.value{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">
+    <select onchange="window.location.href='/admin?per_page='+this.value{% if paginacion.search %}+'&search={{ paginacion.search|urlencode }}'{% endif %}">
         <option value="25" {% if paginacion.per_page == 25 %}selected{% endif %}>25</option>
         <option value="50" {% if paginacion.per_page == 50 %}selected{% endif %}>50</option>
         <option value="100" {% if paginacion.per_page == 100 %}selected{% endif %}>100</option>
@@ -302,30 +332,39 @@ HTML_ADMIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=
 
 <div class="card" style="padding:15px;">
     <form method="GET" action="/admin" class="search-form">
-        <input type="hidden" name="page" value="1">
         <input type="hidden" name="per_page" value="{{ paginacion.per_page }}">
-        <input type="text" name="search" placeholder="🔍 Buscar por referencia, comanda, banco, emisor o monto..." value="{{ paginacion.search }}" autofocus>
+        <input type="text" name="search" placeholder="🔍 Buscar por referencia, comanda, banco, emisor o monto (ref:, comanda:, banco:, monto:)..." value="{{ paginacion.search }}" autofocus>
         <button type="submit" class="btn btn-primary">Buscar</button>
         {% if paginacion.search %}
-            <a href="/admin?page=1&per_page={{ paginacion.per_page }}" class="btn btn-light">Limpiar</a>
+            <a href="/admin?per_page={{ paginacion.per_page }}" class="btn btn-light">Limpiar</a>
         {% endif %}
     </form>
 </div>
 
+<div class="card" style="padding:15px;">
+    <form method="GET" action="/admin/exportar" class="search-form" style="flex-wrap:wrap;">
+        <input type="date" name="desde" title="Desde" style="flex:1; min-width:140px;">
+        <input type="date" name="hasta" title="Hasta" style="flex:1; min-width:140px;">
+        <input type="text" name="banco" placeholder="Banco (opcional)" style="flex:1; min-width:140px;">
+        <button type="submit" name="formato" value="xlsx" class="btn btn-success">📊 Excel</button>
+        <button type="submit" name="formato" value="csv" class="btn btn-light">📄 CSV</button>
+    </form>
+</div>
+
 <div class="pagination">
     {% if paginacion.tiene_anterior %}
-        <a href="/admin?page=1&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">⏮️ Primera</a>
-        <a href="/admin?page={{ paginacion.pagina_anterior }}&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">⬅️ Anterior</a>
+        <a href="/admin?{{ paginacion.filtros_url }}">⏮️ Primera</a>
+        <a href="/admin?despues={{ paginacion.primer_id }}&page={{ paginacion.pagina_anterior }}&{{ paginacion.filtros_url }}">⬅️ Anterior</a>
     {% else %}
         <span class="disabled">⏮️ Primera</span>
         <span class="disabled">⬅️ Anterior</span>
     {% endif %}
     
-    <span class="active">Página {{ paginacion.page }} de {{ paginacion.total_paginas }}</span>
+    <span class="active">Página {{ paginacion.page }} de {% if paginacion.aproximado %}≈{% endif %}{{ paginacion.total_paginas }}</span>
     
     {% if paginacion.tiene_siguiente %}
-        <a href="/admin?page={{ paginacion.pagina_siguiente }}&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">Siguiente ➡️</a>
-        <a href="/admin?page={{ paginacion.total_paginas }}&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">Última ⏭️</a>
+        <a href="/admin?antes={{ paginacion.ultimo_id }}&page={{ paginacion.pagina_siguiente }}&{{ paginacion.filtros_url }}">Siguiente ➡️</a>
+        <a href="/admin?ultima=1&{{ paginacion.filtros_url }}">Última ⏭️</a>
     {% else %}
         <span class="disabled">Siguiente ➡️</span>
         <span class="disabled">Última ⏭️</span>
@@ -360,18 +399,18 @@ HTML_ADMIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=
 
 <div class="pagination">
     {% if paginacion.tiene_anterior %}
-        <a href="/admin?page=1&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">⏮️ Primera</a>
-        <a href="/admin?page={{ paginacion.pagina_anterior }}&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">⬅️ Anterior</a>
+        <a href="/admin?{{ paginacion.filtros_url }}">⏮️ Primera</a>
+        <a href="/admin?despues={{ paginacion.primer_id }}&page={{ paginacion.pagina_anterior }}&{{ paginacion.filtros_url }}">⬅️ Anterior</a>
     {% else %}
         <span class="disabled">⏮️ Primera</span>
         <span class="disabled">⬅️ Anterior</span>
     {% endif %}
     
-    <span class="active">Página {{ paginacion.page }} de {{ paginacion.total_paginas }}</span>
+    <span class="active">Página {{ paginacion.page }} de {% if paginacion.aproximado %}≈{% endif %}{{ paginacion.total_paginas }}</span>
     
     {% if paginacion.tiene_siguiente %}
-        <a href="/admin?page={{ paginacion.pagina_siguiente }}&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">Siguiente ➡️</a>
-        <a href="/admin?page={{ paginacion.total_paginas }}&per_page={{ paginacion.per_page }}{% if paginacion.search %}&search={{ paginacion.search }}{% endif %}">Última ⏭️</a>
+        <a href="/admin?antes={{ paginacion.ultimo_id }}&page={{ paginacion.pagina_siguiente }}&{{ paginacion.filtros_url }}">Siguiente ➡️</a>
+        <a href="/admin?ultima=1&{{ paginacion.filtros_url }}">Última ⏭️</a>
     {% else %}
         <span class="disabled">Siguiente ➡️</span>
         <span class="disabled">Última ⏭️</span>
@@ -380,10 +419,373 @@ HTML_ADMIN = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=
 
 <div class="grid-totales"><div class="total-item" style="background:linear-gradient(135deg,#D32F2F,#FF5252);">Bs. {{ totales.bs }}</div><div class="total-item" style="background:linear-gradient(135deg,#f3ba2f,#fdd835); color:#000;">$ {{ totales.usd }}</div><div class="total-item" style="background:linear-gradient(135deg,#007A33,#2E7D32);">{{ totales.cop }} COP</div></div></div></body></html>'''
 
+HTML_REPORTES = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1">''' + CSS_LINK + '''</head><body><div class="container"><div class="nav-header"><h2>Reportes de Recaudación</h2><div style="display:flex; gap:10px; flex-wrap:wrap;"><a href="/admin" class="btn btn-light">⬅️ Panel</a><a href="/admin/reportes?{{ filtros_url }}&formato=json" class="btn btn-light">{ } JSON</a><a href="/logout" class="btn btn-danger">🚪 Salir</a></div></div>
+
+<div class="card" style="padding:15px;">
+    <form method="GET" action="/admin/reportes" class="search-form" style="flex-wrap:wrap;">
+        <input type="date" name="desde" value="{{ desde }}" title="Desde" style="flex:1; min-width:140px;" required>
+        <input type="date" name="hasta" value="{{ hasta }}" title="Hasta" style="flex:1; min-width:140px;" required>
+        <select name="agrupar" style="flex:1; min-width:120px;">
+            <option value="dia" {% if agrupar == 'dia' %}selected{% endif %}>Por día</option>
+            <option value="hora" {% if agrupar == 'hora' %}selected{% endif %}>Por hora</option>
+        </select>
+        <input type="text" name="banco" value="{{ banco }}" placeholder="Banco (opcional)" style="flex:1; min-width:140px;">
+        <button type="submit" class="btn btn-primary">Consultar</button>
+    </form>
+    {% if error %}<p class="error-msg">{{ error }}</p>{% endif %}
+</div>
+
+<div class="table-wrapper"><table><thead><tr><th>{{ 'Hora (VET)' if agrupar == 'hora' else 'Día' }}</th><th>Banco</th><th>Moneda</th><th>Pagos</th><th>Total</th><th>Canjeados</th><th>Total canjeado</th></tr></thead><tbody>
+{% for f in filas %}<tr>
+<td><small>{{ f.periodo.strftime('%d/%m/%Y %I:%M %p' if agrupar == 'hora' else '%d/%m/%Y') }}</small></td>
+<td>{% if f.banco %}<span class="badge badge-{{ f.banco|lower }}">{{ f.banco }}</span>{% else %}-{% endif %}</td>
+<td>{{ f.moneda or '-' }}</td>
+<td>{{ f.cantidad }}</td>
+<td style="font-weight:800;">{{ '{:,.2f}'.format(f.total) }}</td>
+<td>{{ f.canjeados }}</td>
+<td>{{ '{:,.2f}'.format(f.total_canjeado) }}</td>
+</tr>{% else %}
+<tr><td colspan="7" style="text-align:center; padding:40px; color:#999;">No hay pagos en el rango seleccionado</td></tr>
+{% endfor %}
+</tbody></table></div>
+
+<div class="grid-totales">{% for moneda, t in totales|dictsort %}<div class="total-item" style="background:linear-gradient(135deg,#004481,#1464A5);">{{ moneda or 's/m' }} {{ '{:,.2f}'.format(t.total) }}<br><small style="font-weight:normal;">{{ t.cantidad }} pagos · {{ t.canjeados }} canjeados ({{ '{:,.2f}'.format(t.total_canjeado) }})</small></div>{% endfor %}</div></div></body></html>'''
+
+HTML_PERFILES = '''<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1">''' + CSS_LINK + '''</head><body><div class="container"><div class="nav-header"><h2>Perfiles de Peticiones</h2><div style="display:flex; gap:10px; flex-wrap:wrap;"><a href="/admin" class="btn btn-light">⬅️ Panel</a><a href="/logout" class="btn btn-danger">🚪 Salir</a></div></div>
+
+<div class="card" style="padding:15px;">
+{% if habilitado %}
+    <p style="margin:0; color:#555;">Agregue <code>?perfil=1</code> (o la cabecera <code>X-Perfil: 1</code>) a cualquier petición con la sesión de administrador iniciada.
+    {% if muestreo %}Muestreo automático: {% for ruta, fraccion in muestreo|dictsort %}<code>{{ ruta }}</code> {{ '{:.2%}'.format(fraccion) }}{% if not loop.last %}, {% endif %}{% endfor %}.{% endif %}</p>
+{% else %}
+    <p class="error-msg" style="margin:0;">El perfilado está desactivado (PERFILES=0). Los perfiles guardados siguen disponibles.</p>
+{% endif %}
+</div>
+
+<div class="table-wrapper"><table><thead><tr><th>Fecha</th><th>Petición</th><th>Código</th><th>Duración</th><th>Muestras</th><th>SQL</th><th>Archivos</th></tr></thead><tbody>
+{% for p in perfiles %}<tr>
+<td><small>{{ p.fecha }}</small><br><small style="color:#999;">{{ p.motivo }}</small></td>
+<td><b>{{ p.metodo }}</b> <small>{{ p.url }}</small></td>
+<td>{{ p.codigo }}</td>
+<td style="font-weight:800;">{{ p.ms }} ms</td>
+<td>{{ p.muestras }}</td>
+<td>{% if p.sql %}<details><summary>{{ p.sql|length }} en {{ p.sql_ms }} ms</summary><table>{% for s in p.sql %}<tr><td>{{ s.ms }} ms</td><td><small><code>{{ s.sql }}</code></small></td></tr>{% endfor %}</table>{% if p.sql_omitidas %}<small>(+{{ p.sql_omitidas }} no registradas)</small>{% endif %}</details>{% else %}-{% endif %}</td>
+<td><a href="/admin/perfiles/{{ p.id }}.svg" target="_blank">SVG</a> · <a href="/admin/perfiles/{{ p.id }}.txt">pilas</a> · <a href="/admin/perfiles/{{ p.id }}.json">JSON</a></td>
+</tr>{% else %}
+<tr><td colspan="7" style="text-align:center; padding:40px; color:#999;">No hay perfiles guardados</td></tr>
+{% endfor %}
+</tbody></table></div></div></body></html>'''
+
+# --- CONSULTAS DEL PANEL ---
+# Sin búsqueda, a partir de este número de filas se usa la estimación de pg_class en vez de COUNT(*)
+CONTEO_APROXIMADO_DESDE = int(os.getenv("ADMIN_CONTEO_APROXIMADO_DESDE", "100000"))
+# Sin búsqueda, leer conteo y totales de pagos_totales (requiere migrate_totales.py)
+TOTALES_MATERIALIZADOS = os.getenv("ADMIN_TOTALES_MATERIALIZADOS", "1") == "1"
+
+def sql_panel(filtro_sql, modo):
+    """
+    SQL de consultar_panel: resumen (conteo y totales) más la página, en una sola sentencia.
+    
+    Parámetros en orden: resumen, filtro del resumen, filtro de la página,
+    id límite (modos "antes"/"despues") y LIMIT.
+    
+    Returns:
+        tuple: (sql, parámetros fijos del resumen)
+    """
+    condiciones = [f"({filtro_sql})"] if filtro_sql else []
+    if modo == "antes":
+        condiciones.append("id < %s")
+    elif modo == "despues":
+        condiciones.append("id > %s")
+    
+    where_resumen = f"WHERE {filtro_sql}" if filtro_sql else ""
+    where_pagina = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    orden = "ASC" if modo in ("despues", "ultima") else "DESC"
+    
+    if filtro_sql:
+        resumen_sql = f"""
+            SELECT COUNT(*) AS total, FALSE AS aproximado,
+                   COALESCE(SUM(monto_num) FILTER (WHERE moneda = 'VES'), 0) AS bs,
+                   COALESCE(SUM(monto_num) FILTER (WHERE moneda = 'USD'), 0) AS usd,
+                   COALESCE(SUM(monto_num) FILTER (WHERE moneda = 'COP'), 0) AS cop
+            FROM pagos {where_resumen}
+        """
+        resumen_params = ()
+    elif TOTALES_MATERIALIZADOS:
+        # Totales mantenidos por triggers (migrate_totales.py): exactos y sin recorrer pagos
+        resumen_sql = """
+            SELECT COALESCE(SUM(cantidad), 0) AS total, FALSE AS aproximado,
+                   COALESCE(SUM(total) FILTER (WHERE moneda = 'VES'), 0) AS bs,
+                   COALESCE(SUM(total) FILTER (WHERE moneda = 'USD'), 0) AS usd,
+                   COALESCE(SUM(total) FILTER (WHERE moneda = 'COP'), 0) AS cop
+            FROM pagos_totales
+        """
+        resumen_params = ()
+    else:
+        # Tabla grande: solo la estimación de pg_class, sin totales (sumarlos recorrería toda la tabla).
+        # La condición sin columnas es un filtro de una sola vez: si es falsa, pagos ni se lee
+        resumen_sql = """
+            SELECT filas AS total, TRUE AS aproximado, NULL::numeric AS bs, NULL::numeric AS usd, NULL::numeric AS cop
+            FROM estimado WHERE filas >= %s
+            UNION ALL
+            SELECT COUNT(*), FALSE,
+                   COALESCE(SUM(monto_num) FILTER (WHERE moneda = 'VES'), 0),
+                   COALESCE(SUM(monto_num) FILTER (WHERE moneda = 'USD'), 0),
+                   COALESCE(SUM(monto_num) FILTER (WHERE moneda = 'COP'), 0)
+            FROM pagos
+            WHERE (SELECT filas FROM estimado) < %s
+            HAVING (SELECT filas FROM estimado) < %s
+        """
+        resumen_params = (CONTEO_APROXIMADO_DESDE,) * 3
+    
+    sql = f"""
+        WITH estimado AS (
+            SELECT GREATEST(reltuples, 0)::bigint AS filas FROM pg_class WHERE oid = 'pagos'::regclass
+        ),
+        resumen AS ({resumen_sql})
+        SELECT r.total, r.aproximado, r.bs, r.usd, r.cop,
+               p.id, p.fecha_recepcion, p.hora_recepcion, p.emisor, p.monto, p.referencia, 
+               p.mensaje_completo, p.fecha_canje, p.estado, p.comanda, p.banco, p.ip_canje 
+        FROM resumen r
+        LEFT JOIN LATERAL (
+            SELECT id, fecha_recepcion, hora_recepcion, emisor, monto, referencia, 
+                   mensaje_completo, fecha_canje, estado, comanda, banco, ip_canje 
+            FROM pagos 
+            {where_pagina}
+            ORDER BY id {orden} 
+            LIMIT %s
+        ) p ON TRUE
+        ORDER BY p.id DESC
+    """
+    return sql, resumen_params
+
+# Sin búsqueda el SQL solo depende del modo de paginación: una sentencia preparada por modo
+MODOS_PANEL = {None: "panel_primera", "antes": "panel_antes", "despues": "panel_despues", "ultima": "panel_ultima"}
+for _modo, _nombre in MODOS_PANEL.items():
+    consultas.registrar(_nombre, sql_panel("", _modo)[0], "Conteo, totales y página de /admin sin búsqueda")
+
+def consultar_panel(cur, filtro_sql, filtro_params, per_page, cursor=None):
+    """
+    Obtiene total de registros, totales por moneda y la página actual en un solo viaje a la BD.
+    
+    La página se pagina por id (keyset), sin OFFSET:
+        None               -> primera página (ids más recientes)
+        ("antes", id)      -> página siguiente: ids menores que id
+        ("despues", id)    -> página anterior: ids mayores que id
+        ("ultima", None)   -> última página (ids más antiguos)
+    
+    Sin búsqueda se usa la sentencia preparada del modo (consultas.py); con
+    búsqueda el SQL cambia con el filtro y se envía completo.
+    
+    Returns:
+        tuple: (total_registros, aproximado, totales formateados, filas de la página, hay_mas)
+            hay_mas indica si quedan filas más allá de la página en la dirección recorrida
+    """
+    modo, limite = cursor or (None, None)
+    sql, resumen_params = sql_panel(filtro_sql, modo)
+    limite_params = (limite,) if modo in ("antes", "despues") else ()
+    params = resumen_params + filtro_params + filtro_params + limite_params + (per_page + 1,)
+    
+    if filtro_sql:
+        with metricas.medir(metricas.BD_CONSULTA.labels("panel_busqueda")):
+            cur.execute(sql, params)
+    else:
+        consultas.ejecutar(cur, MODOS_PANEL[modo], params)
+    filas = cur.fetchall()
+    
+    total_registros, aproximado, t_bs, t_usd, t_cop = filas[0][:5]
+    pagos = [fila[5:] for fila in filas if fila[5] is not None]
+    
+    # Se pidió una fila extra para saber si hay más en la dirección recorrida
+    hay_mas = len(pagos) > per_page
+    if hay_mas:
+        pagos = pagos[1:] if modo in ("despues", "ultima") else pagos[:-1]
+    
+    # Última página: solo el resto (total % per_page), para que sus registros y los de las
+    # páginas a las que se vuelve desde ella coincidan con los contados desde la primera
+    if modo == "ultima" and not aproximado:
+        resto = (total_registros or 0) % per_page or per_page
+        if len(pagos) > resto:
+            pagos, hay_mas = pagos[-resto:], True
+    
+    # Con conteo estimado no hay totales (ver sql_panel)
+    totales = {
+        "bs": f"{t_bs:,.2f}" if t_bs is not None else "—",
+        "usd": f"{t_usd:,.2f}" if t_usd is not None else "—",
+        "cop": f"{t_cop:,.0f}" if t_cop is not None else "—",
+    }
+    return total_registros or 0, bool(aproximado), totales, pagos, hay_mas
+
+# --- INGESTA DEL WEBHOOK ---
+# Un arreglo por columna: la sentencia es la misma para 1 o 200 filas y se puede preparar
+consultas.registrar("webhook_insertar", """
+    INSERT INTO pagos 
+    (fecha_recepcion, hora_recepcion, emisor, monto, monto_num, moneda, referencia, mensaje_completo, banco, estado)
+    SELECT fecha, hora, emisor, monto, monto_num, moneda, referencia, mensaje, banco, 'LIBRE'
+    FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::numeric[], %s::text[], %s::text[], %s::text[], %s::text[])
+         WITH ORDINALITY AS t(fecha, hora, emisor, monto, monto_num, moneda, referencia, mensaje, banco, n)
+    ORDER BY n
+    ON CONFLICT (referencia) DO NOTHING
+    RETURNING referencia, id
+""", "INSERT por lotes del webhook")
+
+def insertar_pagos_webhook(cur, filas):
+    """
+    Inserta los pagos detectados con un solo INSERT ... ON CONFLICT ... RETURNING.
+    
+    Args:
+        cur: Cursor de PostgreSQL (el llamador hace commit)
+        filas (list): Tuplas (fecha, hora, emisor, monto, monto_num, moneda, referencia, mensaje, banco)
+    
+    Returns:
+        list: Un resultado por fila, en el mismo orden:
+        {"referencia", "banco", "resultado": "insertado" | "duplicado", "id"}
+    """
+    columnas = [list(columna) for columna in zip(*filas)]
+    insertadas = consultas.ejecutar(cur, "webhook_insertar", columnas).fetchall()
+    
+    # Una referencia repetida dentro del mismo lote solo se inserta una vez: la primera es la nueva
+    ids_nuevos = dict(insertadas)
+    resultados = []
+    for fila in filas:
+        referencia, banco = fila[6], fila[8]
+        id_pago = ids_nuevos.pop(referencia, None)
+        resultados.append({
+            "referencia": referencia,
+            "banco": banco,
+            "resultado": "insertado" if id_pago else "duplicado",
+            "id": id_pago
+        })
+    return resultados
+
+def guardar_lote_webhook(mensajes):
+    """
+    Extrae los pagos de un lote de mensajes y los guarda en una sola sentencia.
+    
+    Args:
+        mensajes (list): [(texto, recibido_en epoch), ...]
+    
+    Returns:
+        list: Resultado de cada pago detectado (ver insertar_pagos_webhook)
+    
+    Lanza excepción si el lote no se guardó.
+    """
+    filas = []
+    for texto, recibido_en in mensajes:
+        recibido_vet = datetime.fromtimestamp(recibido_en, VET)
+        for p in extractor_inteligente(texto):
+            filas.append((
+                recibido_vet.strftime("%d/%m/%Y"),
+                recibido_vet.strftime("%I:%M %p"),
+                p['emisor'][:50],  # Limitar longitud
+                p['monto'],
+                p['monto_num'],
+                p['moneda'],
+                p['referencia'],
+                p['original'][:500],  # Limitar texto almacenado
+                p['banco']
+            ))
+    
+    if not filas:
+        return []
+    
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        resultados = insertar_pagos_webhook(cur, filas)
+        conn.commit()
+    
+    for r in resultados:
+        metricas.WEBHOOK_PAGOS.labels(r['banco'], r['resultado']).inc()
+    duplicados = [r['referencia'] for r in resultados if r['resultado'] == "duplicado"]
+    logger.info(
+        f"Webhook: {len(resultados) - len(duplicados)} pagos insertados, "
+        f"{len(duplicados)} duplicados, de {len(mensajes)} mensajes"
+    )
+    if duplicados:
+        logger.info(f"Webhook: referencias ya registradas: {', '.join(duplicados)}")
+    return resultados
+
+# Cola durable del webhook (WEBHOOK_COLA=0 para guardar en línea, sin cola)
+if os.getenv("WEBHOOK_COLA", "1") == "1":
+    cola_webhook = ColaWebhook(
+        ruta=os.getenv("WEBHOOK_COLA_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cola_webhook.db")),
+        tamano_lote=int(os.getenv("WEBHOOK_COLA_LOTE", "200")),
+        intervalo=float(os.getenv("WEBHOOK_COLA_INTERVALO", "0.5"))
+    )
+else:
+    cola_webhook = None
+
+def iniciar_consumidor_webhook():
+    """Arranca el consumidor de la cola en este proceso (idempotente)"""
+    if cola_webhook is not None:
+        cola_webhook.iniciar_consumidor(
+            guardar_lote_webhook,
+            errores_transitorios=(psycopg2.OperationalError, psycopg2.InterfaceError, db_pool.PoolAgotadoError)
+        )
+
+# --- PLANTILLAS PRECOMPILADAS ---
+# Se compilan una sola vez al iniciar; render_template_string volvía a compilar el HTML en cada petición
+PLANTILLA_PORTAL = app.jinja_env.from_string(HTML_PORTAL)
+PLANTILLA_LOGIN = app.jinja_env.from_string(HTML_LOGIN)
+PLANTILLA_ADMIN = app.jinja_env.from_string(HTML_ADMIN)
+PLANTILLA_VALIDAR_BDV = app.jinja_env.from_string(HTML_VALIDAR_BDV)
+PLANTILLA_REPORTES = app.jinja_env.from_string(HTML_REPORTES)
+PLANTILLA_PERFILES = app.jinja_env.from_string(HTML_PERFILES)
+
+def renderizar(plantilla, **contexto):
+    """Renderiza una plantilla precompilada con el mismo contexto que render_template_string (session, request, url_for)"""
+    app.update_template_context(contexto)
+    return plantilla.render(contexto)
+
+# --- COMPRESIÓN DE RESPUESTAS ---
+COMPRESION_MINIMA = 1024  # Bytes; por debajo no compensa
+TIPOS_COMPRIMIBLES = ("text/html", "text/css", "text/csv", "application/json")
+
+@app.after_request
+def comprimir_respuesta(response):
+    """Gzip para HTML/JSON/CSV cuando el cliente lo acepta (no aplica a respuestas en streaming)"""
+    if (os.getenv("COMPRESION", "1") != "1"
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in TIPOS_COMPRIMIBLES):
+        return response
+    
+    response.vary.add("Accept-Encoding")
+    if "gzip" not in request.headers.get("Accept-Encoding", ""):
+        return response
+    
+    datos = response.get_data()
+    if len(datos) < COMPRESION_MINIMA:
+        return response
+    
+    response.set_data(gzip.compress(datos, 6))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
 # --- RUTAS ---
 @app.route('/')
 def index():
-    return render_template_string(HTML_PORTAL)
+    return renderizar(PLANTILLA_PORTAL)
+
+@app.route('/estilos.<huella>.css')
+@limiter.exempt
+def estilos(huella):
+    """Hoja de estilos compartida; la URL cambia con el contenido, así que se cachea por un año"""
+    if huella != ESTILOS_HUELLA:
+        return redirect(f"/estilos.{ESTILOS_HUELLA}.css", code=301)
+    
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = Response(ESTILOS_GZIP, mimetype="text/css")
+        response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(f"{ESTILOS_HUELLA}-gz")
+    else:
+        response = Response(ESTILOS, mimetype="text/css")
+        response.set_etag(ESTILOS_HUELLA)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response.make_conditional(request)
 
 @app.route('/login', methods=['GET', 'POST'])
 @limiter.limit("5 per minute")
@@ -401,9 +803,9 @@ def login():
             return redirect(url_for('admin'))
         else:
             logger.warning(f"Intento de login fallido desde {obtener_ip_real()}")
-            return render_template_string(HTML_LOGIN, error="PIN incorrecto")
+            return renderizar(PLANTILLA_LOGIN, error="PIN incorrecto")
     
-    return render_template_string(HTML_LOGIN)
+    return renderizar(PLANTILLA_LOGIN)
 
 @app.route('/admin')
 def admin():
@@ -416,6 +818,9 @@ def admin():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         search = request.args.get('search', '', type=str).strip()
+        antes = request.args.get('antes', type=int)
+        despues = request.args.get('despues', type=int)
+        ultima = request.args.get('ultima', '') == '1'
         
         # Validar parámetros
         if page < 1:
@@ -423,89 +828,47 @@ def admin():
         if per_page not in [25, 50, 100, 200]:
             per_page = 50
         
-        offset = (page - 1) * per_page
+        # Cursor de paginación (keyset por id)
+        if ultima:
+            cursor = ("ultima", None)
+        elif despues is not None:
+            cursor = ("despues", despues)
+        elif antes is not None:
+            cursor = ("antes", antes)
+        else:
+            cursor = None
+            page = 1
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Búsqueda indexada (texto libre o prefijos ref:, comanda:, banco:, monto:)
+        filtro_sql, filtro_params = construir_filtro(search)
         
-        # Construir query con búsqueda
-        if search:
-            # Búsqueda en múltiples campos
-            search_pattern = f"%{search}%"
-            
-            # Contar total de registros con búsqueda
-            cur.execute("""
-                SELECT COUNT(*) FROM pagos 
-                WHERE referencia ILIKE %s 
-                   OR comanda ILIKE %s 
-                   OR emisor ILIKE %s 
-                   OR banco ILIKE %s
-                   OR monto::text ILIKE %s
-            """, (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-            total_registros = cur.fetchone()[0]
-            total_paginas = (total_registros + per_page - 1) // per_page if total_registros > 0 else 1
-            
-            # Obtener registros filtrados
-            cur.execute("""
-                SELECT id, fecha_recepcion, hora_recepcion, emisor, monto, referencia, 
-                       mensaje_completo, fecha_canje, estado, comanda, banco, ip_canje 
-                FROM pagos 
-                WHERE referencia ILIKE %s 
-                   OR comanda ILIKE %s 
-                   OR emisor ILIKE %s 
-                   OR banco ILIKE %s
-                   OR monto::text ILIKE %s
-                ORDER BY id DESC 
-                LIMIT %s OFFSET %s
-            """, (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern, per_page, offset))
-            pagos = cur.fetchall()
-        else:
-            # Sin búsqueda - query normal
-            cur.execute("SELECT COUNT(*) FROM pagos")
-            total_registros = cur.fetchone()[0]
-            total_paginas = (total_registros + per_page - 1) // per_page if total_registros > 0 else 1
-            
-            cur.execute("""
-                SELECT id, fecha_recepcion, hora_recepcion, emisor, monto, referencia, 
-                       mensaje_completo, fecha_canje, estado, comanda, banco, ip_canje 
-                FROM pagos 
-                ORDER BY id DESC 
-                LIMIT %s OFFSET %s
-            """, (per_page, offset))
-            pagos = cur.fetchall()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            total_registros, aproximado, totales, pagos, hay_mas = consultar_panel(
+                cur, filtro_sql, filtro_params, per_page, cursor
+            )
         
-        # Calcular totales (de todos los registros, no solo la página actual)
-        if search:
-            # Totales solo de los registros filtrados
-            cur.execute("""
-                SELECT monto, banco FROM pagos 
-                WHERE referencia ILIKE %s 
-                   OR comanda ILIKE %s 
-                   OR emisor ILIKE %s 
-                   OR banco ILIKE %s
-                   OR monto::text ILIKE %s
-            """, (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-        else:
-            # Totales de todos los registros
-            cur.execute("SELECT monto, banco FROM pagos")
+        total_paginas = (total_registros + per_page - 1) // per_page if total_registros > 0 else 1
         
-        todos_pagos = cur.fetchall()
+        modo = cursor[0] if cursor else None
+        tiene_anterior = hay_mas if modo in ("despues", "ultima") else modo == "antes"
+        tiene_siguiente = hay_mas if modo in (None, "antes") else modo == "despues"
+        if modo == "ultima":
+            page = total_paginas
+        elif not tiene_anterior:
+            page = 1
         
-        t_bs, t_usd, t_cop = 0.0, 0.0, 0.0
-        for p in todos_pagos:
-            try:
-                m, b = str(p[0]), p[1]
-                val = float(m.replace('.', '').replace(',', '.')) if ',' in m else float(m)
-                if b == 'BINANCE':
-                    t_usd += val
-                elif b in ['NEQUI', 'BANCOLOMBIA']:
-                    t_cop += val
-                else:
-                    t_bs += val
-            except:
-                continue
+        filtros_url = {"per_page": per_page}
+        if search:
+            filtros_url["search"] = search
         
-        totales = {"bs": f"{t_bs:,.2f}", "usd": f"{t_usd:,.2f}", "cop": f"{t_cop:,.0f}"}
+        if not pagos:
+            inicio_registro = 0
+        elif modo == "ultima":
+            # La última página son los registros más antiguos: se cuenta desde el final
+            inicio_registro = max(total_registros - len(pagos) + 1, 1)
+        else:
+            inicio_registro = (page - 1) * per_page + 1
         
         # Información de paginación
         paginacion = {
@@ -513,31 +876,38 @@ def admin():
             "per_page": per_page,
             "total_registros": total_registros,
             "total_paginas": total_paginas,
-            "tiene_anterior": page > 1,
-            "tiene_siguiente": page < total_paginas,
-            "pagina_anterior": page - 1,
+            "aproximado": aproximado,
+            "tiene_anterior": tiene_anterior,
+            "tiene_siguiente": tiene_siguiente,
+            "pagina_anterior": max(page - 1, 1),
             "pagina_siguiente": page + 1,
-            "inicio_registro": offset + 1 if total_registros > 0 else 0,
-            "fin_registro": min(offset + per_page, total_registros),
+            "primer_id": pagos[0][0] if pagos else None,
+            "ultimo_id": pagos[-1][0] if pagos else None,
+            "inicio_registro": inicio_registro,
+            "fin_registro": inicio_registro + len(pagos) - 1 if pagos else 0,
+            "filtros_url": urlencode(filtros_url),
             "search": search  # Pasar el término de búsqueda al template
         }
         
-        conn.close()
-        return render_template_string(HTML_ADMIN, pagos=pagos, totales=totales, paginacion=paginacion)
+        return renderizar(PLANTILLA_ADMIN, pagos=pagos, totales=totales, paginacion=paginacion)
     
     except Exception as e:
         logger.error(f"Error en admin: {e}")
-        return render_template_string(HTML_ADMIN, pagos=[], totales={"bs": "0.00", "usd": "0.00", "cop": "0"}, paginacion={
+        return renderizar(PLANTILLA_ADMIN, pagos=[], totales={"bs": "0.00", "usd": "0.00", "cop": "0"}, paginacion={
             "page": 1,
             "per_page": 50,
             "total_registros": 0,
             "total_paginas": 1,
+            "aproximado": False,
             "tiene_anterior": False,
             "tiene_siguiente": False,
-            "pagina_anterior": 0,
+            "pagina_anterior": 1,
             "pagina_siguiente": 2,
+            "primer_id": None,
+            "ultimo_id": None,
             "inicio_registro": 0,
             "fin_registro": 0,
+            "filtros_url": "per_page=50",
             "search": ""
         })
 
@@ -548,7 +918,7 @@ def validar_bdv_form():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
-    return render_template_string(HTML_VALIDAR_BDV)
+    return renderizar(PLANTILLA_VALIDAR_BDV)
 
 
 @app.route('/verificar', methods=['POST'])
@@ -565,7 +935,7 @@ def verificar():
             "mensaje": "El número de referencia debe tener mínimo 6 caracteres.",
             "clase": "error"
         }
-        return render_template_string(HTML_PORTAL, resultado=res)
+        return renderizar(PLANTILLA_PORTAL, resultado=res)
     
     if not validar_comanda(com_ingresada):
         res = {
@@ -573,86 +943,137 @@ def verificar():
             "mensaje": "El número de comanda no es válido.",
             "clase": "error"
         }
-        return render_template_string(HTML_PORTAL, resultado=res)
+        return renderizar(PLANTILLA_PORTAL, resultado=res)
     
     user_ip = obtener_ip_real()
     fecha_accion = datetime.now(VET).strftime("%d/%m/%Y %I:%M %p")
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Buscar por referencia completa o por los últimos 6 dígitos
-        if len(ref) == 6 and ref.isdigit():
-            # Búsqueda por últimos 6 dígitos
-            cur.execute(
-                "SELECT id, estado, banco, monto, referencia, cedula_pagador, telefono_pagador, fecha_pago FROM pagos WHERE referencia LIKE %s",
-                ('%' + ref,)
-            )
-        else:
-            # Búsqueda por referencia completa
-            cur.execute(
-                "SELECT id, estado, banco, monto, referencia, cedula_pagador, telefono_pagador, fecha_pago FROM pagos WHERE referencia = %s",
-                (ref,)
-            )
-        
-        pagos_encontrados = cur.fetchall()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            # Búsqueda y canje en una sola sentencia: solo canjea si el pago sigue LIBRE
+            encontrados, pago, canjeado = canjear_pago(cur, ref, com_ingresada, fecha_accion, user_ip)
+            conn.commit()
         
         # Validar resultados
-        if not pagos_encontrados:
+        if not encontrados:
             res = {"titulo": "ERROR", "mensaje": "Referencia no encontrada en el sistema.", "clase": "error"}
-        elif len(pagos_encontrados) > 1:
+        elif encontrados > 1:
             res = {
                 "titulo": "REFERENCIA AMBIGUA",
-                "mensaje": f"Se encontraron {len(pagos_encontrados)} pagos con esos últimos dígitos. Por favor ingresa la referencia completa.",
+                "mensaje": f"Se encontraron {encontrados} pagos con esos últimos dígitos. Por favor ingresa la referencia completa.",
                 "clase": "error"
             }
-        else:
-            pago = pagos_encontrados[0]
-            pago_id, estado, banco, monto, referencia_completa, cedula, telefono, fecha_pago = pago
-            
-            if estado == 'LIBRE':
-                # Canjear el pago
-                cur.execute("""
-                    UPDATE pagos 
-                    SET estado = 'CANJEADO', comanda = %s, fecha_canje = %s, ip_canje = %s 
-                    WHERE id = %s
-                """, (com_ingresada, fecha_accion, user_ip, pago_id))
-                conn.commit()
-                
-                res = {
-                    "titulo": "PAGO VALIDADO",
-                    "mensaje": "Comprobante vinculado exitosamente.",
-                    "clase": "success",
-                    "datos": {
-                        "banco": banco,
-                        "monto": monto,
-                        "ref": referencia_completa,
-                        "comanda": com_ingresada,
-                        "fecha": fecha_accion,
-                        "ip": user_ip
-                    }
-                }
-                logger.info(f"Pago canjeado: {ref} - Comanda: {com_ingresada}")
-            else:
-                res = {
-                    "titulo": "PAGO YA USADO",
-                    "mensaje": "Esta referencia ya fue canjeada anteriormente.",
-                    "clase": "error"
+        elif canjeado:
+            pago_id, banco, monto, referencia_completa = pago
+            res = {
+                "titulo": "PAGO VALIDADO",
+                "mensaje": "Comprobante vinculado exitosamente.",
+                "clase": "success",
+                "datos": {
+                    "banco": banco,
+                    "monto": monto,
+                    "ref": referencia_completa,
+                    "comanda": com_ingresada,
+                    "fecha": fecha_accion,
+                    "ip": user_ip
                 }
+            }
+            logger.info(f"Pago canjeado: {ref} - Comanda: {com_ingresada}")
+        else:
+            res = {
+                "titulo": "PAGO YA USADO",
+                "mensaje": "Esta referencia ya fue canjeada anteriormente.",
+                "clase": "error"
+            }
         
-        conn.close()
-        return render_template_string(HTML_PORTAL, resultado=res)
+        return renderizar(PLANTILLA_PORTAL, resultado=res)
     
     except Exception as e:
         logger.error(f"Error en verificar: {e}")
-        return render_template_string(HTML_PORTAL, resultado={
+        return renderizar(PLANTILLA_PORTAL, resultado={
             "titulo": "ERROR",
             "mensaje": "Error procesando la solicitud",
             "clase": "error"
         }), 500
 
 
+# Máximo de referencias por petición a /api/v1/verificar
+MAX_CANJES_LOTE = 20
+
+@app.route('/api/v1/verificar', methods=['POST'])
+@limiter.limit("30 per minute")
+def api_verificar():
+    """
+    Canje para terminales POS (JSON).
+    
+    Acepta {"ref", "comanda"}, {"pagos": [{"ref", "comanda"}, ...]} o la lista directa.
+    Todas las referencias se buscan y canjean en una sola sentencia y transacción;
+    la respuesta trae el resultado de cada una, en el mismo orden.
+    """
+    datos = request.get_json(silent=True)
+    if isinstance(datos, dict):
+        items = datos.get('pagos', [datos])
+    else:
+        items = datos
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'Se espera {"ref", "comanda"} o {"pagos": [...]}'}), 400
+    if len(items) > MAX_CANJES_LOTE:
+        return jsonify({'success': False, 'message': f'Máximo {MAX_CANJES_LOTE} referencias por petición'}), 400
+    
+    resultados = []
+    pedidos = []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        ref = str(item.get('ref', '')).strip()
+        comanda = str(item.get('comanda', '')).strip()
+        resultado = {"ref": ref, "comanda": comanda}
+        
+        if not validar_referencia(ref):
+            resultado.update(resultado="invalido", mensaje="Referencia inválida (6 a 20 caracteres alfanuméricos)")
+        elif not validar_comanda(comanda):
+            resultado.update(resultado="invalido", mensaje="Comanda inválida")
+        else:
+            pedidos.append((len(resultados), ref, comanda))
+        resultados.append(resultado)
+    
+    user_ip = obtener_ip_real()
+    fecha_accion = datetime.now(VET).strftime("%d/%m/%Y %I:%M %p")
+    
+    if pedidos:
+        try:
+            with get_db_connection() as conn:
+                cur = conn.cursor()
+                canjes = canjear_lote(cur, [(ref, comanda) for _, ref, comanda in pedidos], fecha_accion, user_ip)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error en api_verificar: {e}")
+            return jsonify({'success': False, 'message': 'Error procesando la solicitud'}), 500
+        
+        for (posicion, ref, comanda), (encontrados, pago, canjeado) in zip(pedidos, canjes):
+            resultado = resultados[posicion]
+            if not encontrados:
+                resultado.update(resultado="no_encontrado", mensaje="Referencia no encontrada en el sistema.")
+            elif encontrados > 1:
+                resultado.update(resultado="ambiguo", mensaje=f"{encontrados} pagos coinciden; envíe la referencia completa.")
+            else:
+                _, banco, monto, referencia_completa = pago
+                resultado.update(banco=banco, monto=monto, referencia=referencia_completa)
+                if canjeado:
+                    resultado.update(resultado="canjeado", fecha=fecha_accion)
+                    logger.info(f"Pago canjeado (API): {ref} - Comanda: {comanda}")
+                else:
+                    resultado.update(resultado="ya_canjeado", mensaje="Esta referencia ya fue canjeada anteriormente.")
+    
+    canjeados = sum(1 for r in resultados if r["resultado"] == "canjeado")
+    return jsonify({
+        'success': canjeados == len(resultados),
+        'canjeados': canjeados,
+        'resultados': resultados
+    })
+
+
 @app.route('/validar-pago-bdv', methods=['POST'])
 @limiter.limit("10 per minute")
 def validar_pago_bdv_route():
@@ -762,15 +1183,14 @@ def liberar():
         return redirect(url_for('admin'))
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE pagos 
-            SET estado = 'LIBRE', comanda = NULL, fecha_canje = NULL, ip_canje = NULL 
-            WHERE referencia = %s
-        """, (ref,))
-        conn.commit()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE pagos 
+                SET estado = 'LIBRE', comanda = NULL, fecha_canje = NULL, ip_canje = NULL 
+                WHERE referencia = %s
+            """, (ref,))
+            conn.commit()
         logger.info(f"Pago liberado: {ref}")
     except Exception as e:
         logger.error(f"Error al liberar pago: {e}")
@@ -795,48 +1215,258 @@ def eliminar():
         return redirect(url_for('admin'))
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM pagos WHERE referencia = %s", (ref,))
-        conn.commit()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM pagos WHERE referencia = %s", (ref,))
+            conn.commit()
         logger.info(f"Pago eliminado: {ref}")
     except Exception as e:
         logger.error(f"Error al eliminar pago: {e}")
     
     return redirect(url_for('admin'))
 
+@app.route('/admin/bancos/recargar', methods=['POST'])
+def recargar_bancos():
+    """Recargar reglas de bancos desde bancos.json sin reiniciar (requiere PIN)
+    
+    Recarga el worker que atiende la petición; los demás detectan el cambio del
+    archivo en los siguientes BANCOS_RECARGA_SEGUNDOS.
+    """
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    
+    pw = request.form.get('pw', '').strip()
+    stored_hash = os.getenv("ADMIN_PASSWORD_HASH")
+    
+    if not stored_hash or not check_password_hash(stored_hash, pw):
+        logger.warning(f"Intento de recargar bancos con PIN incorrecto desde {obtener_ip_real()}")
+        return jsonify({'success': False, 'message': 'PIN incorrecto'}), 403
+    
+    try:
+        recargar_motor(forzar=True)
+        return jsonify({'success': True, 'bancos': obtener_bancos()})
+    except ReglasBancoError as e:
+        logger.error(f"Reglas de bancos inválidas: {e}")
+        return jsonify({'success': False, 'message': str(e), 'bancos': obtener_bancos()}), 400
+
+@app.route('/admin/consultas')
+def estadisticas_consultas():
+    """Sentencias preparadas registradas y su uso en este worker (requiere autenticación)"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'preparar': consultas.PREPARAR,
+        'consultas': consultas.estadisticas()
+    })
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Métricas de Prometheus de todos los workers (sesión de admin o Authorization: Bearer METRICAS_TOKEN)"""
+    token = os.getenv("METRICAS_TOKEN", "")
+    autorizacion = request.headers.get("Authorization", "")
+    if not session.get('logged_in') and not (
+        token and hmac.compare_digest(autorizacion.encode(), f"Bearer {token}".encode())
+    ):
+        return Response("No autorizado\n", status=401, mimetype="text/plain",
+                        headers={"WWW-Authenticate": "Bearer"})
+
+    datos, tipo = metricas.exponer()
+    return Response(datos, content_type=tipo)
+
 @app.route('/admin/exportar')
 def exportar():
-    """Exportar datos a Excel (requiere autenticación)"""
+    """Exportar datos a Excel/CSV sin límite de filas (requiere autenticación)
+    
+    Parámetros opcionales: formato=xlsx|csv|tsv, desde=YYYY-MM-DD, hasta=YYYY-MM-DD (días VET), banco=BDV
+    
+    En Excel, si las filas no caben en una hoja se reparten en varias ("Pagos 2", ...)
+    y la respuesta lo indica en la cabecera X-Exportacion-Hojas.
+    """
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
-    try:
-        conn = get_db_connection()
-        df = pd.read_sql("SELECT * FROM pagos ORDER BY id DESC LIMIT 5000", conn)
-        conn.close()
+    formato = request.args.get('formato', 'xlsx').strip().lower()
+    desde = parsear_fecha(request.args.get('desde', ''))
+    hasta = parsear_fecha(request.args.get('hasta', ''))
+    banco = request.args.get('banco', '').strip()
+    filtro_sql, filtro_params = construir_filtro_exportacion(desde, hasta, banco)
+    nombre = f"reporte_sistemas_mv_{datetime.now(VET).strftime('%Y%m%d_%H%M%S')}"
+    
+    if formato in SEPARADORES:
+        def generar():
+            try:
+                with get_db_connection() as conn:
+                    yield from generar_csv(iterar_filas(conn, filtro_sql, filtro_params), formato)
+                logger.info(f"Exportación {formato.upper()} realizada")
+            except Exception as e:
+                logger.error(f"Error en exportar ({formato}): {e}")
+                raise
         
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Pagos')
+        return Response(
+            stream_with_context(generar()),
+            mimetype='text/tab-separated-values' if formato == 'tsv' else 'text/csv',
+            headers={'Content-Disposition': f'attachment; filename={nombre}.{formato}'}
+        )
+    
+    ruta = None
+    try:
+        with get_db_connection() as conn:
+            ruta, hojas = escribir_excel(iterar_filas(conn, filtro_sql, filtro_params))
         
-        out.seek(0)
+        if hojas > 1:
+            logger.warning(f"Exportación Excel repartida en {hojas} hojas (límite de {FILAS_POR_HOJA} filas por hoja)")
         logger.info("Exportación Excel realizada")
-        return send_file(
-            out,
-            as_attachment=True,
-            download_name=f"reporte_sistemas_mv_{datetime.now(VET).strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        respuesta = Response(
+            transmitir_archivo(ruta),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={
+                'Content-Disposition': f'attachment; filename={nombre}.xlsx',
+                'Content-Length': str(os.path.getsize(ruta)),
+                'X-Exportacion-Hojas': str(hojas)
+            }
         )
+        # Se borra al cerrar la respuesta, aunque el cliente se desconecte a mitad de la descarga
+        respuesta.call_on_close(lambda: borrar_archivo(ruta))
+        return respuesta
     except Exception as e:
         logger.error(f"Error en exportar: {e}")
+        if ruta:
+            borrar_archivo(ruta)
         return "Error al exportar", 500
 
+# Reportes (/admin/reportes): rango máximo y recálculo de las horas pendientes antes de leer
+REPORTES_MAX_DIAS = int(os.getenv("REPORTES_MAX_DIAS", "366"))
+REPORTES_ACTUALIZAR = os.getenv("REPORTES_ACTUALIZAR_AL_CONSULTAR", "1") == "1"
+
+@app.route('/admin/reportes')
+def reportes():
+    """Recaudación por banco, día u hora desde el resumen materializado (requiere autenticación)
+    
+    Parámetros: desde=YYYY-MM-DD, hasta=YYYY-MM-DD, agrupar=dia|hora, banco=BDV, formato=html|json
+    """
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    
+    hoy = datetime.now(VET).date()
+    desde = parsear_fecha(request.args.get('desde', '')) or hoy - timedelta(days=6)
+    hasta = parsear_fecha(request.args.get('hasta', '')) or hoy
+    agrupar = request.args.get('agrupar', 'dia').strip().lower()
+    banco = request.args.get('banco', '').strip().upper()
+    como_json = request.args.get('formato', '').strip().lower() == 'json'
+    
+    if agrupar not in AGRUPACIONES:
+        agrupar = 'dia'
+    
+    error, codigo_error = None, 400
+    if hasta < desde:
+        error = "La fecha final es anterior a la inicial"
+    elif (hasta - desde).days >= REPORTES_MAX_DIAS:
+        error = f"El rango máximo es de {REPORTES_MAX_DIAS} días"
+    
+    filas, totales = [], {}
+    if not error:
+        try:
+            with get_db_connection() as conn:
+                if REPORTES_ACTUALIZAR:
+                    with metricas.medir(metricas.BD_CONSULTA.labels("reportes_actualizar")):
+                        actualizar_resumen(conn)
+                cur = conn.cursor()
+                with metricas.medir(metricas.BD_CONSULTA.labels("reportes_consulta")):
+                    filas, totales = consultar_reporte(cur, desde, hasta, agrupar, banco or None)
+                conn.rollback()
+        except Exception as e:
+            logger.error(f"Error en reportes: {e}")
+            error, codigo_error = "No se pudo generar el reporte", 500
+    
+    if como_json:
+        if error:
+            return jsonify({'success': False, 'message': error}), codigo_error
+        return jsonify({
+            'success': True,
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'agrupar': agrupar,
+            'banco': banco or None,
+            'filas': [
+                dict(f, periodo=f['periodo'].isoformat(), total=str(f['total']), total_canjeado=str(f['total_canjeado']))
+                for f in filas
+            ],
+            'totales': {
+                moneda: dict(t, total=str(t['total']), total_canjeado=str(t['total_canjeado']))
+                for moneda, t in totales.items()
+            },
+        })
+    
+    filtros = {"desde": desde.isoformat(), "hasta": hasta.isoformat(), "agrupar": agrupar}
+    if banco:
+        filtros["banco"] = banco
+    return renderizar(
+        PLANTILLA_REPORTES, filas=filas, totales=totales, error=error, desde=desde.isoformat(),
+        hasta=hasta.isoformat(), agrupar=agrupar, banco=banco, filtros_url=urlencode(filtros)
+    )
+
+@app.route('/admin/perfiles')
+def perfiles_guardados():
+    """Perfiles de peticiones guardados (requiere autenticación), ver perfiles.py"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    return renderizar(
+        PLANTILLA_PERFILES, perfiles=perfiles.listar(), habilitado=perfiles.HABILITADO, muestreo=perfiles.MUESTREO
+    )
+
+@app.route('/admin/perfiles/<nombre>')
+def descargar_perfil(nombre):
+    """Flame graph (.svg), pilas colapsadas (.txt) o detalle con SQL (.json) de un perfil"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    if not re.fullmatch(r"[0-9]{8}-[0-9]{6}-[0-9a-f]{6}\.(svg|txt|json)", nombre):
+        return jsonify({'success': False, 'message': 'Perfil inválido'}), 404
+    return send_from_directory(perfiles.DIRECTORIO, nombre, as_attachment=nombre.endswith(".txt"))
+
+# --- DISPOSITIVOS DEL WEBHOOK ---
+def cargar_dispositivos(valor):
+    """
+    "caja1:token1,caja2:token2" -> {sha256(token): "caja1", ...}
+    
+    Se guarda el hash para no comparar tokens carácter a carácter.
+    """
+    dispositivos = {}
+    for parte in (valor or "").split(","):
+        nombre, _, token = parte.strip().partition(":")
+        if nombre and token:
+            dispositivos[hashlib.sha256(token.strip().encode()).hexdigest()] = nombre.strip()
+    return dispositivos
+
+DISPOSITIVOS_WEBHOOK = cargar_dispositivos(os.getenv("WEBHOOK_DISPOSITIVOS", ""))
+WEBHOOK_EXIGIR_DISPOSITIVO = os.getenv("WEBHOOK_EXIGIR_DISPOSITIVO", "0") == "1"
+WEBHOOK_LIMITE = os.getenv("WEBHOOK_LIMITE", "100 per hour")
+
+def dispositivo_webhook():
+    """Nombre del dispositivo según la cabecera X-Dispositivo (None si falta o no está registrado)"""
+    token = request.headers.get("X-Dispositivo", "").strip()
+    if not token:
+        return None
+    return DISPOSITIVOS_WEBHOOK.get(hashlib.sha256(token.encode()).hexdigest())
+
+def clave_webhook():
+    """Cuota del webhook por dispositivo; sin token registrado, por IP (varios teléfonos tras un NAT comparten IP)"""
+    dispositivo = dispositivo_webhook()
+    return f"dispositivo:{dispositivo}" if dispositivo else f"ip:{get_remote_address()}"
+
 @app.route('/webhook-bdv', methods=['POST'])
-@limiter.limit("100 per hour")
+@limiter.limit(WEBHOOK_LIMITE, key_func=clave_webhook)
 def webhook():
-    """Webhook para recibir pagos (con rate limiting)"""
+    """Webhook para recibir pagos (con rate limiting); encola el mensaje y responde sin esperar a la BD"""
+    if WEBHOOK_EXIGIR_DISPOSITIVO and dispositivo_webhook() is None:
+        logger.warning(f"Webhook rechazado: dispositivo sin token válido desde {obtener_ip_real()}")
+        return "No autorizado", 401
+    
     try:
         # Validar que sea JSON o texto
         raw_data = request.get_json(silent=True)
@@ -850,45 +1480,19 @@ def webhook():
             logger.warning("Webhook rechazado por tamaño excesivo")
             return "Mensaje muy grande", 400
         
-        pagos = extractor_inteligente(texto)
+        if not texto:
+            return "OK", 200
         
-        if pagos:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            ahora_vet = datetime.now(VET)
-            
-            for p in pagos:
-                try:
-                    # Verificar que no exista duplicado
-                    cur.execute(
-                        "SELECT 1 FROM pagos WHERE referencia = %s LIMIT 1",
-                        (p['referencia'],)
-                    )
-                    
-                    if not cur.fetchone():
-                        cur.execute("""
-                            INSERT INTO pagos 
-                            (fecha_recepcion, hora_recepcion, emisor, monto, referencia, mensaje_completo, estado, banco) 
-                            VALUES (%s, %s, %s, %s, %s, %s, 'LIBRE', %s)
-                        """, (
-                            ahora_vet.strftime("%d/%m/%Y"),
-                            ahora_vet.strftime("%I:%M %p"),
-                            p['emisor'][:50],  # Limitar longitud
-                            p['monto'],
-                            p['referencia'],
-                            p['original'][:500],  # Limitar texto almacenado
-                            p['banco']
-                        ))
-                        logger.info(f"Pago insertado: {p['referencia']} - {p['banco']}")
-                
-                except Exception as e:
-                    logger.error(f"Error insertando pago: {e}")
-                    continue
-            
-            conn.commit()
-            conn.close()
+        # Encolar y responder de inmediato; el consumidor guarda en PostgreSQL por lotes
+        if cola_webhook is not None:
+            try:
+                cola_webhook.encolar(texto)
+                return "OK", 200
+            except sqlite3.Error as e:
+                logger.error(f"No se pudo encolar el webhook, se procesa en línea: {e}")
         
-        return "OK", 200
+        # Sin cola: guardar en línea y reportar el resultado de cada pago
+        return jsonify({"status": "OK", "pagos": guardar_lote_webhook([(texto, time.time())])}), 200
     
     except Exception as e:
         logger.error(f"Error en webhook: {e}")
@@ -915,5 +1519,8 @@ def internal_error(e):
     logger.error(f"Error interno del servidor: {e}")
     return "Error interno del servidor", 500
 
+# El consumidor de la cola no arranca al importar: bajo gunicorn lo arranca
+# post_worker_init en cada worker (con preload_app el import ocurre en el master)
 if __name__ == '__main__':
+    iniciar_consumidor_webhook()
     app.run(host='0.0.0.0', port=5000, debug=False)  # NUNCA debug=True en producción
\ No newline at end of file
@@ -1,14 +1,26 @@
 """
 Módulo de integración con API de Conciliación BDV
-Versión: 1.0 - Producción
+Versión: 2.0 - Producción
+
+validar_pago_bdv_async / validar_lote consultan el API sin bloquear: un lote
+de N referencias tarda lo que la consulta más lenta, no la suma.
+validar_pago_bdv es el envoltorio síncrono que usan las rutas Flask.
 """
 import os
-import requests
-import psycopg2
+import asyncio
+import httpx
 from dotenv import load_dotenv
 from datetime import datetime
+import time
 import logging
 
+import db_pool
+import metricas
+from cliente_bdv import obtener_cliente, ejecutar, en_bucle, CircuitoAbiertoError
+from cache_bdv import crear_cache, clave_consulta
+from montos import normalizar_monto, FORMATO_API_BDV
+from extractor import moneda_de_banco
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,6 +28,11 @@ logger = logging.getLogger(__name__)
 # Cargar configuración
 load_dotenv()
 
+# Caché de resultados de conciliación (BDV_CACHE=lru|sqlite|0)
+_cache = crear_cache()
+
+# Plazo total de una consulta (reintentos incluidos), en segundos
+PLAZO_CONSULTA = float(os.getenv("BDV_PLAZO", "20"))
 
 def limpiar_referencia(texto):
     """Normaliza referencia eliminando caracteres especiales y ceros a la izquierda"""
@@ -26,24 +43,25 @@ def limpiar_referencia(texto):
 
 
 def obtener_conexion():
-    """Obtiene conexión a la base de datos PostgreSQL"""
-    try:
-        return psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASS'),
-            database=os.getenv('DB_NAME'),
-            port=os.getenv('DB_PORT', '5432'),
-            sslmode='require' if 'neon.tech' in (os.getenv('DB_HOST') or '') else 'prefer',
-            connect_timeout=10
-        )
-    except Exception as e:
-        logger.error(f"Error de conexión a BD: {e}")
-        raise
+    """Presta una conexión del pool compartido (usar con ``with``)"""
+    return db_pool.conexion()
 
 
 def validar_pago_bdv(referencia, banco_origen, cedula_pagador=None, telefono_pagador=None, 
-                     fecha_pago=None, importe=None):
+                     fecha_pago=None, importe=None, plazo=None):
+    """
+    Valida un pago móvil contra el API de Conciliación BDV (síncrono).
+    
+    Envoltorio de validar_pago_bdv_async: espera la consulta en el bucle del
+    cliente BDV. Mismos argumentos y mismo diccionario de resultado.
+    """
+    return ejecutar(validar_pago_bdv_async(
+        referencia, banco_origen, cedula_pagador, telefono_pagador, fecha_pago, importe, plazo
+    ))
+
+
+async def validar_pago_bdv_async(referencia, banco_origen, cedula_pagador=None, telefono_pagador=None, 
+                                 fecha_pago=None, importe=None, plazo=None):
     """
     Valida un pago móvil contra el API de Conciliación BDV.
     
@@ -54,6 +72,7 @@ def validar_pago_bdv(referencia, banco_origen, cedula_pagador=None, telefono_pag
         telefono_pagador (str): Teléfono del pagador (opcional)
         fecha_pago (str): Fecha en formato YYYY-MM-DD (opcional)
         importe (str): Monto con 2 decimales (opcional)
+        plazo (float): Segundos máximos de la consulta (por defecto BDV_PLAZO)
     
     Returns:
         dict: {
@@ -62,8 +81,12 @@ def validar_pago_bdv(referencia, banco_origen, cedula_pagador=None, telefono_pag
             'message': str,
             'amount': str (si success=True),
             'status': str (si success=True),
-            'reason': str (si success=True)
+            'reason': str (si success=True),
+            'cache': True (si el resultado vino de la caché)
         }
+    
+    Los resultados se guardan en caché (ver cache_bdv.py): los positivos por
+    BDV_CACHE_TTL_OK segundos y los rechazos o fallos por BDV_CACHE_TTL_NEGATIVO.
     """
     ambiente = os.getenv('BDV_AMBIENTE', 'produccion')
     
@@ -121,16 +144,48 @@ def validar_pago_bdv(referencia, banco_origen, cedula_pagador=None, telefono_pag
         "bancoOrigen": banco_origen
     }
     
+    async def consultar():
+        # Solo las llamadas reales al API: los aciertos de caché no llegan aquí
+        inicio = time.perf_counter()
+        resultado = await _consultar_bdv(url, payload, headers, referencia, banco_origen, importe, plazo or PLAZO_CONSULTA)
+        metricas.BDV_SEGUNDOS.labels(str(resultado.get('code'))).observe(time.perf_counter() - inicio)
+        return resultado
+    
+    # Cliente, caché y single-flight viven en el bucle del cliente BDV
+    if _cache is None:
+        return await en_bucle(consultar())
+    return await en_bucle(
+        _cache.obtener_o_consultar(clave_consulta(referencia, banco_origen, fecha_pago, importe), consultar)
+    )
+
+
+async def validar_lote(referencias, plazo=None):
+    """
+    Valida varios pagos a la vez.
+    
+    Args:
+        referencias (list): Diccionarios con los argumentos de validar_pago_bdv_async
+            ({"referencia", "banco_origen", "importe", ...}) o tuplas (referencia, banco_origen)
+        plazo (float): Segundos máximos de cada consulta
+    
+    Returns:
+        list: Un diccionario de resultado por referencia, en el mismo orden
+    """
+    consultas = []
+    for item in referencias:
+        argumentos = dict(item) if isinstance(item, dict) else dict(zip(("referencia", "banco_origen"), item))
+        argumentos.setdefault("plazo", plazo)
+        consultas.append(validar_pago_bdv_async(**argumentos))
+    return await asyncio.gather(*consultas)
+
+
+async def _consultar_bdv(url, payload, headers, referencia, banco_origen, importe, plazo):
+    """Llamada HTTP al API de conciliación (sin caché)"""
     try:
         logger.info(f"Validando pago - Ref: {referencia}, Banco: {banco_origen}")
         
-        response = requests.post(
-            url, 
-            json=payload, 
-            headers=headers, 
-            timeout=30,
-            verify=True
-        )
+        # Pool keep-alive del proceso, con timeouts de conexión/lectura, reintentos, circuito y plazo total
+        response = await obtener_cliente().post(url, plazo=plazo, json=payload, headers=headers)
         
         if response.status_code == 200:
             resultado = response.json()
@@ -165,14 +220,21 @@ def validar_pago_bdv(referencia, banco_origen, cedula_pagador=None, telefono_pag
                 'message': f"Error HTTP: {response.status_code}"
             }
             
-    except requests.exceptions.Timeout:
+    except CircuitoAbiertoError:
+        logger.warning(f"Circuito abierto, BDV no consultado - Ref: {referencia}")
+        return {
+            'success': False,
+            'code': 'CIRCUIT_OPEN',
+            'message': 'El banco no está respondiendo. Intente nuevamente en unos segundos.'
+        }
+    except (httpx.TimeoutException, asyncio.TimeoutError):
         logger.error(f"Timeout - Ref: {referencia}")
         return {
             'success': False,
             'code': 'TIMEOUT',
             'message': 'Tiempo de espera agotado. Intente nuevamente.'
         }
-    except requests.exceptions.ConnectionError as e:
+    except httpx.TransportError as e:
         logger.error(f"Error de conexión - Ref: {referencia}: {e}")
         return {
             'success': False,
@@ -204,16 +266,15 @@ def registrar_pago_validado(cedula, telefono, referencia, monto, banco_origen, d
         bool: True si se registró exitosamente, False en caso contrario
     """
     try:
-        conexion = obtener_conexion()
-        
-        with conexion.cursor() as cursor:
+        with obtener_conexion() as conexion, conexion.cursor() as cursor:
             ref_limpia = limpiar_referencia(referencia)
+            banco = 'BDV' if banco_origen == '0102' else banco_origen
             
             sql = """
                 INSERT INTO pagos 
-                (cedula_pagador, telefono_pagador, referencia, monto, banco_origen, 
+                (cedula_pagador, telefono_pagador, referencia, monto, monto_num, moneda, banco_origen, 
                  estado_bdv, fecha_validacion, fecha_registro, estado, banco) 
-                VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW(), 'LIBRE', %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW(), 'LIBRE', %s)
                 ON CONFLICT (referencia) DO NOTHING
                 RETURNING id
             """
@@ -223,9 +284,11 @@ def registrar_pago_validado(cedula, telefono, referencia, monto, banco_origen, d
                 telefono, 
                 ref_limpia, 
                 monto, 
+                normalizar_monto(monto, FORMATO_API_BDV),
+                moneda_de_banco(banco),
                 banco_origen,
                 datos_bdv.get('status', '1000'),
-                'BDV' if banco_origen == '0102' else banco_origen
+                banco
             ))
             
             resultado = cursor.fetchone()
@@ -241,9 +304,6 @@ def registrar_pago_validado(cedula, telefono, referencia, monto, banco_origen, d
     except Exception as e:
         logger.error(f"❌ Error al registrar pago - Ref: {referencia}: {e}")
         return False
-    finally:
-        if 'conexion' in locals():
-            conexion.close()
 
 
 # Ejemplo de uso (solo para pruebas)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las sentencias registradas en consultas.py contra un PostgreSQL local
+Ejecución: python benchmarks/bench_consultas.py [--iteraciones 2000] [--solo canje_lote] [--listar]
+
+Ejecuta cada sentencia registrada (canje, INSERT del webhook, panel de
+/admin) ``--iteraciones`` veces de dos formas sobre la misma conexión:
+
+    sql completo   cur.execute(sql, params): parse + plan en cada ejecución
+    preparada      consultas.ejecutar(): PREPARE una vez, luego EXECUTE
+
+y reporta microsegundos por ejecución (reloj) y CPU del proceso Python por
+ejecución. La diferencia entre ambos relojes, con la BD local, es casi toda
+CPU de PostgreSQL (análisis y planificación).
+
+Cada iteración se revierte: el canje usa referencias inexistentes y los
+INSERT del webhook (referencias BENCH...) no se confirman.
+Usa DB_HOST/DB_NAME/DB_USER/DB_PASS del .env y requiere la tabla pagos.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from decimal import Decimal
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import consultas  # noqa: E402
+import app  # noqa: E402,F401  (registra las sentencias del webhook y del panel)
+from db_pool import ConexionPool, parametros_conexion  # noqa: E402
+
+
+def parametros_ejemplo():
+    """Parámetros representativos de cada sentencia registrada"""
+    refs = [str(random.randint(10**11, 10**12 - 1)) for _ in range(3)] + ["987654"]
+    filas = [
+        ("01/01/2026", "12:00 PM", "04141234567", "1.234,56", Decimal("1234.56"), "VES",
+         f"BENCH{random.randint(10**9, 10**10 - 1)}", "bench_consultas", "BDV")
+        for _ in range(20)
+    ]
+    return {
+        "canje_lote": (
+            list(range(len(refs))), refs, ["C1"] * len(refs), refs, ["987654"],
+            "01/01/2026 12:00 PM", "127.0.0.1",
+        ),
+        "webhook_insertar": [list(columna) for columna in zip(*filas)],
+        "panel_primera": (51,),
+        "panel_antes": (10**9, 51),
+        "panel_despues": (0, 51),
+        "panel_ultima": (51,),
+    }
+
+
+def medir(conn, ejecutar, iteraciones):
+    """Devuelve (µs de reloj, µs de CPU del proceso) por ejecución"""
+    cur = conn.cursor()
+    ejecutar(cur)  # Calentar: la primera preparada incluye el PREPARE
+    cur.fetchall()
+    conn.rollback()
+
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    for _ in range(iteraciones):
+        ejecutar(cur)
+        cur.fetchall()
+        conn.rollback()
+    reloj = (time.perf_counter() - inicio) / iteraciones * 1e6
+    cpu = (time.process_time() - inicio_cpu) / iteraciones * 1e6
+    cur.close()
+    return reloj, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL completo frente a sentencias preparadas")
+    parser.add_argument("--iteraciones", type=int, default=2000)
+    parser.add_argument("--solo", help="Medir solo esta sentencia")
+    parser.add_argument("--listar", action="store_true", help="Mostrar el registro y salir")
+    args = parser.parse_args()
+
+    if args.listar:
+        for c in consultas.REGISTRO.values():
+            print(f"{c.nombre:18s} {c.parametros} parámetros  {c.descripcion}")
+        return
+
+    ejemplos = parametros_ejemplo()
+    nombres = [args.solo] if args.solo else [n for n in consultas.REGISTRO if n in ejemplos]
+
+    conn = psycopg2.connect(connection_factory=ConexionPool, **parametros_conexion())
+    print(f"{'sentencia':18s} {'sql µs':>9s} {'prep µs':>9s} {'mejora':>7s}   {'CPU py sql':>10s} {'CPU py prep':>11s}")
+    try:
+        for nombre in nombres:
+            consulta, params = consultas.REGISTRO[nombre], ejemplos[nombre]
+            sql, cpu_sql = medir(conn, lambda cur: cur.execute(consulta.sql, params), args.iteraciones)
+            prep, cpu_prep = medir(conn, lambda cur: consultas.ejecutar(cur, nombre, params), args.iteraciones)
+            print(f"{nombre:18s} {sql:9.1f} {prep:9.1f} {sql / prep:6.2f}x   {cpu_sql:10.1f} {cpu_prep:11.1f}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del extractor de notificaciones
+Ejecución: python benchmarks/bench_extractor.py [repeticiones]
+
+Compara el extractor anterior (patrones en texto, re.search por campo) con
+el motor precompilado de extractor.py (reglas de bancos.json) sobre el corpus,
+verifica que ambos extraen exactamente lo mismo y reporta mensajes/segundo.
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractor import extraer_candidatos  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus_notificaciones.txt")
+
+
+def extractor_anterior(texto):
+    """Extractor v16 (sin validaciones): dict de patrones reconstruido y 4 re.search por banco"""
+    patrones = {
+        "BDV": (r"BDV|PagomovilBDV", r"(?:del|tlf|desde el tlf)\s*(\d+)", r"(?:por|Bs\.?|Monto:)\s*([\d.]+,\d{2})", r"Ref:\s*(\d+)"),
+        "BANESCO": (r"Banesco", r"(?:de|desde|tlf)\s*(\d+)", r"(?:Bs\.?|Monto:?)\s*([\d.]+,\d{2})", r"Ref:\s*(\d+)"),
+        "SOFITASA": (r"SOFITASA", r"Telf\.?([\d*]+)", r"Bs\.?\s*([\d,.]+)", r"Ref[:\s]*(\d+)"),
+        "BINANCE": (r"Binance", r"(?:from|de)\s+(.*?)\s", r"([\d.]+)\s*USDT", r"(?:ID|Order)[:\s]+(\d+)"),
+        "PLAZA": (r"Plaza", r"Celular\s+([\d]+)", r"(?:BS\.?|por)\s*([\d,.]+)", r"Ref[\.:]\s*(\d+)")
+    }
+    candidatos = []
+    for banco, (key, re_emi, re_mon, re_ref) in patrones.items():
+        if re.search(key, texto, re.IGNORECASE):
+            m_emi = re.search(re_emi, texto, re.IGNORECASE)
+            m_mon = re.search(re_mon, texto, re.IGNORECASE)
+            m_ref = re.search(re_ref, texto, re.IGNORECASE)
+            candidatos.append({
+                "emisor": m_emi.group(1) if m_emi else None,
+                "monto": m_mon.group(1) if m_mon else None,
+                "referencia": m_ref.group(1) if m_ref else None,
+                "banco": banco,
+            })
+    return candidatos
+
+
+def cargar_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [l.strip() for l in f if l.strip() and not l.startswith("#")]
+
+
+def medir(funcion, mensajes, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for texto in mensajes:
+            funcion(texto)
+    duracion = time.perf_counter() - inicio
+    return repeticiones * len(mensajes) / duracion
+
+
+if __name__ == "__main__":
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    mensajes = cargar_corpus()
+
+    # Verificar equivalencia antes de medir
+    for texto in mensajes:
+        esperado = extractor_anterior(texto)
+        obtenido = [{k: c[k] for k in ("emisor", "monto", "referencia", "banco")} for c in extraer_candidatos(texto)]
+        if esperado != obtenido:
+            print(f"❌ Diferencia en: {texto}\n   anterior: {esperado}\n   nuevo:    {obtenido}")
+            sys.exit(1)
+    print(f"✅ {len(mensajes)} mensajes: ambos extractores producen el mismo resultado\n")
+
+    antes = medir(extractor_anterior, mensajes, repeticiones)
+    despues = medir(extraer_candidatos, mensajes, repeticiones)
+
+    print(f"Extractor anterior:     {antes:>12,.0f} mensajes/s")
+    print(f"Motor precompilado:     {despues:>12,.0f} mensajes/s")
+    print(f"Mejora:                 {despues / antes:>12.2f}x")
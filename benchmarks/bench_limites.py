@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Latencia y exactitud del almacenamiento SQLite de Flask-Limiter (limites_sqlite.py)
+Ejecución: python benchmarks/bench_limites.py [--procesos 4] [--peticiones 5000] [--limite 100]
+
+1. Latencia: cada proceso hace --peticiones comprobaciones (sliding-window-counter)
+   sobre claves distintas, todos a la vez contra el mismo archivo; reporta
+   p50/p99/máx en microsegundos.
+2. Exactitud: todos los procesos golpean la misma clave con "--limite per hour";
+   entre todos deben aceptar exactamente --limite (con memoria serían
+   --limite x --procesos).
+3. Borde de ventana: con un reloj simulado, la misma secuencia de golpes que
+   cruza de una ventana a la siguiente contra limits.MemoryStorage (la
+   referencia) y contra SQLite; en cada paso deben aceptar lo mismo.
+
+No requiere PostgreSQL; usa un archivo temporal.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limits import parse  # noqa: E402
+from limits.storage import MemoryStorage, storage_from_string  # noqa: E402
+from limits.strategies import SlidingWindowCounterRateLimiter  # noqa: E402
+
+import limites_sqlite  # noqa: E402,F401
+
+
+def latencias(uri, proceso, peticiones, salida):
+    limitador = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    limite = parse("1000000 per hour")
+    tiempos = []
+    for n in range(peticiones):
+        inicio = time.perf_counter()
+        limitador.hit(limite, "bench", f"{proceso}:{n % 50}")
+        tiempos.append(time.perf_counter() - inicio)
+    salida.put(tiempos)
+
+
+def aceptadas(uri, peticiones, limite_texto, salida):
+    limitador = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    limite = parse(limite_texto)
+    salida.put(sum(limitador.hit(limite, "bench", "compartida") for _ in range(peticiones)))
+
+
+# (segundo dentro de la prueba, golpes): 6 al final de la ventana, luego el cruce
+PASOS_BORDE = ((59, 6), (60.5, 10), (75, 10), (119.9, 10), (150, 10), (240, 10))
+
+
+def aceptadas_por_paso(almacen, reloj, inicio, limite):
+    limitador = SlidingWindowCounterRateLimiter(almacen)
+    item = parse(f"{limite} per minute")
+    resultado = []
+    for segundo, golpes in PASOS_BORDE:
+        reloj[0] = inicio + segundo
+        resultado.append(sum(limitador.hit(item, "bench", "borde") for _ in range(golpes)))
+    return resultado
+
+
+def borde_de_ventana(uri, limite=10):
+    """Aceptadas en cada paso de PASOS_BORDE: (MemoryStorage, SQLite)"""
+    reloj = [0.0]
+    inicio = (int(time.time()) // 60 + 1) * 60  # Inicio exacto de una ventana de 60 s
+    with mock.patch("time.time", lambda: reloj[0]):
+        memoria = MemoryStorage("memory://")
+        try:
+            referencia = aceptadas_por_paso(memoria, reloj, inicio, limite)
+        finally:
+            memoria.timer.cancel()
+        sqlite = aceptadas_por_paso(storage_from_string(uri), reloj, inicio, limite)
+    return referencia, sqlite
+
+
+def ejecutar(objetivo, procesos, argumentos):
+    salida = multiprocessing.Queue()
+    hijos = [multiprocessing.Process(target=objetivo, args=argumentos(i) + (salida,)) for i in range(procesos)]
+    for hijo in hijos:
+        hijo.start()
+    resultados = [salida.get() for _ in hijos]
+    for hijo in hijos:
+        hijo.join()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacenamiento SQLite de límites compartido entre procesos")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--peticiones", type=int, default=5000)
+    parser.add_argument("--limite", type=int, default=100)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench_limites_")
+    uri = f"sqlite:///{directorio}/limites.db"
+    try:
+        tiempos = sorted(t for lista in ejecutar(
+            latencias, args.procesos, lambda i: (uri, i, args.peticiones)
+        ) for t in lista)
+        p = lambda q: tiempos[min(len(tiempos) - 1, int(len(tiempos) * q))] * 1e6  # noqa: E731
+        print(f"{args.procesos} procesos x {args.peticiones} comprobaciones")
+        print(f"  p50 {p(0.50):7.1f} µs   p99 {p(0.99):7.1f} µs   máx {tiempos[-1] * 1e6:7.1f} µs")
+
+        total = sum(ejecutar(
+            aceptadas, args.procesos, lambda i: (uri, args.limite * 2, f"{args.limite} per hour")
+        ))
+        estado = "✅" if total == args.limite else "❌"
+        print(f"  {estado} aceptadas entre todos los procesos: {total} (límite {args.limite})")
+
+        referencia, sqlite = borde_de_ventana(f"sqlite:///{directorio}/borde.db")
+        estado = "✅" if referencia == sqlite else "❌"
+        print(f"  {estado} cruce de ventana (10 per minute): memoria {referencia}, SQLite {sqlite}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Costo por petición de la instrumentación de metricas.py
+Ejecución: python benchmarks/bench_metricas.py [--peticiones 100000] [--multiproceso]
+
+Ejecuta en bucle, dentro de un contexto de petición de Flask, los
+before/after_request que añade ``metricas.instrumentar`` y reporta
+microsegundos por petición. También mide una observación suelta de
+histograma (lo que añade cada consulta, la espera del pool o el extractor)
+y el tiempo de generar /metrics.
+
+--multiproceso usa un PROMETHEUS_MULTIPROC_DIR temporal, como bajo
+gunicorn: cada valor se escribe en un archivo mmap en vez de en memoria.
+No requiere PostgreSQL.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def medir_ganchos(peticiones):
+    """µs por petición de los before/after_request de metricas.instrumentar"""
+    from flask import Flask, Response
+    import metricas
+
+    app = Flask("bench_metricas")
+    metricas.instrumentar(app)
+
+    @app.route("/ping/<int:n>")
+    def ping(n):
+        return "ok"
+
+    antes = app.before_request_funcs[None]
+    despues = app.after_request_funcs[None]
+    respuesta = Response("ok")
+    with app.test_request_context("/ping/1"):
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            for gancho in antes:
+                gancho()
+            for gancho in despues:
+                gancho(respuesta)
+        return (time.perf_counter() - inicio) / peticiones * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo de las métricas de Prometheus por petición")
+    parser.add_argument("--peticiones", type=int, default=100000)
+    parser.add_argument("--multiproceso", action="store_true", help="Valores en archivos mmap, como bajo gunicorn")
+    args = parser.parse_args()
+
+    directorio = None
+    if args.multiproceso:
+        # Debe definirse antes de importar prometheus_client
+        directorio = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="bench_metricas_")
+    try:
+        import metricas
+
+        ganchos = medir_ganchos(args.peticiones)
+
+        histograma = metricas.BD_CONSULTA.labels("bench")
+        inicio = time.perf_counter()
+        for _ in range(args.peticiones):
+            histograma.observe(0.001)
+        observacion = (time.perf_counter() - inicio) / args.peticiones * 1e6
+
+        modo = "multiproceso (mmap)" if directorio else "un proceso"
+        print(f"Modo: {modo}, {args.peticiones} peticiones")
+        print(f"  costo por petición  {ganchos:8.2f} µs (histograma + contador HTTP)")
+        print(f"  observe() suelto    {observacion:8.2f} µs")
+
+        inicio = time.perf_counter()
+        datos, _ = metricas.exponer()
+        print(f"  /metrics            {(time.perf_counter() - inicio) * 1000:8.1f} ms ({len(datos)} bytes)")
+    finally:
+        if directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de extremo a extremo: gunicorn + PostgreSQL temporal + stub BDV
+Ejecución: python benchmarks/carga.py [--duracion 60] [--usuarios 20] [--comparar resultados/anterior.json]
+
+Levanta todo en local y lo desmonta al terminar:
+
+1. Un PostgreSQL desechable (initdb en un directorio temporal) con el
+   esquema creado por los scripts del repositorio (create table.py y
+   migrate_*.py) y --semilla pagos LIBRE repartidos en los últimos 30 días.
+2. El stub del API de Conciliación BDV (stub_bdv.py) con --latencia-bdv
+   y --tasa-error-bdv.
+3. Una copia de la aplicación (--repo, por defecto este repositorio) bajo
+   gunicorn con gunicorn.conf.py. Se copia para que su .env sea el de la
+   prueba y no el del repositorio (app.py carga .env con override).
+
+Luego --usuarios hilos reparten peticiones según --mezcla durante
+--duracion segundos (tras --calentamiento segundos que no se miden):
+
+    webhook     POST /webhook-bdv con notificaciones del corpus (referencias nuevas)
+    verificar   POST /verificar del portal (referencia completa o últimos 6 dígitos)
+    api         POST /api/v1/verificar con dos referencias
+    admin       GET /admin (primera página, páginas siguientes y búsquedas)
+    reportes    GET /admin/reportes en JSON
+    bdv         POST /validar-pago-bdv (consulta al stub)
+
+Reporta peticiones/s, errores y p50/p95/p99 por ruta y guarda un JSON en
+benchmarks/resultados/. Con --comparar se contrasta con un resultado
+anterior y el código de salida es 1 si el p95 de alguna ruta empeora más
+de --tolerancia.
+
+Requiere los binarios de PostgreSQL (initdb, pg_ctl; --pg-bin si no están
+en el PATH) y gunicorn. Para comparar versiones:
+
+    git worktree add /tmp/notipagos-anterior <commit>
+    python benchmarks/carga.py --repo /tmp/notipagos-anterior --etiqueta anterior
+    python benchmarks/carga.py --comparar benchmarks/resultados/carga-anterior-....json
+"""
+import os
+import re
+import sys
+import json
+import glob
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import httpx
+import psycopg2
+from cryptography.fernet import Fernet
+from werkzeug.security import generate_password_hash
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DIRECTORIO)
+
+from stub_bdv import iniciar_stub  # noqa: E402
+
+RAIZ = os.path.dirname(DIRECTORIO)
+CORPUS = os.path.join(DIRECTORIO, "corpus_notificaciones.txt")
+RESULTADOS = os.path.join(DIRECTORIO, "resultados")
+
+# Scripts de esquema, en el orden del README; los que no existan en --repo se omiten
+SCRIPTS_ESQUEMA = [
+    "create table.py", "migrate_bdv.py", "migrate_montos.py", "migrate_referencias.py",
+    "migrate_busqueda.py", "migrate_totales.py", "migrate_reportes.py",
+]
+
+PIN = "4321"
+MEZCLA = "webhook=45,verificar=25,api=10,admin=12,reportes=3,bdv=5"
+BANCOS = ["BDV", "BANESCO", "SOFITASA", "PLAZA", "BINANCE"]
+REF_SEMILLA = 900000000000  # Referencias sembradas: REF_SEMILLA + i
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))]
+
+
+# --- INFRAESTRUCTURA ---
+class PostgresTemporal:
+    """Servidor PostgreSQL desechable en un directorio temporal (trust, solo 127.0.0.1)"""
+
+    def __init__(self, directorio, puerto, bin_dir=None):
+        self.datos = os.path.join(directorio, "pgdata")
+        self.puerto = puerto
+        self.bin_dir = bin_dir
+        self.usuario = "carga"
+        self.base = "notipagos"
+
+    def _bin(self, nombre):
+        if self.bin_dir:
+            return os.path.join(self.bin_dir, nombre)
+        ruta = shutil.which(nombre) or next(iter(sorted(glob.glob(f"/usr/lib/postgresql/*/bin/{nombre}"))[-1:]), None)
+        if not ruta:
+            raise RuntimeError(f"No se encontró {nombre}; indique el directorio con --pg-bin")
+        return ruta
+
+    def iniciar(self):
+        subprocess.run([self._bin("initdb"), "-D", self.datos, "-U", self.usuario, "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([
+            self._bin("pg_ctl"), "-D", self.datos, "-l", os.path.join(self.datos, "postgres.log"), "-w",
+            "-o", f"-p {self.puerto} -c listen_addresses=127.0.0.1 -k {self.datos} -c max_connections=300",
+            "start",
+        ], check=True, stdout=subprocess.DEVNULL)
+        conn = psycopg2.connect(host="127.0.0.1", port=self.puerto, user=self.usuario, dbname="postgres")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {self.base}")
+        conn.close()
+
+    def conectar(self):
+        return psycopg2.connect(host="127.0.0.1", port=self.puerto, user=self.usuario, dbname=self.base)
+
+    def detener(self):
+        subprocess.run([self._bin("pg_ctl"), "-D", self.datos, "-m", "fast", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def copiar_app(origen, destino, variables):
+    """Copia los módulos de la aplicación y escribe su .env"""
+    os.makedirs(destino)
+    for ruta in glob.glob(os.path.join(origen, "*.py")) + glob.glob(os.path.join(origen, "*.json")):
+        shutil.copy(ruta, destino)
+    with open(os.path.join(destino, ".env"), "w") as f:
+        for clave, valor in variables.items():
+            f.write(f"{clave}='{valor}'\n")
+
+
+def entorno_aislado(**extra):
+    """Entorno de los subprocesos sin variables de la aplicación heredadas del shell (DB_HOST de producción, etc.)"""
+    prefijos = ("DB_", "BDV_", "WEBHOOK_", "ADMIN_", "GUNICORN_", "REPORTES_", "RATELIMIT_", "PROMETHEUS_", "METRICAS_")
+    entorno = {k: v for k, v in os.environ.items() if not k.startswith(prefijos)}
+    entorno.update({k: str(v) for k, v in extra.items()})
+    return entorno
+
+
+def crear_esquema(app_dir):
+    for script in SCRIPTS_ESQUEMA:
+        if not os.path.exists(os.path.join(app_dir, script)):
+            continue
+        proceso = subprocess.run([sys.executable, script], cwd=app_dir, env=entorno_aislado(),
+                                 capture_output=True, text=True)
+        if proceso.returncode != 0:
+            raise RuntimeError(f"{script} falló:\n{proceso.stdout[-2000:]}{proceso.stderr[-2000:]}")
+        print(f"  ✅ {script}")
+
+
+def sembrar(conn, cantidad):
+    """Pagos LIBRE con referencias conocidas, repartidos en los últimos 30 días"""
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'pagos'")
+        columnas = {fila[0] for fila in cur.fetchall()}
+        extra_cols = ", monto_num, moneda" if "monto_num" in columnas else ""
+        extra_vals = ", round((random() * 5000)::numeric, 2), 'VES'" if extra_cols else ""
+        cur.execute(f"""
+            INSERT INTO pagos (fecha_recepcion, hora_recepcion, emisor, monto, referencia, mensaje_completo,
+                               estado, banco, created_at{extra_cols})
+            SELECT to_char(ts, 'DD/MM/YYYY'), to_char(ts, 'HH12:MI AM'), '0414' || lpad(i::text, 7, '0'),
+                   '1.234,56', (%s + i)::text, 'semilla carga', 'LIBRE', (%s::text[])[1 + i %% 5], ts{extra_vals}
+            FROM (
+                SELECT i, now() - random() * interval '30 days' AS ts FROM generate_series(1, %s) AS i
+            ) t
+        """, (REF_SEMILLA, BANCOS, cantidad))
+        cur.execute("ANALYZE pagos")
+
+
+def esperar_http(url, plazo=30):
+    limite = time.monotonic() + plazo
+    while time.monotonic() < limite:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {plazo}s")
+
+
+# --- ESCENARIOS ---
+class Escenarios:
+    """Peticiones de cada tipo; cada una devuelve (ruta, respuesta)"""
+
+    def __init__(self, semilla):
+        with open(CORPUS, encoding="utf-8") as f:
+            self.notificaciones = [l.strip() for l in f if l.strip() and not l.startswith("#")]
+        self.semilla = semilla
+
+    def _ref_semilla(self):
+        return str(REF_SEMILLA + random.randint(1, self.semilla))
+
+    def webhook(self, cliente):
+        # Misma notificación del corpus con una referencia nueva (mismo largo)
+        texto = re.sub(r"(Ref[\.:]?\s*|ID[:\s]+|Order[:\s]+)(\d+)",
+                       lambda m: m.group(1) + "".join(random.choices("0123456789", k=len(m.group(2)))),
+                       random.choice(self.notificaciones), count=1)
+        return "POST /webhook-bdv", cliente.post("/webhook-bdv", json={"mensaje": texto})
+
+    def verificar(self, cliente):
+        ref = self._ref_semilla()
+        if random.random() < 0.3:
+            ref = ref[-6:]
+        return "POST /verificar", cliente.post("/verificar", data={"ref": ref, "comanda": str(random.randint(1, 9999))})
+
+    def api(self, cliente):
+        comanda = str(random.randint(1, 9999))
+        pagos = [{"ref": self._ref_semilla(), "comanda": comanda} for _ in range(2)]
+        return "POST /api/v1/verificar", cliente.post("/api/v1/verificar", json={"pagos": pagos})
+
+    def admin(self, cliente):
+        azar = random.random()
+        if azar < 0.6:
+            params = {}
+        elif azar < 0.9:
+            params = {"antes": random.randint(100, self.semilla), "page": 2}
+        else:
+            params = {"search": random.choice(["banco:BDV", f"ref:{self._ref_semilla()[-6:]}", "monto:1.234,56"])}
+        return "GET /admin", cliente.get("/admin", params=params)
+
+    def reportes(self, cliente):
+        params = {"formato": "json", "agrupar": random.choice(["dia", "hora"])}
+        return "GET /admin/reportes", cliente.get("/admin/reportes", params=params)
+
+    def bdv(self, cliente):
+        datos = {"referencia": str(random.randint(10**11, 10**12 - 1)), "banco": "0102", "importe": "150.00"}
+        return "POST /validar-pago-bdv", cliente.post("/validar-pago-bdv", data=datos)
+
+
+def usuario(base_url, escenarios, tipos, pesos, inicio_medicion, fin, registros):
+    """Un hilo: inicia sesión y lanza peticiones hasta ``fin``"""
+    with httpx.Client(base_url=base_url, timeout=30, follow_redirects=False) as cliente:
+        cliente.post("/login", data={"password": PIN})
+        while time.monotonic() < fin:
+            tipo = random.choices(tipos, pesos)[0]
+            inicio = time.monotonic()
+            try:
+                ruta, respuesta = getattr(escenarios, tipo)(cliente)
+                error = respuesta.status_code >= 400 or (tipo in ("admin", "reportes") and respuesta.status_code != 200)
+                estado = respuesta.status_code
+            except httpx.HTTPError as e:
+                ruta, error, estado = tipo, True, type(e).__name__
+            if inicio >= inicio_medicion:
+                registros.append((ruta, time.monotonic() - inicio, error, estado))
+
+
+def resumir(registros, duracion):
+    """Peticiones/s, errores y percentiles (ms) por ruta y en total"""
+    por_ruta = {}
+    for ruta, segundos, error, estado in registros:
+        por_ruta.setdefault(ruta, []).append((segundos, error, estado))
+
+    def estadisticas(filas):
+        tiempos = sorted(s * 1000 for s, _, _ in filas)
+        estados = {}
+        for _, _, estado in filas:
+            estados[str(estado)] = estados.get(str(estado), 0) + 1
+        return {
+            "peticiones": len(filas),
+            "errores": sum(1 for _, error, _ in filas if error),
+            "rps": round(len(filas) / duracion, 2),
+            "p50_ms": round(percentil(tiempos, 50), 2),
+            "p95_ms": round(percentil(tiempos, 95), 2),
+            "p99_ms": round(percentil(tiempos, 99), 2),
+            "max_ms": round(tiempos[-1], 2),
+            "media_ms": round(sum(tiempos) / len(tiempos), 2),
+            "estados": estados,
+        }
+
+    rutas = {ruta: estadisticas(filas) for ruta, filas in sorted(por_ruta.items())}
+    total = estadisticas([(s, e, st) for _, s, e, st in registros]) if registros else {}
+    return rutas, total
+
+
+def imprimir(rutas, total):
+    print(f"\n{'ruta':26s} {'pet':>7s} {'err':>5s} {'rps':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s}  (ms)")
+    for ruta, r in list(rutas.items()) + [("TOTAL", total)]:
+        if r:
+            print(f"{ruta:26s} {r['peticiones']:7d} {r['errores']:5d} {r['rps']:8.1f} "
+                  f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f}")
+
+
+def comparar(actual, anterior, tolerancia):
+    """Imprime p95 y rps contra un resultado anterior; devuelve las rutas con regresión"""
+    print(f"\nComparación con {anterior['etiqueta']} ({anterior['fecha']}):")
+    print(f"{'ruta':26s} {'p95 antes':>10s} {'p95 ahora':>10s} {'cambio':>8s} {'rps antes':>10s} {'rps ahora':>10s}")
+    regresiones = []
+    for ruta, r in actual["rutas"].items():
+        previo = anterior["rutas"].get(ruta)
+        if not previo:
+            print(f"{ruta:26s} {'-':>10s} {r['p95_ms']:10.1f}")
+            continue
+        cambio = (r["p95_ms"] - previo["p95_ms"]) / previo["p95_ms"] if previo["p95_ms"] else 0
+        marca = "❌" if cambio > tolerancia else "✅"
+        if cambio > tolerancia:
+            regresiones.append(ruta)
+        print(f"{ruta:26s} {previo['p95_ms']:10.1f} {r['p95_ms']:10.1f} {cambio:+7.0%} "
+              f"{previo['rps']:10.1f} {r['rps']:10.1f} {marca}")
+    return regresiones
+
+
+def version_repo(repo):
+    try:
+        return subprocess.run(["git", "-C", repo, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con gunicorn, PostgreSQL temporal y stub BDV")
+    parser.add_argument("--repo", default=RAIZ, help="Copia de la aplicación a medir")
+    parser.add_argument("--duracion", type=float, default=60, help="Segundos medidos")
+    parser.add_argument("--calentamiento", type=float, default=5, help="Segundos iniciales que no se miden")
+    parser.add_argument("--usuarios", type=int, default=20, help="Clientes simultáneos")
+    parser.add_argument("--mezcla", default=MEZCLA, help=f"Pesos por escenario (por defecto {MEZCLA})")
+    parser.add_argument("--semilla", type=int, default=20000, help="Pagos LIBRE precargados")
+    parser.add_argument("--workers", type=int, default=3, help="GUNICORN_WORKERS")
+    parser.add_argument("--threads", type=int, default=1, help="GUNICORN_THREADS")
+    parser.add_argument("--latencia-bdv", type=float, default=0.2, help="Segundos de respuesta del stub BDV")
+    parser.add_argument("--tasa-error-bdv", type=float, default=0.05, help="Proporción de HTTP 503 del stub BDV")
+    parser.add_argument("--pg-bin", help="Directorio de initdb/pg_ctl")
+    parser.add_argument("--etiqueta", help="Nombre del resultado (por defecto la versión de --repo)")
+    parser.add_argument("--salida", default=RESULTADOS, help="Directorio de los JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Aumento de p95 tolerado al comparar")
+    parser.add_argument("--conservar", action="store_true", help="No borrar el directorio temporal (logs)")
+    args = parser.parse_args()
+
+    pesos = dict((nombre, float(peso)) for nombre, peso in (p.split("=") for p in args.mezcla.split(",")))
+    desconocidos = set(pesos) - {n for n in dir(Escenarios) if not n.startswith("_")}
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    repo = os.path.abspath(args.repo)
+    version = version_repo(repo)
+    etiqueta = args.etiqueta or version
+    temporal = tempfile.mkdtemp(prefix="carga_notipagos_")
+    app_dir = os.path.join(temporal, "app")
+    puerto_pg, puerto_bdv, puerto_app = puerto_libre(), puerto_libre(), puerto_libre()
+
+    print("\n" + "="*60)
+    print(f"  PRUEBA DE CARGA: {etiqueta}")
+    print("="*60 + "\n")
+
+    postgres = PostgresTemporal(temporal, puerto_pg, args.pg_bin)
+    stub = gunicorn = None
+    try:
+        print(f"PostgreSQL temporal en el puerto {puerto_pg}...")
+        postgres.iniciar()
+
+        copiar_app(repo, app_dir, {
+            "DB_HOST": "127.0.0.1", "DB_PORT": puerto_pg, "DB_NAME": postgres.base,
+            "DB_USER": postgres.usuario, "DB_PASS": "",
+            "SECRET_KEY": os.urandom(32).hex(),
+            "ENCRYPTION_KEY": Fernet.generate_key().decode(),
+            "ADMIN_PASSWORD_HASH": generate_password_hash(PIN),
+            "BDV_API_URL": f"http://127.0.0.1:{puerto_bdv}/getMovement",
+            "BDV_API_KEY": "carga", "BDV_AMBIENTE": "produccion", "BDV_CACHE": "0",
+            "RATELIMIT_ENABLED": "0", "FLASK_ENV": "production", "DEBUG": "False",
+        })
+
+        print("\nCreando esquema con los scripts del repositorio...")
+        crear_esquema(app_dir)
+        conn = postgres.conectar()
+        sembrar(conn, args.semilla)
+        conn.close()
+        print(f"  ✅ {args.semilla} pagos sembrados")
+
+        stub = iniciar_stub(puerto_bdv, "ok", args.latencia_bdv, args.tasa_error_bdv)
+        print(f"\nStub BDV en el puerto {puerto_bdv} (latencia {args.latencia_bdv}s, "
+              f"{args.tasa_error_bdv:.0%} de HTTP 503)")
+
+        log = open(os.path.join(temporal, "gunicorn.log"), "w")
+        entorno = entorno_aislado(GUNICORN_BIND=f"127.0.0.1:{puerto_app}",
+                                  GUNICORN_WORKERS=args.workers, GUNICORN_THREADS=args.threads,
+                                  PROMETHEUS_MULTIPROC_DIR=os.path.join(temporal, "metricas"))
+        gunicorn = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                                    cwd=app_dir, env=entorno, stdout=log, stderr=log)
+        base_url = f"http://127.0.0.1:{puerto_app}"
+        esperar_http(base_url + "/")
+        print(f"gunicorn en {base_url} ({args.workers} workers x {args.threads} hilos)")
+
+        print(f"\nCarga: {args.usuarios} usuarios, {args.calentamiento:.0f}s de calentamiento + "
+              f"{args.duracion:.0f}s medidos, mezcla {args.mezcla}")
+        escenarios = Escenarios(args.semilla)
+        registros = []
+        inicio_medicion = time.monotonic() + args.calentamiento
+        fin = inicio_medicion + args.duracion
+        hilos = [
+            threading.Thread(target=usuario, args=(base_url, escenarios, list(pesos), list(pesos.values()),
+                                                   inicio_medicion, fin, registros))
+            for _ in range(args.usuarios)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        rutas, total = resumir(registros, args.duracion)
+        imprimir(rutas, total)
+
+        conn = postgres.conectar()
+        with conn.cursor() as cur:
+            cur.execute("SELECT version()")
+            version_pg = cur.fetchone()[0]
+        conn.close()
+
+        resultado = {
+            "etiqueta": etiqueta,
+            "version": version,
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar", "conservar")},
+            "entorno": {
+                "python": platform.python_version(),
+                "postgres": version_pg,
+                "cpus": os.cpu_count(),
+                "sistema": platform.platform(),
+            },
+            "rutas": rutas,
+            "total": total,
+        }
+        os.makedirs(args.salida, exist_ok=True)
+        archivo = os.path.join(args.salida, f"carga-{etiqueta}-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(archivo, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Resultado guardado en {archivo}")
+
+        if args.comparar:
+            with open(args.comparar, encoding="utf-8") as f:
+                regresiones = comparar(resultado, json.load(f), args.tolerancia)
+            if regresiones:
+                print(f"\n❌ p95 empeoró más de {args.tolerancia:.0%} en: {', '.join(regresiones)}")
+                sys.exit(1)
+
+    finally:
+        if gunicorn is not None:
+            gunicorn.terminate()
+            try:
+                gunicorn.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                gunicorn.kill()
+        if stub is not None:
+            stub.shutdown()
+        postgres.detener()
+        if args.conservar:
+            print(f"Directorio de la prueba (logs de gunicorn y PostgreSQL): {temporal}")
+        else:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Prueba de concurrencia del canje de /verificar contra un PostgreSQL local
+Ejecución: python benchmarks/stress_canje.py [--intentos 500] [--conexiones 50] [--rondas 5]
+
+Inserta un pago LIBRE de prueba y dispara ``--intentos`` canjes en paralelo
+sobre la misma referencia, cada uno en su propia transacción, desde
+``--conexiones`` conexiones simultáneas. Exactamente uno debe canjear el pago.
+
+Con --anterior se ejecuta también el flujo previo (SELECT, revisión en
+Python y UPDATE incondicional) para ver cuántos canjes dobles permite.
+
+Usa DB_HOST/DB_NAME/DB_USER/DB_PASS del .env. Los pagos de prueba
+(referencia STRESS...) se borran al terminar.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import parametros_conexion  # noqa: E402
+from canje import canjear_pago  # noqa: E402
+
+
+def canje_anterior(cur, ref, comanda, fecha_canje, ip_canje):
+    """Flujo previo de /verificar: SELECT, revisión en Python y UPDATE sin condición"""
+    cur.execute("SELECT id, estado FROM pagos WHERE referencia = %s", (ref,))
+    filas = cur.fetchall()
+    if len(filas) != 1 or filas[0][1] != 'LIBRE':
+        return len(filas), None, False
+    cur.execute("""
+        UPDATE pagos SET estado = 'CANJEADO', comanda = %s, fecha_canje = %s, ip_canje = %s
+        WHERE id = %s
+    """, (comanda, fecha_canje, ip_canje, filas[0][0]))
+    return 1, filas[0], True
+
+
+def ronda(canjear, intentos, conexiones):
+    """Un pago LIBRE, ``intentos`` canjes simultáneos; devuelve cuántos canjearon"""
+    ref = f"STRESS{random.randint(10**9, 10**10 - 1)}"
+
+    conn = psycopg2.connect(**parametros_conexion())
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO pagos (fecha_recepcion, hora_recepcion, emisor, monto, referencia, mensaje_completo, estado, banco)
+            VALUES ('01/01/2026', '12:00 PM', 'STRESS', '1,00', %s, 'stress_canje', 'LIBRE', 'BDV')
+        """, (ref,))
+
+    locales = threading.local()
+    abiertas = []
+    barrera = threading.Barrier(conexiones)
+
+    def intento(numero):
+        if not hasattr(locales, "conn"):
+            locales.conn = psycopg2.connect(**parametros_conexion())
+            abiertas.append(locales.conn)
+            barrera.wait()  # Todas las conexiones listas antes del primer canje
+        with locales.conn, locales.conn.cursor() as cur:
+            _, _, canjeado = canjear(cur, ref, f"C{numero}", "01/01/2026 12:00 PM", "127.0.0.1")
+        return canjeado
+
+    try:
+        with ThreadPoolExecutor(max_workers=conexiones) as hilos:
+            resultados = list(hilos.map(intento, range(intentos)))
+
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT estado FROM pagos WHERE referencia = %s", (ref,))
+            estado = cur.fetchone()[0]
+    finally:
+        with conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pagos WHERE referencia = %s", (ref,))
+        conn.close()
+        for c in abiertas:
+            c.close()
+
+    return sum(resultados), estado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Canjes simultáneos de una misma referencia")
+    parser.add_argument("--intentos", type=int, default=500, help="Canjes por ronda")
+    parser.add_argument("--conexiones", type=int, default=50, help="Conexiones simultáneas (< max_connections)")
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--anterior", action="store_true", help="Medir también el flujo previo")
+    args = parser.parse_args()
+    args.conexiones = min(args.conexiones, args.intentos)
+
+    flujos = [("atómico", canjear_pago)]
+    if args.anterior:
+        flujos.append(("anterior", canje_anterior))
+
+    fallos = 0
+    for nombre, canjear in flujos:
+        for numero in range(1, args.rondas + 1):
+            inicio = time.perf_counter()
+            ganadores, estado = ronda(canjear, args.intentos, args.conexiones)
+            ms = (time.perf_counter() - inicio) * 1000
+            ok = ganadores == 1 and estado == 'CANJEADO'
+            print(f"{nombre:9s} ronda {numero}: {ganadores} canjes de {args.intentos} intentos "
+                  f"({args.conexiones} conexiones, {ms:.0f} ms) {'✅' if ok else '❌'}")
+            if nombre == "atómico" and not ok:
+                fallos += 1
+
+    if fallos:
+        print(f"\n❌ {fallos} rondas con canje doble o sin canje")
+        sys.exit(1)
+    print("\n✅ Exactamente un canje por referencia en todas las rondas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita el API de Conciliación BDV (POST /getMovement)
+Ejecución: python benchmarks/stub_bdv.py [--puerto 8099] [--modo ok] [--latencia 0.05] [--tasa-error 0.05]
+
+Modos:
+    ok          code 1000 con el importe recibido
+    rechazo     code 1010 (pago no encontrado)
+    caido       HTTP 503 en todas las consultas
+    intermitente  HTTP 503 en una de cada tres consultas
+    lento       responde después de --latencia segundos (probar BDV_TIMEOUT_LECTURA)
+
+--tasa-error agrega HTTP 503 aleatorios en esa proporción de consultas (cualquier modo).
+
+Apuntar la aplicación al stub:
+    BDV_API_URL=http://127.0.0.1:8099/getMovement
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_contador = 0
+_contador_lock = threading.Lock()
+
+
+class ManejadorBDV(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como el API real
+    wbufsize = 64 * 1024  # Cabeceras y cuerpo en un solo envío (evita la espera de Nagle)
+    modo = "ok"
+    latencia = 0.0
+    tasa_error = 0.0
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+        self.wfile.flush()
+
+    def do_POST(self):
+        global _contador
+
+        largo = int(self.headers.get("Content-Length", 0))
+        consulta = json.loads(self.rfile.read(largo) or b"{}")
+
+        with _contador_lock:
+            _contador += 1
+            numero = _contador
+
+        if self.latencia:
+            time.sleep(self.latencia)
+
+        if (self.modo == "caido" or (self.modo == "intermitente" and numero % 3 == 0)
+                or random.random() < self.tasa_error):
+            self._responder(503, {"message": "Service Unavailable"})
+        elif self.modo == "rechazo":
+            self._responder(200, {"code": 1010, "message": "No se encontró el movimiento", "data": None})
+        else:
+            self._responder(200, {
+                "code": 1000,
+                "message": "Transaccion realizada",
+                "data": {"status": "1000", "amount": consulta.get("importe", "0.01"), "reason": "Transaccion realizada"},
+            })
+
+
+def iniciar_stub(puerto=8099, modo="ok", latencia=0.0, tasa_error=0.0):
+    """Arranca el stub en un hilo; devuelve el servidor (llamar shutdown() al terminar)"""
+    manejador = type("Manejador", (ManejadorBDV,), {"modo": modo, "latencia": latencia, "tasa_error": tasa_error})
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub del API de Conciliación BDV")
+    parser.add_argument("--puerto", type=int, default=8099)
+    parser.add_argument("--modo", default="ok", choices=["ok", "rechazo", "caido", "intermitente", "lento"])
+    parser.add_argument("--latencia", type=float, default=0.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Proporción de HTTP 503 aleatorios (0-1)")
+    args = parser.parse_args()
+
+    latencia = args.latencia or (20.0 if args.modo == "lento" else 0.0)
+    servidor = iniciar_stub(args.puerto, args.modo, latencia, args.tasa_error)
+    print(f"Stub BDV en http://127.0.0.1:{args.puerto}/getMovement (modo {args.modo})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
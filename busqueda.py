@@ -0,0 +1,97 @@
+"""
+Búsqueda del panel administrativo
+
+Traduce el texto del buscador de /admin a una condición SQL que use índices:
+
+    ref:12345678     -> referencia exacta (o últimos 6 dígitos)
+    comanda:A-15     -> comanda exacta
+    banco:binance    -> banco exacto
+    monto:1.234,56   -> monto_num exacto
+    texto libre      -> subcadena en referencia/comanda/emisor/banco
+                        (índices GIN pg_trgm) o monto exacto si es numérico
+
+Un monto solo con puntos ("1.500", "12.50") es ambiguo: el webhook guarda
+"1.500" de un banco venezolano como 1500,00 y el API BDV "12.50" como 12,50.
+Se buscan las dos lecturas (monto_num IN (1.50, 1500.00)).
+
+Los índices se crean con migrate_busqueda.py.
+"""
+from montos import normalizar_monto
+
+
+def escapar_like(texto):
+    """Escapa los comodines de LIKE para buscar el texto literal"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _filtro_referencia(valor):
+    if len(valor) == 6 and valor.isdigit():
+        return "right(referencia, 6) = %s", (valor,)
+    return "referencia = %s", (valor,)
+
+
+def _filtro_comanda(valor):
+    return "comanda = %s", (valor,)
+
+
+def _filtro_banco(valor):
+    return "banco = %s", (valor.upper(),)
+
+
+def montos_posibles(texto):
+    """Lecturas del monto: la de formato "auto" y, si no hay coma, la venezolana (punto de miles)"""
+    lecturas = {normalizar_monto(texto)}
+    if "," not in texto:
+        lecturas.add(normalizar_monto(texto, "ve"))
+    lecturas.discard(None)
+    return tuple(sorted(lecturas))
+
+
+def _filtro_monto(valor):
+    montos = montos_posibles(valor)
+    if not montos:
+        return "FALSE", ()
+    return "monto_num IN %s", (montos,)
+
+
+FILTROS_POR_PREFIJO = {
+    "ref": _filtro_referencia,
+    "comanda": _filtro_comanda,
+    "banco": _filtro_banco,
+    "monto": _filtro_monto,
+}
+
+
+def construir_filtro(search):
+    """
+    Construye la condición SQL (sin WHERE) para un término de búsqueda.
+
+    Args:
+        search (str): Texto ingresado en el buscador (ya sin espacios extremos)
+
+    Returns:
+        tuple: (condición o "" si no hay búsqueda, parámetros)
+    """
+    if not search:
+        return "", ()
+
+    prefijo, separador, valor = search.partition(":")
+    filtro = FILTROS_POR_PREFIJO.get(prefijo.strip().lower()) if separador else None
+    if filtro and valor.strip():
+        return filtro(valor.strip())
+
+    patron = f"%{escapar_like(search)}%"
+    condiciones = [
+        "referencia ILIKE %s",
+        "comanda ILIKE %s",
+        "emisor ILIKE %s",
+        "banco ILIKE %s",
+    ]
+    params = [patron] * len(condiciones)
+
+    montos = montos_posibles(search) if any(c.isdigit() for c in search) else ()
+    if montos:
+        condiciones.append("monto_num IN %s")
+        params.append(montos)
+
+    return " OR ".join(condiciones), tuple(params)
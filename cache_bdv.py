@@ -0,0 +1,228 @@
+"""
+Caché de resultados del API de Conciliación BDV
+Versión: 1.0 - Producción
+
+Operadores y clientes consultan la misma referencia varias veces seguidas.
+Esta caché guarda el resultado de cada consulta, con clave
+(referencia, banco_origen, fecha_pago, importe):
+
+- Positivos (code 1000): BDV_CACHE_TTL_OK segundos (un pago confirmado no cambia).
+- Negativos (1010, timeouts, errores HTTP): BDV_CACHE_TTL_NEGATIVO segundos,
+  lo justo para absorber reintentos seguidos sin ocultar un pago que llega tarde.
+- Consultas simultáneas de la misma clave en un worker esperan a la primera
+  en vez de salir todas hacia el banco (single-flight sobre el bucle asyncio
+  del cliente BDV). Si la petición que la inició se cancela, la consulta
+  sigue para las que esperan.
+- Las lecturas y escrituras de SQLite corren en el executor del bucle: un
+  archivo bloqueado por otro worker no detiene las demás consultas al banco.
+
+Backends (BDV_CACHE):
+    lru      diccionario en memoria del proceso (un solo worker)
+    sqlite   archivo compartido por todos los workers (BDV_CACHE_RUTA)
+    0        sin caché
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Resultados que no dependen del banco: nunca se guardan
+CODIGOS_NO_CACHEABLES = ("VALIDATION_ERROR", "CONFIG_ERROR", "CIRCUIT_OPEN", "ERROR")
+
+
+class CacheLRU:
+    """Caché en memoria con expiración y tope de entradas"""
+
+    bloqueante = False  # Se usa directamente desde el bucle asyncio
+
+    def __init__(self, maximo=10000):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira <= time.time():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (valor, time.time() + ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+
+class CacheSQLite:
+    """Caché en un archivo SQLite (modo WAL) compartido por los workers"""
+
+    bloqueante = True  # Puede esperar hasta 5 s el bloqueo: usar desde el executor
+
+    def __init__(self, ruta, maximo=100000):
+        self.ruta = ruta
+        self.maximo = maximo
+        self._local = threading.local()
+        self._escrituras = 0
+        self._conexion()
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_bdv (
+                clave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL
+            )
+        """)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def obtener(self, clave):
+        fila = self._conexion().execute(
+            "SELECT valor FROM cache_bdv WHERE clave = ? AND expira > ?", (clave, time.time())
+        ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def guardar(self, clave, valor, ttl):
+        conn = self._conexion()
+        ahora = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_bdv (clave, valor, expira) VALUES (?, ?, ?)",
+            (clave, json.dumps(valor), ahora + ttl)
+        )
+        # Limpieza ocasional: vencidas y, si sobra, las que vencen antes
+        self._escrituras += 1
+        if self._escrituras % 500 == 0:
+            conn.execute("DELETE FROM cache_bdv WHERE expira <= ?", (ahora,))
+            conn.execute("""
+                DELETE FROM cache_bdv WHERE clave IN (
+                    SELECT clave FROM cache_bdv ORDER BY expira DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.maximo,))
+
+
+class CacheConsultas:
+    """
+    Caché con TTL según el resultado y single-flight por clave.
+
+    Args:
+        backend: CacheLRU, CacheSQLite o cualquier objeto con obtener/guardar
+        ttl_ok (float): Segundos para resultados positivos (code 1000)
+        ttl_negativo (float): Segundos para rechazos y fallos del banco
+    """
+
+    def __init__(self, backend, ttl_ok=86400, ttl_negativo=30):
+        self.backend = backend
+        self.ttl_ok = ttl_ok
+        self.ttl_negativo = ttl_negativo
+        self._en_vuelo = {}
+
+    def _ttl(self, resultado):
+        if resultado.get("success") and resultado.get("code") == 1000:
+            return self.ttl_ok
+        if resultado.get("code") in CODIGOS_NO_CACHEABLES:
+            return 0
+        return self.ttl_negativo
+
+    async def _ejecutar(self, funcion, *args):
+        if getattr(self.backend, "bloqueante", False):
+            return await asyncio.get_running_loop().run_in_executor(None, funcion, *args)
+        return funcion(*args)
+
+    async def _leer(self, clave):
+        try:
+            return await self._ejecutar(self.backend.obtener, clave)
+        except Exception as e:
+            logger.warning(f"Caché BDV no disponible (lectura): {e}")
+            return None
+
+    async def _guardar(self, clave, resultado):
+        ttl = self._ttl(resultado)
+        if ttl <= 0:
+            return
+        try:
+            await self._ejecutar(self.backend.guardar, clave, resultado, ttl)
+        except Exception as e:
+            logger.warning(f"Caché BDV no disponible (escritura): {e}")
+
+    async def _consultar(self, clave, consultar):
+        resultado = await consultar()
+        await self._guardar(clave, resultado)
+        return resultado
+
+    def _terminar(self, clave, tarea):
+        del self._en_vuelo[clave]
+        if not tarea.cancelled():
+            tarea.exception()  # Marcarla como leída si nadie más la esperaba
+
+    async def obtener_o_consultar(self, clave, consultar):
+        """
+        Devuelve el resultado guardado o espera ``consultar()`` una sola vez por clave.
+
+        Debe llamarse siempre desde el mismo bucle asyncio (el del cliente BDV).
+        La consulta corre en una tarea propia: cancelar a quien la inició no la
+        cancela para las demás peticiones que la esperan.
+
+        Args:
+            consultar (callable): Función sin argumentos que devuelve la corrutina de la consulta
+
+        Returns:
+            dict: Copia del resultado (con 'cache': True si vino de la caché)
+        """
+        valor = await self._leer(clave)
+        if valor is not None:
+            return dict(valor, cache=True)
+
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            # Otra petición ya consulta esta clave: esperar su resultado
+            return dict(await asyncio.shield(tarea), cache=True)
+
+        tarea = self._en_vuelo[clave] = asyncio.ensure_future(self._consultar(clave, consultar))
+        tarea.add_done_callback(lambda t: self._terminar(clave, t))
+        return dict(await asyncio.shield(tarea))
+
+def clave_consulta(referencia, banco_origen, fecha_pago, importe):
+    """Clave de caché de una consulta de conciliación"""
+    return "|".join(str(v) for v in (referencia, banco_origen, fecha_pago, importe))
+
+
+def crear_cache():
+    """Caché configurada en el .env (None si BDV_CACHE=0)"""
+    tipo = os.getenv("BDV_CACHE", "lru").lower()
+    if tipo in ("0", "", "no"):
+        return None
+
+    if tipo == "sqlite":
+        backend = CacheSQLite(
+            os.getenv("BDV_CACHE_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_bdv.db")),
+            maximo=int(os.getenv("BDV_CACHE_MAXIMO", "100000")),
+        )
+    else:
+        backend = CacheLRU(maximo=int(os.getenv("BDV_CACHE_MAXIMO", "10000")))
+
+    return CacheConsultas(
+        backend,
+        ttl_ok=float(os.getenv("BDV_CACHE_TTL_OK", "86400")),
+        ttl_negativo=float(os.getenv("BDV_CACHE_TTL_NEGATIVO", "30")),
+    )
@@ -0,0 +1,112 @@
+"""
+Canje atómico de pagos (/verificar)
+
+Búsqueda y canje van en una sola sentencia: el UPDATE solo afecta al pago
+si sigue en estado LIBRE. Si dos cajeros envían la misma referencia a la
+vez, PostgreSQL bloquea la fila para el segundo UPDATE y, cuando el primero
+confirma, vuelve a evaluar ``estado = 'LIBRE'`` sobre la versión nueva: el
+segundo no canjea nada. Exactamente uno gana, sin SELECT previo en Python.
+
+canjear_lote resuelve varias referencias (pagos divididos de una misma
+cuenta) con una sola búsqueda ``referencia = ANY(%s)`` y un solo UPDATE.
+
+La sentencia va registrada en consultas.py como ``canje_lote``: cada
+conexión del pool la prepara una vez y luego solo la ejecuta.
+
+Prueba de concurrencia: python benchmarks/stress_canje.py
+"""
+import consultas
+
+consultas.registrar("canje_lote", """
+    WITH pedido AS (
+        SELECT * FROM unnest(%s::int[], %s::text[], %s::text[]) AS t(pos, ref, comanda)
+    ), encontrados AS (
+        SELECT id, banco, monto, referencia
+        FROM pagos
+        WHERE referencia = ANY(%s::text[]) OR right(referencia, 6) = ANY(%s::text[])
+    ), coincidencias AS (
+        SELECT p.pos, p.comanda, e.id, e.banco, e.monto, e.referencia,
+               COUNT(*) OVER (PARTITION BY p.pos) AS n
+        FROM pedido p
+        JOIN encontrados e
+          ON e.referencia = p.ref
+          OR (p.ref ~ '^[0-9]{6}$' AND right(e.referencia, 6) = p.ref)
+    ), unicos AS (
+        SELECT DISTINCT ON (id) pos, comanda, id
+        FROM coincidencias
+        WHERE n = 1
+        ORDER BY id, pos
+    ), canje AS (
+        UPDATE pagos
+        SET estado = 'CANJEADO', comanda = u.comanda, fecha_canje = %s, ip_canje = %s
+        FROM unicos u
+        WHERE pagos.id = u.id AND pagos.estado = 'LIBRE'
+        RETURNING u.pos
+    )
+    SELECT DISTINCT ON (p.pos)
+           p.pos, c.id, c.banco, c.monto, c.referencia, COALESCE(c.n, 0),
+           EXISTS (SELECT 1 FROM canje k WHERE k.pos = p.pos)
+    FROM pedido p
+    LEFT JOIN coincidencias c ON c.pos = p.pos
+    ORDER BY p.pos
+""", "Búsqueda y canje de /verificar y /api/v1/verificar")
+
+
+def es_sufijo(ref):
+    """Los últimos 6 dígitos de una referencia (índice idx_referencia_sufijo)"""
+    return len(ref) == 6 and ref.isdigit()
+
+
+def canjear_lote(cur, pedidos, fecha_canje, ip_canje):
+    """
+    Busca y canjea varias referencias en una sola sentencia.
+
+    Cada referencia se canjea si coincide con un único pago y ese pago sigue
+    LIBRE. Si el mismo pago aparece dos veces en el lote, solo la primera
+    aparición lo canjea.
+
+    Args:
+        cur: Cursor de PostgreSQL (el llamador hace commit)
+        pedidos (list): [(ref, comanda), ...]; ref completa o sus últimos 6 dígitos
+        fecha_canje (str): Fecha del canje (dd/mm/YYYY hh:mm AM)
+        ip_canje (str): IP del cajero o terminal
+
+    Returns:
+        list: Una tupla por pedido, en el mismo orden:
+            (encontrados, pago (id, banco, monto, referencia) o None, canjeado)
+    """
+    if not pedidos:
+        return []
+
+    refs = [ref for ref, _ in pedidos]
+    consultas.ejecutar(cur, "canje_lote", (
+        list(range(len(pedidos))), refs, [comanda for _, comanda in pedidos],
+        refs, [ref for ref in refs if es_sufijo(ref)],
+        fecha_canje, ip_canje,
+    ))
+
+    resultados = []
+    for _, id_pago, banco, monto, referencia, encontrados, canjeado in cur.fetchall():
+        pago = (id_pago, banco, monto, referencia) if encontrados == 1 else None
+        resultados.append((encontrados, pago, canjeado))
+    return resultados
+
+
+def canjear_pago(cur, ref, comanda, fecha_canje, ip_canje):
+    """
+    Busca la referencia y la canjea si es única y está LIBRE, en un solo viaje a la BD.
+
+    Args:
+        cur: Cursor de PostgreSQL (el llamador hace commit)
+        ref (str): Referencia completa o sus últimos 6 dígitos
+        comanda (str): Comanda a vincular
+        fecha_canje (str): Fecha del canje (dd/mm/YYYY hh:mm AM)
+        ip_canje (str): IP del cajero
+
+    Returns:
+        tuple: (encontrados, pago, canjeado)
+            encontrados (int): Pagos que coinciden con la referencia
+            pago (tuple | None): (id, banco, monto, referencia) si hubo exactamente uno
+            canjeado (bool): True si esta llamada lo canjeó
+    """
+    return canjear_lote(cur, [(ref, comanda)], fecha_canje, ip_canje)[0]
@@ -0,0 +1,287 @@
+"""
+Cliente HTTP del API de Conciliación BDV
+Versión: 2.0 - Producción (asíncrono)
+
+Cada proceso (worker de gunicorn) mantiene un solo ``httpx.AsyncClient``
+con un pool de conexiones keep-alive hacia el banco, que vive en un bucle
+asyncio propio (un hilo daemon por proceso). Las rutas Flask, que son
+síncronas, envían sus consultas a ese bucle con ``ejecutar()``; el código
+asíncrono las espera con ``en_bucle()``. Así todas comparten el mismo pool
+y N consultas simultáneas tardan lo que la más lenta, no la suma.
+
+- Timeouts separados: conexión corta (el banco no responde) y lectura
+  acotada (el banco responde lento), para no retener un worker 30 segundos.
+- Concurrencia acotada con un semáforo (BDV_CONCURRENCIA).
+- Reintentos acotados con backoff exponencial y jitter, solo cuando la
+  consulta no llegó a procesarse: fallo al conectar o HTTP 502/503/504.
+  Un timeout de lectura no se reintenta.
+- Circuito: tras BDV_CIRCUITO_FALLOS fallos seguidos del banco se deja de
+  llamarlo durante BDV_CIRCUITO_ESPERA segundos y se responde de inmediato
+  con CircuitoAbiertoError. Pasado ese tiempo una sola consulta de prueba
+  decide si el circuito se cierra o vuelve a abrirse.
+
+Para probar contra un servidor local:
+    python benchmarks/stub_bdv.py --puerto 8099 --modo caido
+    BDV_API_URL=http://127.0.0.1:8099/getMovement python ...
+"""
+import os
+import time
+import random
+import asyncio
+import atexit
+import logging
+import threading
+
+import httpx
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Respuestas en las que el banco no procesó la consulta (se pueden repetir)
+ESTADOS_REINTENTABLES = (502, 503, 504)
+
+
+class CircuitoAbiertoError(Exception):
+    """El banco falló repetidamente y el circuito aún no permite nuevas consultas"""
+
+
+class Circuito:
+    """
+    Interruptor de circuito por proceso.
+
+    Args:
+        umbral (int): Fallos consecutivos que abren el circuito
+        espera (float): Segundos que permanece abierto antes de una consulta de prueba
+    """
+
+    def __init__(self, umbral=5, espera=30.0):
+        self.umbral = umbral
+        self.espera = espera
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._fallos < self.umbral:
+                return "cerrado"
+            return "abierto" if time.monotonic() < self._abierto_hasta else "semiabierto"
+
+    def permitir(self):
+        """Lanza CircuitoAbiertoError si la consulta no debe salir hacia el banco"""
+        with self._lock:
+            if self._fallos < self.umbral:
+                return
+            if time.monotonic() < self._abierto_hasta or self._prueba_en_curso:
+                raise CircuitoAbiertoError("BDV no disponible, circuito abierto")
+            self._prueba_en_curso = True  # Semiabierto: solo pasa esta consulta
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._fallos >= self.umbral:
+                logger.info("Circuito BDV cerrado: el banco volvió a responder")
+            self._fallos = 0
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba_en_curso = False
+            if self._fallos >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.espera
+                logger.error(f"Circuito BDV abierto por {self.espera:.0f}s tras {self._fallos} fallos seguidos")
+
+
+class ClienteBDV:
+    """
+    Cliente asíncrono keep-alive con reintentos, semáforo y circuito.
+
+    Debe usarse siempre desde el mismo bucle asyncio (el de ``obtener_bucle()``).
+
+    Args:
+        conexiones (int): Conexiones keep-alive hacia el banco
+        concurrencia (int): Consultas simultáneas como máximo
+        timeout_conexion (float): Segundos para establecer la conexión
+        timeout_lectura (float): Segundos para recibir la respuesta
+        reintentos (int): Reintentos adicionales ante fallos reintentables
+        backoff (float): Base en segundos del backoff exponencial
+        circuito (Circuito): Interruptor compartido por las consultas del proceso
+    """
+
+    def __init__(self, conexiones=10, concurrencia=10, timeout_conexion=3.05, timeout_lectura=15.0,
+                 reintentos=2, backoff=0.3, circuito=None):
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.circuito = circuito or Circuito()
+        self.semaforo = asyncio.Semaphore(concurrencia)
+
+        self.cliente = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout_lectura, connect=timeout_conexion, pool=timeout_lectura),
+            limits=httpx.Limits(max_connections=conexiones, max_keepalive_connections=conexiones),
+            verify=True,
+        )
+
+    async def _esperar(self, intento, restante=None):
+        """Backoff exponencial con jitter completo, sin pasar del plazo restante"""
+        espera = random.uniform(0, self.backoff * (2 ** intento))
+        await asyncio.sleep(espera if restante is None else max(0.0, min(espera, restante)))
+
+    async def post(self, url, plazo=None, **kwargs):
+        """
+        POST con timeouts, reintentos, circuito y plazo total.
+
+        El plazo se aplica aquí, a cada intento con lo que queda de él, y no
+        cancelando la llamada desde fuera: así cada intento que sale hacia el
+        banco termina registrando éxito o fallo en el circuito.
+
+        Args:
+            url (str): URL del API
+            plazo (float): Segundos máximos para toda la consulta, reintentos incluidos
+
+        Returns:
+            httpx.Response: La última respuesta (puede ser 5xx si se agotaron los reintentos)
+
+        Raises:
+            CircuitoAbiertoError: El circuito no permite consultar al banco
+            asyncio.TimeoutError: Se agotó el plazo
+            httpx.TimeoutException | httpx.TransportError: Timeout o error de conexión definitivo
+        """
+        limite = time.monotonic() + plazo if plazo else None
+
+        def restante():
+            return None if limite is None else limite - time.monotonic()
+
+        async with self.semaforo:
+            for intento in range(self.reintentos + 1):
+                if limite is not None and restante() <= 0:
+                    raise asyncio.TimeoutError()
+                self.circuito.permitir()
+                ultimo = intento == self.reintentos
+
+                try:
+                    respuesta = await asyncio.wait_for(self.cliente.post(url, **kwargs), restante())
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # No se llegó a enviar la consulta: se puede repetir
+                    self.circuito.registrar_fallo()
+                    if ultimo:
+                        raise
+                    logger.warning(f"BDV: fallo de conexión (intento {intento + 1}), reintentando: {e!r}")
+                    await self._esperar(intento, restante())
+                    continue
+                except httpx.TransportError:
+                    # Timeout de lectura o conexión cortada: el banco pudo haber procesado la consulta
+                    self.circuito.registrar_fallo()
+                    raise
+                except BaseException:
+                    # Plazo agotado o tarea cancelada: sin esto, una consulta de prueba del
+                    # circuito semiabierto quedaría "en curso" y el circuito no volvería a cerrarse
+                    self.circuito.registrar_fallo()
+                    raise
+
+                if respuesta.status_code >= 500:
+                    self.circuito.registrar_fallo()
+                    if respuesta.status_code in ESTADOS_REINTENTABLES and not ultimo:
+                        logger.warning(f"BDV: HTTP {respuesta.status_code} (intento {intento + 1}), reintentando")
+                        await self._esperar(intento, restante())
+                        continue
+                else:
+                    self.circuito.registrar_exito()
+                return respuesta
+
+    async def cerrar(self):
+        await self.cliente.aclose()
+
+
+# --- BUCLE Y CLIENTE DEL PROCESO ---
+_bucle = None
+_cliente = None
+_cliente_pid = None
+_cliente_lock = threading.Lock()
+
+
+def obtener_bucle():
+    """
+    Bucle asyncio del proceso actual (un hilo daemon), creándolo si hace falta.
+
+    Igual que el pool de BD, un bucle y un cliente heredados por fork se
+    abandonan: su hilo no existe en el hijo y sus sockets pertenecen al padre.
+    """
+    global _bucle, _cliente, _cliente_pid
+
+    pid = os.getpid()
+    if _bucle is not None and _cliente_pid == pid:
+        return _bucle
+
+    with _cliente_lock:
+        if _bucle is None or _cliente_pid != pid:
+            bucle = asyncio.new_event_loop()
+            threading.Thread(target=bucle.run_forever, name="cliente-bdv", daemon=True).start()
+            _cliente = None
+            _bucle, _cliente_pid = bucle, pid
+        return _bucle
+
+
+def obtener_cliente():
+    """Cliente del proceso actual (vive en el bucle de ``obtener_bucle()``)"""
+    global _cliente
+
+    obtener_bucle()
+    if _cliente is not None:
+        return _cliente
+
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = ClienteBDV(
+                conexiones=int(os.getenv("BDV_POOL_MAX", "10")),
+                concurrencia=int(os.getenv("BDV_CONCURRENCIA", "10")),
+                timeout_conexion=float(os.getenv("BDV_TIMEOUT_CONEXION", "3.05")),
+                timeout_lectura=float(os.getenv("BDV_TIMEOUT_LECTURA", "15")),
+                reintentos=int(os.getenv("BDV_REINTENTOS", "2")),
+                backoff=float(os.getenv("BDV_BACKOFF", "0.3")),
+                circuito=Circuito(
+                    umbral=int(os.getenv("BDV_CIRCUITO_FALLOS", "5")),
+                    espera=float(os.getenv("BDV_CIRCUITO_ESPERA", "30")),
+                ),
+            )
+        return _cliente
+
+
+def ejecutar(corrutina):
+    """Ejecuta una corrutina en el bucle del cliente desde código síncrono y espera su resultado"""
+    return asyncio.run_coroutine_threadsafe(corrutina, obtener_bucle()).result()
+
+
+async def en_bucle(corrutina):
+    """Espera una corrutina que debe correr en el bucle del cliente, desde cualquier bucle"""
+    bucle = obtener_bucle()
+    try:
+        actual = asyncio.get_running_loop()
+    except RuntimeError:
+        actual = None
+    if actual is bucle:
+        return await corrutina
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(corrutina, bucle))
+
+
+def cerrar_cliente():
+    """Cierra las conexiones keep-alive y detiene el bucle del proceso actual"""
+    global _bucle, _cliente, _cliente_pid
+
+    with _cliente_lock:
+        if _bucle is not None and _cliente_pid == os.getpid():
+            if _cliente is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(_cliente.cerrar(), _bucle).result(timeout=5)
+                except Exception as e:
+                    logger.warning(f"Cliente BDV no cerrado limpiamente: {e}")
+            _bucle.call_soon_threadsafe(_bucle.stop)
+        _bucle = None
+        _cliente = None
+        _cliente_pid = None
+
+
+atexit.register(cerrar_cliente)
@@ -0,0 +1,210 @@
+"""
+Cola durable de mensajes del webhook
+Versión: 1.0 - Producción
+
+/webhook-bdv guarda el mensaje crudo en un archivo SQLite (modo WAL) y
+responde de inmediato. Un hilo consumidor lo vacía por lotes hacia
+PostgreSQL, así que la latencia del webhook no depende de la BD y nada se
+pierde si PostgreSQL está caído unos minutos: los mensajes esperan en el
+archivo hasta que el lote se confirme.
+
+Con varios workers de gunicorn, todos pueden encolar; un solo consumidor
+a la vez (el que obtiene el flock del archivo .lock) vacía la cola. Si ese
+worker muere, otro toma el relevo.
+"""
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: servidor de desarrollo de un solo proceso
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ColaWebhook:
+    """
+    Cola FIFO persistente en SQLite.
+
+    Args:
+        ruta (str): Archivo SQLite de la cola
+        tamano_lote (int): Mensajes por lote enviado a PostgreSQL
+        intervalo (float): Segundos entre revisiones cuando la cola está vacía
+        max_intentos (int): Fallos de datos tras los cuales el mensaje pasa a cola_fallida
+    """
+
+    def __init__(self, ruta, tamano_lote=200, intervalo=0.5, max_intentos=5):
+        self.ruta = ruta
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.max_intentos = max_intentos
+
+        self._local = threading.local()
+        self._evento = threading.Event()
+        self._hilo = None
+        self._hilo_pid = None
+        self._lock_hilo = threading.Lock()
+
+        self._conexion()  # Crea el esquema al iniciar
+
+    def _conexion(self):
+        """Conexión SQLite propia de cada hilo (y de cada proceso)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cola (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mensaje TEXT NOT NULL,
+                recibido_en REAL NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                ultimo_error TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cola_fallida (
+                id INTEGER PRIMARY KEY,
+                mensaje TEXT NOT NULL,
+                recibido_en REAL NOT NULL,
+                intentos INTEGER NOT NULL,
+                ultimo_error TEXT,
+                fallido_en REAL NOT NULL
+            )
+        """)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def encolar(self, mensaje, recibido_en=None):
+        """Guarda un mensaje; al volver, ya está en disco"""
+        self._conexion().execute(
+            "INSERT INTO cola (mensaje, recibido_en) VALUES (?, ?)",
+            (mensaje, recibido_en or time.time())
+        )
+        self._evento.set()
+
+    def pendientes(self):
+        """Mensajes en espera"""
+        return self._conexion().execute("SELECT COUNT(*) FROM cola").fetchone()[0]
+
+    def tomar_lote(self):
+        """Primeros mensajes de la cola (no los borra)"""
+        return self._conexion().execute(
+            "SELECT id, mensaje, recibido_en FROM cola ORDER BY id LIMIT ?",
+            (self.tamano_lote,)
+        ).fetchall()
+
+    def confirmar(self, ids):
+        """Borra los mensajes ya guardados en PostgreSQL"""
+        self._conexion().executemany("DELETE FROM cola WHERE id = ?", [(i,) for i in ids])
+
+    def registrar_fallo(self, ids, error):
+        """Suma un intento; los que superan max_intentos pasan a cola_fallida"""
+        conn = self._conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE cola SET intentos = intentos + 1, ultimo_error = ? WHERE id = ?",
+                [(str(error)[:500], i) for i in ids]
+            )
+            conn.execute("""
+                INSERT INTO cola_fallida (id, mensaje, recibido_en, intentos, ultimo_error, fallido_en)
+                SELECT id, mensaje, recibido_en, intentos, ultimo_error, ? FROM cola WHERE intentos >= ?
+            """, (time.time(), self.max_intentos))
+            movidos = conn.execute("DELETE FROM cola WHERE intentos >= ?", (self.max_intentos,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if movidos:
+            logger.error(f"{movidos} mensajes del webhook movidos a cola_fallida tras {self.max_intentos} intentos")
+
+    def iniciar_consumidor(self, procesar_lote, errores_transitorios=()):
+        """
+        Arranca (una vez por proceso) el hilo que vacía la cola.
+
+        Args:
+            procesar_lote (callable): Recibe [(mensaje, recibido_en), ...] y
+                lanza una excepción si el lote no pudo guardarse
+            errores_transitorios (tuple): Excepciones de infraestructura (BD caída,
+                pool agotado); se reintentan sin contar intentos
+        """
+        with self._lock_hilo:
+            pid = os.getpid()
+            if self._hilo is not None and self._hilo.is_alive() and self._hilo_pid == pid:
+                return
+            self._hilo = threading.Thread(
+                target=self._consumir,
+                args=(procesar_lote, errores_transitorios),
+                name="consumidor-webhook",
+                daemon=True
+            )
+            self._hilo_pid = pid
+            self._hilo.start()
+
+    def _tomar_turno(self):
+        """flock exclusivo: un solo consumidor entre todos los workers"""
+        if fcntl is None:
+            return True
+        self._archivo_lock = open(self.ruta + ".lock", "a")
+        while True:
+            try:
+                fcntl.flock(self._archivo_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                time.sleep(max(self.intervalo, 1.0) * 5)
+
+    def _aislar_fallo(self, lote, procesar_lote, errores_transitorios):
+        """Reprocesa un lote fallido mensaje a mensaje para no castigar a los válidos"""
+        for id_mensaje, mensaje, recibido_en in lote:
+            try:
+                procesar_lote([(mensaje, recibido_en)])
+            except errores_transitorios:
+                return  # La BD cayó: el resto se reintenta con el próximo lote
+            except Exception as e:
+                self.registrar_fallo([id_mensaje], e)
+                continue
+            self.confirmar([id_mensaje])
+
+    def _consumir(self, procesar_lote, errores_transitorios):
+        self._tomar_turno()
+        logger.info(f"Consumidor de la cola del webhook activo (pid {os.getpid()})")
+
+        espera_error = self.intervalo
+        while True:
+            try:
+                lote = self.tomar_lote()
+                if not lote:
+                    self._evento.wait(self.intervalo)
+                    self._evento.clear()
+                    continue
+
+                ids = [fila[0] for fila in lote]
+                try:
+                    procesar_lote([(mensaje, recibido_en) for _, mensaje, recibido_en in lote])
+                except errores_transitorios as e:
+                    logger.warning(f"BD no disponible, {len(ids)} mensajes siguen en cola: {e}")
+                    time.sleep(espera_error + random.uniform(0, espera_error))
+                    espera_error = min(espera_error * 2, 30)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error procesando lote del webhook: {e}")
+                    self._aislar_fallo(lote, procesar_lote, errores_transitorios)
+                    continue
+
+                self.confirmar(ids)
+                espera_error = self.intervalo
+            except Exception as e:
+                # Error de la propia cola (disco, SQLite): no matar el hilo
+                logger.error(f"Error en consumidor del webhook: {e}")
+                time.sleep(self.intervalo * 4)
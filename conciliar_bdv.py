@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Conciliación masiva de pagos LIBRE contra el API BDV
+Ejecución: python conciliar_bdv.py [--rps 10] [--concurrencia 8] [--lote 200] [--reiniciar]
+
+Recorre los pagos recibidos por el webhook con estado = 'LIBRE' y sin
+estado_bdv, los consulta en el API de Conciliación con concurrencia acotada
+y un presupuesto de consultas por segundo, y escribe estado_bdv /
+fecha_validacion por lotes con un solo UPDATE.
+
+- Los candidatos se leen por lotes de id ascendente (keyset sobre la PK).
+- Cada lote confirmado guarda un checkpoint (último id) en
+  conciliacion_bdv.json; si el proceso se interrumpe, la siguiente ejecución
+  continúa desde ahí. --reiniciar empieza desde el principio.
+- Si el circuito del cliente BDV se abre, las consultas esperan a que se
+  cierre en vez de recorrer la tabla marcando fallos.
+- Timeouts, errores de conexión y respuestas HTTP distintas de 200 (401,
+  429, 5xx...) no se escriben: el pago queda sin estado_bdv y se reintenta
+  en una ejecución con --reiniciar. Solo se guardan los pagos confirmados y
+  los códigos de negocio del banco (1010, ...).
+
+Probar contra el stub local:
+    python benchmarks/stub_bdv.py --puerto 8099 --modo intermitente
+    BDV_API_URL=http://127.0.0.1:8099/getMovement python conciliar_bdv.py --rps 50
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import db_pool  # noqa: E402
+from banco_api import validar_pago_bdv  # noqa: E402
+from cliente_bdv import obtener_cliente  # noqa: E402
+
+RUTA_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conciliacion_bdv.json")
+
+# Banco de la notificación (pagos.banco) -> código de banco del API
+CODIGO_BANCO = {
+    "BDV": "0102",
+    "BANESCO": "0134",
+    "SOFITASA": "0137",
+    "PLAZA": "0138",
+}
+
+# Resultados que no son una respuesta del banco sobre el pago: no se escriben
+CODIGOS_TRANSITORIOS = ("TIMEOUT", "CONNECTION_ERROR", "CIRCUIT_OPEN", "ERROR", "CONFIG_ERROR", "VALIDATION_ERROR")
+
+# Veces que un pago espera a que se cierre el circuito antes de quedar pendiente
+REINTENTOS_CIRCUITO = 3
+
+
+class LimitadorTasa:
+    """Cubeta de fichas compartida por los hilos: como máximo ``rps`` consultas por segundo"""
+
+    def __init__(self, rps):
+        self.intervalo = 1.0 / rps
+        self._proxima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(self._proxima, ahora)
+            self._proxima = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def leer_checkpoint(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f).get("ultimo_id", 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def guardar_checkpoint(ruta, ultimo_id, totales):
+    """Escritura atómica: nunca queda un checkpoint a medias"""
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"ultimo_id": ultimo_id, "actualizado": datetime.now().isoformat(), **totales}, f)
+    os.replace(temporal, ruta)
+
+
+def iterar_candidatos(conn, desde_id, tamano_lote):
+    """
+    Pagos LIBRE sin conciliar, por lotes de id ascendente (keyset sobre la PK).
+
+    Cada lote es una consulta corta: no se mantiene abierta una transacción
+    (ni un snapshot) durante toda la ejecución.
+    """
+    ultimo_id = desde_id
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, referencia, banco, banco_origen, fecha_recepcion, monto_num
+                FROM pagos
+                WHERE id > %s
+                  AND estado = 'LIBRE'
+                  AND (estado_bdv IS NULL OR estado_bdv = '')
+                  AND (banco_origen IS NOT NULL OR banco = ANY(%s))
+                ORDER BY id
+                LIMIT %s
+            """, (ultimo_id, list(CODIGO_BANCO), tamano_lote))
+            lote = cur.fetchall()
+        conn.commit()
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1][0]
+
+
+def consultar_pago(fila, limitador):
+    """Consulta un pago en el API; devuelve (id, resultado)"""
+    id_pago, referencia, banco, banco_origen, fecha_recepcion, monto_num = fila
+
+    try:
+        fecha_pago = datetime.strptime(fecha_recepcion, "%d/%m/%Y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        fecha_pago = None
+
+    for _ in range(REINTENTOS_CIRCUITO + 1):
+        limitador.esperar()
+        resultado = validar_pago_bdv(
+            referencia=referencia,
+            banco_origen=banco_origen or CODIGO_BANCO.get(banco),
+            fecha_pago=fecha_pago,
+            importe=f"{monto_num:.2f}" if monto_num is not None else None,
+        )
+        if resultado.get("code") != "CIRCUIT_OPEN":
+            break
+        # El banco está caído: esperar a que el circuito permita la consulta de prueba
+        time.sleep(obtener_cliente().circuito.espera)
+    return id_pago, resultado
+
+
+def es_transitorio(resultado):
+    """
+    El resultado no es un veredicto del banco sobre el pago.
+
+    Los veredictos llegan en un cuerpo HTTP 200 con códigos de negocio
+    (1000, 1010, ...). Un código entero en el rango HTTP (401 clave vencida,
+    429 límite de consultas, 5xx) es el estado de una respuesta no 200 y no
+    dice nada del pago: escribirlo lo sacaría de las siguientes conciliaciones.
+    """
+    if resultado.get("success"):
+        return False
+    codigo = resultado.get("code")
+    return codigo in CODIGOS_TRANSITORIOS or (isinstance(codigo, int) and 100 <= codigo < 600)
+
+
+def escribir_resultados(conn, resultados):
+    """Un solo UPDATE ... FROM (VALUES ...) por lote"""
+    filas = []
+    for id_pago, resultado in resultados:
+        if es_transitorio(resultado):
+            continue
+        estado = resultado.get("status") if resultado.get("success") else resultado.get("code")
+        filas.append((id_pago, str(estado or resultado.get("code"))[:10]))
+
+    if filas:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE pagos SET estado_bdv = v.estado_bdv, fecha_validacion = NOW()
+                FROM (VALUES %s) AS v(id, estado_bdv)
+                WHERE pagos.id = v.id
+            """, filas, page_size=len(filas))
+    conn.commit()
+    return len(filas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conciliación masiva de pagos LIBRE contra el API BDV")
+    parser.add_argument("--rps", type=float, default=float(os.getenv("CONCILIACION_RPS", "10")),
+                        help="Consultas por segundo al banco (presupuesto total)")
+    parser.add_argument("--concurrencia", type=int, default=int(os.getenv("CONCILIACION_HILOS", "8")),
+                        help="Consultas simultáneas")
+    parser.add_argument("--lote", type=int, default=200, help="Pagos por UPDATE y por checkpoint")
+    parser.add_argument("--checkpoint", default=RUTA_CHECKPOINT)
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint y empezar desde el inicio")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("  CONCILIACIÓN MASIVA BDV: pagos LIBRE sin estado_bdv")
+    print("="*60 + "\n")
+
+    desde_id = 0 if args.reiniciar else leer_checkpoint(args.checkpoint)
+    if desde_id:
+        print(f"Continuando desde el checkpoint: id > {desde_id}")
+
+    limitador = LimitadorTasa(args.rps)
+    totales = {"consultados": 0, "conciliados": 0, "pendientes": 0}
+    inicio = time.monotonic()
+
+    try:
+        with db_pool.conexion() as conn, ThreadPoolExecutor(max_workers=args.concurrencia) as hilos:
+            for lote in iterar_candidatos(conn, desde_id, args.lote):
+                resultados = list(hilos.map(lambda fila: consultar_pago(fila, limitador), lote))
+
+                escritos = escribir_resultados(conn, resultados)
+                totales["consultados"] += len(lote)
+                totales["conciliados"] += escritos
+                totales["pendientes"] += len(lote) - escritos
+                guardar_checkpoint(args.checkpoint, lote[-1][0], totales)
+
+                tasa = totales["consultados"] / max(time.monotonic() - inicio, 0.001) * 3600
+                print(f"  ✅ id ≤ {lote[-1][0]}: {totales['consultados']} consultados, "
+                      f"{totales['conciliados']} conciliados, {totales['pendientes']} pendientes "
+                      f"({tasa:,.0f}/hora)")
+
+    except KeyboardInterrupt:
+        print(f"\n⚠️  Interrumpido. Checkpoint en {args.checkpoint}; vuelva a ejecutar para continuar.")
+        sys.exit(130)
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print(f"El checkpoint en {args.checkpoint} conserva el último lote confirmado.")
+        sys.exit(1)
+
+    print("\n" + "="*60)
+    print(f"  ✅ CONCILIACIÓN COMPLETADA: {totales['consultados']} consultados en "
+          f"{time.monotonic() - inicio:.0f}s")
+    print("="*60)
+    if totales["pendientes"]:
+        print(f"\n{totales['pendientes']} pagos sin respuesta definitiva del banco; "
+              f"reintentar con: python conciliar_bdv.py --reiniciar")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Registro de sentencias frecuentes con planes preparados en el servidor
+Versión: 1.0 - Producción
+
+Las sentencias que más se repiten (canje de /verificar, INSERT del webhook,
+página y totales de /admin) se registran una vez con un nombre. La primera
+vez que una conexión del pool ejecuta una, se hace ``PREPARE nombre AS ...``
+y a partir de ahí solo ``EXECUTE nombre (...)``: PostgreSQL no vuelve a
+analizar ni planificar el SQL, y psycopg2 interpola y envía unos pocos
+bytes en vez de la sentencia completa.
+
+- Las sentencias preparadas viven lo que la conexión; cada ``ConexionPool``
+  recuerda cuáles ya preparó (``conn.preparadas``). Una conexión reciclada
+  por el pool empieza de cero.
+- Conexiones que no son del pool (scripts con psycopg2.connect) y
+  DB_PREPARAR=0 (por ejemplo detrás de PgBouncer en modo transacción)
+  ejecutan el SQL tal cual, con el mismo resultado.
+- ``estadisticas()`` da ejecuciones, preparaciones y tiempo por sentencia
+  de este proceso; el histograma notipagos_bd_consulta_segundos de /metrics
+  suma todos los workers.
+
+Uso:
+    import consultas
+
+    consultas.registrar("pago_por_id", "SELECT * FROM pagos WHERE id = %s")
+    consultas.ejecutar(cur, "pago_por_id", (15,))
+
+Benchmark: python benchmarks/bench_consultas.py
+"""
+import os
+import re
+import time
+import threading
+
+import metricas
+
+PREPARAR = os.getenv("DB_PREPARAR", "1") == "1"
+
+# %s de psycopg2 (no %%s) -> $1, $2, ... de PREPARE, con su cast si lo tiene (%s::text[])
+_MARCADOR = re.compile(r"%(?:(%)|s(::\w+(?:\[\])?)?)")
+
+
+class Consulta:
+    """
+    Sentencia registrada.
+
+    Args:
+        nombre (str): Identificador SQL de la sentencia preparada
+        sql (str): SQL con marcadores %s de psycopg2
+        descripcion (str): Dónde se usa (para el registro)
+    """
+
+    def __init__(self, nombre, sql, descripcion=""):
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", nombre):
+            raise ValueError(f"Nombre de sentencia inválido: {nombre!r}")
+
+        self.nombre = nombre
+        self.sql = sql
+        self.descripcion = descripcion
+
+        # Los argumentos de EXECUTE llevan el mismo cast que el marcador: EXECUTE solo
+        # aplica conversiones implícitas y ARRAY[NULL] (text[]) no pasa a numeric[]
+        argumentos = []
+
+        def reemplazar(marcador):
+            if marcador.group(1):
+                return "%"
+            cast = marcador.group(2) or ""
+            argumentos.append(f"%s{cast}")
+            return f"${len(argumentos)}{cast}"
+
+        self.sql_preparada = _MARCADOR.sub(reemplazar, sql)
+        self.parametros = len(argumentos)
+        self.sql_execute = f"EXECUTE {nombre}" + (f" ({', '.join(argumentos)})" if argumentos else "")
+
+        self.ejecuciones = 0
+        self.preparaciones = 0
+        self.segundos = 0.0
+
+
+REGISTRO = {}
+_lock = threading.Lock()
+
+
+def registrar(nombre, sql, descripcion=""):
+    """
+    Registra una sentencia con nombre (idempotente si el SQL no cambia).
+
+    Returns:
+        Consulta: La sentencia registrada
+
+    Raises:
+        ValueError: El nombre ya está registrado con otro SQL
+    """
+    with _lock:
+        existente = REGISTRO.get(nombre)
+        if existente is not None:
+            if existente.sql != sql:
+                raise ValueError(f"La sentencia {nombre} ya está registrada con otro SQL")
+            return existente
+        consulta = REGISTRO[nombre] = Consulta(nombre, sql, descripcion)
+        return consulta
+
+
+def ejecutar(cur, nombre, params=()):
+    """
+    Ejecuta una sentencia registrada, preparándola en la conexión si hace falta.
+
+    Args:
+        cur: Cursor de PostgreSQL (los resultados se leen de él como siempre)
+        nombre (str): Sentencia registrada
+        params (tuple): Parámetros en el mismo orden que los %s del SQL
+
+    Returns:
+        El mismo cursor
+    """
+    consulta = REGISTRO[nombre]
+    preparadas = getattr(cur.connection, "preparadas", None)
+    preparada = False
+    inicio = time.perf_counter()
+
+    if not PREPARAR or preparadas is None:
+        cur.execute(consulta.sql, params)
+    else:
+        if nombre not in preparadas:
+            # PREPARE no es transaccional: sobrevive a un ROLLBACK posterior
+            cur.execute(f"PREPARE {nombre} AS {consulta.sql_preparada}")
+            preparadas.add(nombre)
+            preparada = True
+        cur.execute(consulta.sql_execute, params)
+
+    segundos = time.perf_counter() - inicio
+    metricas.BD_CONSULTA.labels(nombre).observe(segundos)
+    with _lock:
+        consulta.ejecuciones += 1
+        consulta.preparaciones += preparada
+        consulta.segundos += segundos
+    return cur
+
+
+def estadisticas():
+    """Ejecuciones, preparaciones y tiempo medio de cada sentencia del proceso"""
+    with _lock:
+        return [
+            {
+                "nombre": c.nombre,
+                "descripcion": c.descripcion,
+                "parametros": c.parametros,
+                "ejecuciones": c.ejecuciones,
+                "preparaciones": c.preparaciones,
+                "ms_promedio": round(c.segundos / c.ejecuciones * 1000, 3) if c.ejecuciones else None,
+            }
+            for c in REGISTRO.values()
+        ]
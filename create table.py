@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 """
 Script para crear tabla 'pagos' en PostgreSQL
-Ejecución: python create_table.py
+Ejecución: python "create table.py"
+
+Crea la tabla con todas las columnas que usa la aplicación, incluidas las
+que en instalaciones anteriores agregan migrate_bdv.py y migrate_montos.py.
+Los índices de búsqueda, el resumen y los triggers siguen en los migrate_*.py
+(ver "Migraciones" en el README).
 """
 
 import psycopg2
@@ -46,6 +51,17 @@ try:
             comanda VARCHAR(50),
             banco VARCHAR(50),
             ip_canje VARCHAR(50),
+            -- Validación BDV (migrate_bdv.py en instalaciones anteriores)
+            cedula_pagador VARCHAR(20),
+            telefono_pagador VARCHAR(20),
+            banco_origen VARCHAR(10),
+            estado_bdv VARCHAR(10),
+            fecha_validacion TIMESTAMP,
+            fecha_pago DATE,
+            fecha_registro TIMESTAMP,
+            -- Monto normalizado (migrate_montos.py en instalaciones anteriores)
+            monto_num NUMERIC(14,2),
+            moneda CHAR(3),
             created_at TIMESTAMP DEFAULT NOW()
         )
     """)
@@ -68,6 +84,9 @@ try:
         print("Creando índices...")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_referencia ON pagos(referencia)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_estado ON pagos(estado)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_cedula ON pagos(cedula_pagador)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_telefono ON pagos(telefono_pagador)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_fecha_pago ON pagos(fecha_pago)")
         conn.commit()
         print("✅ Índices creados\n")
     
@@ -78,7 +97,7 @@ try:
     print("  ✅ TABLA CREADA EXITOSAMENTE")
     print("="*60)
     print("\nPróximo paso:")
-    print("→ Ejecuta: python app_seguro_simple.py")
+    print("→ Ejecuta las migraciones de índices, totales y reportes (README, sección Migraciones)")
     print()
     
 except psycopg2.OperationalError as e:
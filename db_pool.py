@@ -0,0 +1,265 @@
+"""
+Pool de conexiones PostgreSQL compartido por app.py y banco_api.py
+Versión: 1.0 - Producción
+
+Cada proceso (worker de gunicorn) mantiene su propio pool, creado de forma
+perezosa en el primer uso. Las conexiones se verifican antes de entregarse,
+se reciclan al superar su vida máxima y siempre se devuelven al pool, incluso
+cuando la ruta que las usa lanza una excepción.
+
+Uso:
+    from db_pool import conexion
+
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+import metricas
+import perfiles
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+class PoolAgotadoError(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+
+class ConexionPool(psycopg2.extensions.connection):
+    """Conexión psycopg2 con los metadatos que necesita el pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.creada_en = time.monotonic()
+        self.ultimo_uso = self.creada_en
+        self.preparadas = set()  # Sentencias con PREPARE en esta sesión (ver consultas.py)
+
+
+def parametros_conexion():
+    """Parámetros de conexión leídos del .env"""
+    host = os.getenv("DB_HOST")
+    return {
+        "host": host,
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASS"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "sslmode": "require" if "neon.tech" in (host or "") else "prefer",
+        "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+    }
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones thread-safe con tamaño mínimo/máximo.
+
+    Args:
+        minimo (int): Conexiones que se abren al crear el pool
+        maximo (int): Conexiones simultáneas permitidas (libres + en uso)
+        timeout (float): Segundos máximos de espera por una conexión libre
+        vida_maxima (float): Segundos tras los cuales una conexión se recicla
+        verificar_tras (float): Segundos de inactividad tras los cuales se
+            hace un ``SELECT 1`` antes de entregar la conexión
+    """
+
+    def __init__(self, minimo=1, maximo=10, timeout=5.0, vida_maxima=1800.0, verificar_tras=30.0):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError(f"Tamaño de pool inválido: min={minimo}, max={maximo}")
+
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.verificar_tras = verificar_tras
+
+        self._libres = deque()
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(maximo)
+        self._cerrado = False
+
+        for _ in range(minimo):
+            try:
+                self._libres.append(self._crear())
+            except psycopg2.Error:
+                # La BD puede no estar disponible al arrancar; se reintenta en el primer uso
+                break
+
+    def _crear(self):
+        try:
+            return psycopg2.connect(connection_factory=ConexionPool, **parametros_conexion())
+        except psycopg2.Error as e:
+            logger.error(f"Error de conexión BD: {e}")
+            raise
+
+    @staticmethod
+    def _descartar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _esta_sana(self, conn):
+        """Health check: descarta conexiones cerradas, viejas o que no responden"""
+        if conn.closed:
+            return False
+
+        ahora = time.monotonic()
+        if ahora - conn.creada_en > self.vida_maxima:
+            return False
+
+        if ahora - conn.ultimo_uso > self.verificar_tras:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+
+        return True
+
+    def obtener(self):
+        """Entrega una conexión sana; espera como máximo ``timeout`` segundos"""
+        if self._cerrado:
+            raise PoolAgotadoError("El pool de conexiones está cerrado")
+
+        if not self._cupos.acquire(timeout=self.timeout):
+            logger.error(f"Pool agotado: {self.maximo} conexiones en uso tras {self.timeout}s")
+            raise PoolAgotadoError("No hay conexiones libres en el pool")
+
+        try:
+            while True:
+                with self._lock:
+                    conn = self._libres.pop() if self._libres else None
+
+                if conn is None:
+                    return self._crear()
+
+                if self._esta_sana(conn):
+                    return conn
+
+                self._descartar(conn)
+        except BaseException:
+            self._cupos.release()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve la conexión al pool; las transacciones abiertas se revierten"""
+        try:
+            if self._cerrado or descartar or conn.closed:
+                self._descartar(conn)
+                return
+
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+
+            conn.ultimo_uso = time.monotonic()
+            with self._lock:
+                self._libres.append(conn)
+        except Exception:
+            self._descartar(conn)
+        finally:
+            self._cupos.release()
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres; las que están en uso se cierran al devolverse"""
+        self._cerrado = True
+        with self._lock:
+            libres, self._libres = list(self._libres), deque()
+        for conn in libres:
+            self._descartar(conn)
+
+    def estadisticas(self):
+        """Resumen del estado del pool (para diagnóstico)"""
+        with self._lock:
+            libres = len(self._libres)
+        return {
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "libres": libres,
+            "cerrado": self._cerrado,
+        }
+
+
+# --- POOL DEL PROCESO ---
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool():
+    """
+    Devuelve el pool del proceso actual, creándolo si hace falta.
+
+    Si el proceso fue bifurcado (gunicorn ``--preload``), el pool heredado del
+    padre se abandona sin cerrarlo: sus sockets pertenecen al padre.
+    """
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = PoolConexiones(
+                minimo=int(os.getenv("DB_POOL_MIN", "1")),
+                maximo=int(os.getenv("DB_POOL_MAX", "10")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                vida_maxima=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                verificar_tras=float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30")),
+            )
+            _pool_pid = pid
+            logger.info(f"Pool BD creado (pid {pid}, min={_pool.minimo}, max={_pool.maximo})")
+        return _pool
+
+
+def cerrar_pool():
+    """Cierra el pool del proceso actual (atexit / worker_exit de gunicorn)"""
+    global _pool, _pool_pid
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.cerrar()
+            logger.info(f"Pool BD cerrado (pid {_pool_pid})")
+        _pool = None
+        _pool_pid = None
+
+
+@contextmanager
+def conexion():
+    """
+    Presta una conexión del pool y la devuelve al salir del bloque.
+
+    Si el bloque lanza una excepción, la transacción pendiente se revierte;
+    si el error es de conexión, la conexión se descarta en vez de reutilizarse.
+    """
+    pool = obtener_pool()
+    with metricas.medir(metricas.BD_ESPERA):
+        conn = pool.obtener()
+    if perfiles.HABILITADO:
+        # En una petición perfilada los cursores anotan cada sentencia y su tiempo
+        conn.cursor_factory = perfiles.cursor_del_hilo()
+    descartar = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        descartar = True
+        raise
+    finally:
+        pool.devolver(conn, descartar=descartar)
+
+
+atexit.register(cerrar_pool)
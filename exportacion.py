@@ -0,0 +1,170 @@
+"""
+Exportación de la tabla pagos sin límite de filas
+
+Las filas se leen con un cursor de servidor (named cursor) en bloques de
+``TAMANO_BLOQUE``, así que la memoria usada no depende del total exportado.
+
+- CSV/TSV: se generan línea a línea y el navegador recibe los primeros
+  bytes de inmediato.
+- Excel: se escribe con un workbook write-only de openpyxl en un archivo
+  temporal (el formato .xlsx es un zip y no puede emitirse por partes).
+  Una hoja de Excel admite 1.048.576 filas: al llenarse se sigue en otra
+  ("Pagos 2", "Pagos 3", ...).
+- Las fechas desde/hasta son días de Caracas (VET), como en el panel y los
+  reportes, aunque created_at se guarde con la zona de la sesión.
+"""
+import csv
+import io
+import os
+import tempfile
+import logging
+from datetime import datetime, date
+
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+TAMANO_BLOQUE = int(os.getenv("EXPORT_TAMANO_BLOQUE", "2000"))
+
+COLUMNAS_EXPORTACION = [
+    "id", "fecha_recepcion", "hora_recepcion", "emisor", "monto", "monto_num", "moneda",
+    "referencia", "mensaje_completo", "fecha_canje", "estado", "comanda", "banco",
+    "ip_canje", "cedula_pagador", "telefono_pagador", "banco_origen", "estado_bdv",
+    "fecha_validacion", "fecha_pago", "created_at",
+]
+
+SEPARADORES = {"csv": ",", "tsv": "\t"}
+
+FILAS_POR_HOJA = 1048576 - 1  # Límite de filas de Excel, menos el encabezado
+
+
+def construir_filtro_exportacion(desde=None, hasta=None, banco=None):
+    """
+    Construye el WHERE de la exportación.
+
+    Args:
+        desde (date): Día inicial inclusive, en hora de Caracas
+        hasta (date): Día final inclusive, en hora de Caracas
+        banco (str): Banco exacto (BDV, BANESCO, ...)
+
+    Returns:
+        tuple: (cláusula WHERE o "", parámetros)
+    """
+    condiciones, params = [], []
+    # Los bordes del día VET se llevan a la zona de created_at (usa idx_created_at), como en reportes.py
+    if desde:
+        condiciones.append("created_at >= timezone('America/Caracas', %s::date::timestamp)::timestamp")
+        params.append(desde)
+    if hasta:
+        condiciones.append("created_at < timezone('America/Caracas', (%s::date + 1)::timestamp)::timestamp")
+        params.append(hasta)
+    if banco:
+        condiciones.append("banco = %s")
+        params.append(banco.upper())
+
+    if not condiciones:
+        return "", ()
+    return "WHERE " + " AND ".join(condiciones), tuple(params)
+
+
+def iterar_filas(conn, filtro_sql, filtro_params):
+    """Recorre pagos con un cursor de servidor, sin cargar la tabla en memoria"""
+    with conn.cursor(name="exportacion_pagos") as cur:
+        cur.itersize = TAMANO_BLOQUE
+        cur.execute(f"""
+            SELECT {", ".join(COLUMNAS_EXPORTACION)}
+            FROM pagos
+            {filtro_sql}
+            ORDER BY id DESC
+        """, filtro_params)
+        for fila in cur:
+            yield fila
+
+
+def _celda_texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat(sep=" ") if isinstance(valor, datetime) else valor.isoformat()
+    return str(valor)
+
+
+def generar_csv(filas, formato="csv"):
+    """
+    Genera el CSV/TSV por bloques de texto.
+
+    Se antepone BOM UTF-8 para que Excel reconozca los acentos.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=SEPARADORES.get(formato, ","))
+
+    buffer.write("\ufeff")
+    writer.writerow(COLUMNAS_EXPORTACION)
+
+    pendientes = 0
+    for fila in filas:
+        writer.writerow([_celda_texto(v) for v in fila])
+        pendientes += 1
+        if pendientes >= TAMANO_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+
+    yield buffer.getvalue()
+
+
+def escribir_excel(filas):
+    """
+    Escribe las filas en un .xlsx temporal con un workbook write-only.
+
+    Cada FILAS_POR_HOJA filas se abre una hoja nueva con su encabezado.
+
+    Returns:
+        tuple: (ruta del archivo temporal, hojas escritas); el llamador debe borrar el archivo
+    """
+    wb = Workbook(write_only=True)
+    hojas = 0
+    en_hoja = FILAS_POR_HOJA
+    total = 0
+    for fila in filas:
+        if en_hoja >= FILAS_POR_HOJA:
+            hojas += 1
+            hoja = wb.create_sheet("Pagos" if hojas == 1 else f"Pagos {hojas}")
+            hoja.append(COLUMNAS_EXPORTACION)
+            en_hoja = 0
+        hoja.append(list(fila))
+        en_hoja += 1
+        total += 1
+
+    if hojas == 0:
+        wb.create_sheet("Pagos").append(COLUMNAS_EXPORTACION)
+        hojas = 1
+
+    fd, ruta = tempfile.mkstemp(prefix="export_pagos_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(ruta)
+    except BaseException:
+        borrar_archivo(ruta)
+        raise
+    logger.info(f"Excel generado: {total} filas en {hojas} hoja(s)")
+    return ruta, hojas
+
+
+def transmitir_archivo(ruta, tamano_bloque=64 * 1024):
+    """Emite un archivo por bloques (borrarlo con response.call_on_close(...))"""
+    with open(ruta, "rb") as f:
+        while True:
+            bloque = f.read(tamano_bloque)
+            if not bloque:
+                break
+            yield bloque
+
+
+def borrar_archivo(ruta):
+    """Borra un archivo temporal de exportación si todavía existe"""
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
@@ -0,0 +1,243 @@
+"""
+Motor de extracción de notificaciones bancarias
+Versión: 3.0 - Registro de bancos configurable
+
+Las reglas de cada banco se declaran en bancos.json (ruta configurable con
+BANCOS_CONFIG) y se validan y compilan al iniciar:
+
+    {
+        "nombre": "BDV",                        # Nombre guardado en pagos.banco
+        "deteccion": "BDV|PagomovilBDV",        # Palabras o regex que identifican al banco
+        "emisor": "...", "monto": "...",        # Regex con un grupo de captura
+        "referencia": "...",
+        "formato_monto": "ve",                  # ve = 1.234,56 | en = 1234.56 | auto
+        "moneda": "VES"                         # Código ISO guardado en pagos.moneda
+    }
+
+- Detección: las claves formadas por palabras literales se buscan como
+  subcadenas sobre el texto en minúsculas, sin pasar por el motor de regex.
+  Las claves con sintaxis de regex se compilan con IGNORECASE.
+- Campos: emisor, monto y referencia se buscan con regex ya compiladas, solo
+  para los bancos detectados.
+- Recarga en caliente: cada worker revisa la fecha de modificación del archivo
+  como máximo cada BANCOS_RECARGA_SEGUNDOS y reemplaza el motor completo de
+  forma atómica. Si el archivo nuevo es inválido se conservan las reglas vigentes.
+
+Benchmark: python benchmarks/bench_extractor.py
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RUTA_BANCOS = os.getenv(
+    "BANCOS_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "bancos.json")
+)
+INTERVALO_RECARGA = float(os.getenv("BANCOS_RECARGA_SEGUNDOS", "5"))
+
+CAMPOS = ("emisor", "monto", "referencia")
+FORMATOS_MONTO = ("ve", "en", "auto")
+
+# Clave formada solo por palabras literales separadas por |
+_CLAVE_LITERAL = re.compile(r"^[A-Za-z0-9 ]+(?:\|[A-Za-z0-9 ]+)*$")
+_NOMBRE_BANCO = re.compile(r"^[A-Z0-9_]{2,50}$")
+_MONEDA = re.compile(r"^[A-Z]{3}$")
+MONEDA_POR_DEFECTO = "VES"
+
+
+class ReglasBancoError(ValueError):
+    """La configuración de bancos no es válida"""
+
+
+def compilar_deteccion(clave):
+    """
+    Compila la clave de detección de un banco.
+
+    Returns:
+        tuple | re.Pattern: palabras en minúsculas si la clave es literal,
+        regex compilada en caso contrario
+    """
+    if _CLAVE_LITERAL.match(clave):
+        return tuple(palabra.lower() for palabra in clave.split("|"))
+    return re.compile(clave, re.IGNORECASE)
+
+
+def compilar_campo(campo, patron):
+    """Compila el patrón de un campo; debe tener al menos un grupo de captura"""
+    regex = re.compile(patron, re.IGNORECASE)
+    if regex.groups < 1:
+        raise ReglasBancoError(f"El patrón de '{campo}' no tiene grupo de captura: {patron}")
+    return regex
+
+
+def compilar_banco(regla):
+    """
+    Valida y compila la regla de un banco.
+
+    Returns:
+        tuple: (nombre, detección, (regex emisor, regex monto, regex ref), formato_monto, moneda)
+    """
+    if not isinstance(regla, dict):
+        raise ReglasBancoError(f"Regla de banco inválida: {regla!r}")
+
+    nombre = regla.get("nombre")
+    if not isinstance(nombre, str) or not _NOMBRE_BANCO.match(nombre):
+        raise ReglasBancoError(f"Nombre de banco inválido: {nombre!r} (mayúsculas, números o _)")
+
+    for clave in ("deteccion",) + CAMPOS:
+        if not isinstance(regla.get(clave), str) or not regla[clave]:
+            raise ReglasBancoError(f"{nombre}: falta '{clave}'")
+
+    formato = regla.get("formato_monto", "auto")
+    if formato not in FORMATOS_MONTO:
+        raise ReglasBancoError(f"{nombre}: formato_monto debe ser uno de {FORMATOS_MONTO}")
+
+    moneda = regla.get("moneda", MONEDA_POR_DEFECTO)
+    if not isinstance(moneda, str) or not _MONEDA.match(moneda):
+        raise ReglasBancoError(f"{nombre}: moneda debe ser un código ISO de 3 letras")
+
+    try:
+        deteccion = compilar_deteccion(regla["deteccion"])
+        campos = tuple(compilar_campo(campo, regla[campo]) for campo in CAMPOS)
+    except re.error as e:
+        raise ReglasBancoError(f"{nombre}: regex inválida: {e}") from e
+
+    return nombre, deteccion, campos, formato, moneda
+
+
+def compilar_motor(reglas):
+    """
+    Compila un motor de extracción a partir de la lista de reglas de bancos.
+
+    Returns:
+        tuple: motor inmutable, en el orden de declaración
+    """
+    if not isinstance(reglas, list) or not reglas:
+        raise ReglasBancoError("La configuración debe tener una lista 'bancos' no vacía")
+
+    motor = tuple(compilar_banco(regla) for regla in reglas)
+    nombres = [banco[0] for banco in motor]
+    if len(set(nombres)) != len(nombres):
+        raise ReglasBancoError("Hay bancos repetidos en la configuración")
+    return motor
+
+
+def cargar_motor(ruta=RUTA_BANCOS):
+    """Lee, valida y compila el archivo de bancos"""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ReglasBancoError(f"No se pudo leer {ruta}: {e}") from e
+
+    if not isinstance(datos, dict):
+        raise ReglasBancoError("La configuración debe ser un objeto con la clave 'bancos'")
+    return compilar_motor(datos.get("bancos"))
+
+
+# --- MOTOR ACTIVO (se reemplaza completo al recargar) ---
+_lock_recarga = threading.Lock()
+_motor = cargar_motor()
+_mtime = os.path.getmtime(RUTA_BANCOS)
+_proxima_revision = time.monotonic() + INTERVALO_RECARGA
+
+
+def recargar_motor(forzar=False):
+    """
+    Recarga las reglas si el archivo cambió (o siempre, con ``forzar``).
+
+    Returns:
+        bool: True si se instaló un motor nuevo
+
+    Raises:
+        ReglasBancoError: si el archivo nuevo es inválido (el motor vigente se conserva)
+    """
+    global _motor, _mtime
+
+    with _lock_recarga:
+        mtime = os.path.getmtime(RUTA_BANCOS)
+        if not forzar and mtime == _mtime:
+            return False
+
+        nuevo = cargar_motor()
+        _motor, _mtime = nuevo, mtime
+
+    logger.info(f"Reglas de bancos recargadas: {', '.join(obtener_bancos())}")
+    return True
+
+
+def obtener_motor():
+    """Motor vigente; revisa cambios en el archivo como máximo cada INTERVALO_RECARGA segundos"""
+    global _proxima_revision
+
+    ahora = time.monotonic()
+    if ahora >= _proxima_revision:
+        _proxima_revision = ahora + INTERVALO_RECARGA
+        try:
+            recargar_motor()
+        except (ReglasBancoError, OSError) as e:
+            logger.error(f"Reglas de bancos no recargadas, se mantienen las vigentes: {e}")
+    return _motor
+
+
+def obtener_bancos():
+    """Nombres de los bancos del motor vigente"""
+    return [banco[0] for banco in _motor]
+
+
+def _regla_de_banco(banco):
+    nombre = (banco or "").upper()
+    for regla in obtener_motor():
+        if regla[0] == nombre:
+            return regla
+    return None
+
+
+def moneda_de_banco(banco):
+    """Código ISO de la moneda en la que liquida el banco según su regla; VES si no tiene regla"""
+    regla = _regla_de_banco(banco)
+    return regla[4] if regla else MONEDA_POR_DEFECTO
+
+
+def formato_de_banco(banco):
+    """formato_monto de la regla del banco (el mismo con el que el webhook lee sus montos); "auto" si no tiene regla"""
+    regla = _regla_de_banco(banco)
+    return regla[3] if regla else "auto"
+
+
+def extraer_candidatos(texto, motor=None):
+    """
+    Extrae los pagos candidatos del texto (sin validar).
+
+    Returns:
+        list: [{"emisor", "monto", "referencia", "banco", "formato_monto", "moneda"}, ...]
+        en el orden de declaración de los bancos; un campo ausente queda en None
+    """
+    candidatos = []
+    minusculas = texto.lower()
+
+    for banco, deteccion, (re_emi, re_mon, re_ref), formato, moneda in motor or obtener_motor():
+        if type(deteccion) is tuple:
+            if not any(palabra in minusculas for palabra in deteccion):
+                continue
+        elif not deteccion.search(texto):
+            continue
+
+        m_emi = re_emi.search(texto)
+        m_mon = re_mon.search(texto)
+        m_ref = re_ref.search(texto)
+        candidatos.append({
+            "emisor": m_emi.group(1) if m_emi else None,
+            "monto": m_mon.group(1) if m_mon else None,
+            "referencia": m_ref.group(1) if m_ref else None,
+            "banco": banco,
+            "formato_monto": formato,
+            "moneda": moneda,
+        })
+
+    return candidatos
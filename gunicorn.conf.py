@@ -0,0 +1,48 @@
+"""
+Configuración de gunicorn para Sistemas MV
+Ejecución: gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+# Métricas de Prometheus compartidas entre workers (metricas.py): debe definirse
+# antes de que cualquier worker importe prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "notipagos_metricas"))
+
+
+def on_starting(server):
+    # Los archivos de un arranque anterior sumarían valores de workers que ya no existen
+    directorio = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # Cada worker crea su propio pool en el primer uso; nunca se comparten sockets con el master
+    import db_pool
+    db_pool.cerrar_pool()
+
+
+def post_worker_init(worker):
+    # El hilo consumidor de la cola del webhook debe arrancar dentro del worker, no en el master
+    from app import iniciar_consumidor_webhook
+    iniciar_consumidor_webhook()
+
+
+def worker_exit(server, worker):
+    # Cierre ordenado de las conexiones del worker (reinicios, max_requests, SIGTERM)
+    import db_pool
+    db_pool.cerrar_pool()
+
+
+def child_exit(server, worker):
+    # Contadores e histogramas del worker muerto se conservan en sus archivos; esto solo
+    # retira sus gauges "live" (ninguno por ahora), como recomienda prometheus_client
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
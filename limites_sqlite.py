@@ -0,0 +1,229 @@
+"""
+Almacenamiento de Flask-Limiter compartido por los workers (SQLite)
+Versión: 1.0 - Producción
+
+Con el almacenamiento en memoria cada worker de gunicorn lleva su propia
+cuenta y "10 per minute" en /verificar se convierte en 10 x GUNICORN_WORKERS.
+Este backend guarda los contadores en un archivo SQLite (modo WAL) que
+comparten todos los procesos de la máquina:
+
+    RATELIMIT_STORAGE_URI=sqlite:////home/ubuntu/pagos/limites.db
+
+Implementa la estrategia sliding-window-counter de ``limits`` (ventana fija
+actual más la anterior ponderada por el tiempo que le queda) y también
+fixed-window. Cada comprobación es una sola sentencia: un UPSERT que solo
+escribe si la cuenta ponderada no supera el límite, así que el bloqueo de
+escritura dura lo que tarda SQLite en ejecutarla, sin Python de por medio.
+
+python benchmarks/bench_limites.py en una máquina de 1 CPU, 5000
+comprobaciones por proceso:
+
+    1 proceso      p50 ~30 µs   p99 ~0.08 ms   máx ~5 ms
+    3 procesos     p50 ~36 µs   p99 ~4 ms      máx ~20 ms
+    4 procesos     p50 ~35 µs   p99 ~5-7 ms    máx ~25-30 ms
+
+Menos de 1 ms solo se cumple sin contención. Con más workers que CPU, el
+que espera el bloqueo reintenta cada 50 µs a 2 ms, y el que lo tiene puede
+quedar sin CPU a mitad de la sentencia. Aun con un archivo por proceso (sin
+bloqueo compartido), 4 procesos en 1 CPU dan p99 ~1 ms y máximo ~30 ms: el
+máximo lo pone el planificador del sistema, no SQLite.
+
+Para varias máquinas, usar un servidor compatible con Redis (Redis, Valkey,
+KeyDB) con el backend nativo de ``limits``: RATELIMIT_STORAGE_URI=redis://...
+
+Importar este módulo registra el esquema ``sqlite://`` en ``limits``.
+"""
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+
+ESPERA_MAXIMA = 5  # Segundos esperando el bloqueo de escritura antes de fallar
+CON_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Suma al contador; uno vencido vuelve a empezar
+INCREMENTAR = """
+    INSERT INTO limites (clave, valor, expira) VALUES (?, ?, ?)
+    ON CONFLICT (clave) DO UPDATE SET
+        valor = CASE WHEN expira <= ? THEN excluded.valor ELSE valor + excluded.valor END,
+        expira = CASE WHEN expira <= ? THEN excluded.expira ELSE expira END
+"""
+
+# Como INCREMENTAR, pero el SELECT no produce fila (y no se escribe nada) si
+# floor(anterior * ttl_anterior / expiry + actual) + cantidad supera el límite.
+# ttl_anterior se calcula con el borde de la ventana (ver _ttl_anterior), no con
+# la columna expira: esa es el primer golpe + 2 x expiry y pesaría hasta el doble
+ADQUIRIR_VENTANA = """
+    INSERT INTO limites (clave, valor, expira)
+    SELECT :actual, :cantidad, :expira
+    WHERE CAST(
+        COALESCE((SELECT valor FROM limites WHERE clave = :anterior AND expira > :ahora), 0)
+            * :ttl_anterior / :expiry
+        + COALESCE((SELECT valor FROM limites WHERE clave = :actual AND expira > :ahora), 0)
+    AS INTEGER) + :cantidad <= :limite
+    ON CONFLICT (clave) DO UPDATE SET
+        valor = CASE WHEN expira <= :ahora THEN excluded.valor ELSE valor + excluded.valor END,
+        expira = CASE WHEN expira <= :ahora THEN excluded.expira ELSE expira END
+"""
+
+
+class AlmacenSQLite(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Contadores con vencimiento en un archivo SQLite.
+
+    Args:
+        uri (str): sqlite:///relativa.db o sqlite:////ruta/absoluta.db
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, **opciones):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **opciones)
+        self.ruta = uri.split("://", 1)[1][1:] or "limites.db"
+        self._local = threading.local()
+        self._escrituras = 0
+        self._conexion()
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        # timeout=0: las esperas por el bloqueo de escritura las hace _reintentar
+        conn = sqlite3.connect(self.ruta, timeout=0, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")  # Solo para crear el esquema
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS limites (
+                clave TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL,
+                expira REAL NOT NULL
+            )
+        """)
+        conn.execute("PRAGMA busy_timeout=0")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _reintentar(self, operacion):
+        # El manejador de espera de SQLite duerme de 1 a 100 ms; aquí se reintenta cada pocos µs
+        limite = time.monotonic() + ESPERA_MAXIMA
+        pausa = 0.00005
+        while True:
+            try:
+                return operacion()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or time.monotonic() > limite:
+                    raise
+                time.sleep(pausa)
+                pausa = min(pausa * 2, 0.002)
+
+    def _escribir(self, sql, parametros):
+        """Una sentencia de escritura en su propia transacción (autocommit)"""
+        conn = self._conexion()
+        return self._reintentar(lambda: conn.execute(sql, parametros))
+
+    @contextmanager
+    def _transaccion(self):
+        # IMMEDIATE: varias sentencias sin que otro worker se cuele entre medio
+        conn = self._conexion()
+        self._reintentar(lambda: conn.execute("BEGIN IMMEDIATE"))
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _leer(self, conn, clave, ahora):
+        """(valor, segundos restantes) del contador; (0, 0) si no existe o venció"""
+        fila = conn.execute("SELECT valor, expira FROM limites WHERE clave = ?", (clave,)).fetchone()
+        if fila is None or fila[1] <= ahora:
+            return 0, 0.0
+        return fila[0], fila[1] - ahora
+
+    def _limpiar(self, ahora):
+        # Limpieza ocasional de contadores vencidos
+        self._escrituras += 1
+        if self._escrituras % 1000 == 0:
+            self._escribir("DELETE FROM limites WHERE expira <= ?", (ahora,))
+
+    # --- fixed-window ---
+
+    def incr(self, key, expiry, amount=1):
+        ahora = time.time()
+        parametros = (key, amount, ahora + expiry, ahora, ahora)
+        if CON_RETURNING:
+            valor = self._escribir(INCREMENTAR + " RETURNING valor", parametros).fetchone()[0]
+        else:
+            with self._transaccion() as conn:
+                conn.execute(INCREMENTAR, parametros)
+                valor = conn.execute("SELECT valor FROM limites WHERE clave = ?", (key,)).fetchone()[0]
+        self._limpiar(ahora)
+        return valor
+
+    def get(self, key):
+        return self._leer(self._conexion(), key, time.time())[0]
+
+    def get_expiry(self, key):
+        fila = self._conexion().execute("SELECT expira FROM limites WHERE clave = ?", (key,)).fetchone()
+        return fila[0] if fila and fila[0] > time.time() else time.time()
+
+    def check(self):
+        try:
+            self._conexion().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._escribir("DELETE FROM limites", ()).rowcount
+
+    def clear(self, key):
+        self._escribir("DELETE FROM limites WHERE clave = ?", (key,))
+
+    # --- sliding-window-counter ---
+
+    @staticmethod
+    def _ttl_anterior(ahora, expiry):
+        """Segundos que le quedan a la ventana anterior en el cálculo ponderado (igual que ``limits``)"""
+        return (1 - ((ahora - expiry) / expiry) % 1) * expiry
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        ahora = time.time()
+        anterior, actual = self.sliding_window_keys(key, expiry, ahora)
+        # La ventana actual pasa a ser la anterior: vive el doble
+        cursor = self._escribir(ADQUIRIR_VENTANA, {
+            "actual": actual, "anterior": anterior, "cantidad": amount, "limite": limit,
+            "ahora": ahora, "expiry": expiry, "expira": ahora + 2 * expiry,
+            "ttl_anterior": self._ttl_anterior(ahora, expiry),
+        })
+        self._limpiar(ahora)
+        return cursor.rowcount > 0
+
+    def get_sliding_window(self, key, expiry):
+        conn = self._conexion()
+        ahora = time.time()
+        anterior, actual = self.sliding_window_keys(key, expiry, ahora)
+        cuenta_anterior = self._leer(conn, anterior, ahora)[0]
+        cuenta_actual = self._leer(conn, actual, ahora)[0]
+        ttl_anterior = self._ttl_anterior(ahora, expiry) if cuenta_anterior else 0.0
+        ttl_actual = (1 - (ahora / expiry) % 1) * expiry + expiry
+        return cuenta_anterior, ttl_anterior, cuenta_actual, ttl_actual
+
+    def clear_sliding_window(self, key, expiry):
+        anterior, actual = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(anterior)
+        self.clear(actual)
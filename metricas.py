@@ -0,0 +1,124 @@
+"""
+Métricas de Prometheus de la aplicación (/metrics)
+Versión: 1.0 - Producción
+
+Qué se mide:
+- notipagos_http_peticion_segundos        latencia por endpoint Flask y método
+- notipagos_http_peticiones_total         peticiones por endpoint, método y código HTTP
+- notipagos_bd_espera_conexion_segundos   espera por una conexión del pool (get_db_connection)
+- notipagos_bd_consulta_segundos          tiempo de las consultas frecuentes (consultas.py y búsquedas del panel)
+- notipagos_bdv_consulta_segundos         llamadas al API BDV (sin caché) por código de resultado
+- notipagos_extractor_segundos            extracción de una notificación, por banco detectado
+- notipagos_webhook_pagos_total           pagos del webhook insertados o duplicados, por banco
+
+Bajo gunicorn cada worker escribe sus valores en archivos mmap dentro de
+PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py lo define y lo vacía al
+arrancar) y /metrics suma los de todos los workers. Fuera de gunicorn se usa
+el registro del proceso. Registrar un valor cuesta unos pocos microsegundos.
+
+Benchmark: python benchmarks/bench_metricas.py
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_BD = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+BUCKETS_BDV = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 20, 30)
+BUCKETS_EXTRACTOR = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+HTTP_SEGUNDOS = Histogram(
+    "notipagos_http_peticion_segundos", "Latencia de las peticiones por endpoint",
+    ["endpoint", "metodo"], buckets=BUCKETS_HTTP,
+)
+HTTP_PETICIONES = Counter(
+    "notipagos_http_peticiones", "Peticiones por endpoint y código HTTP",
+    ["endpoint", "metodo", "codigo"],
+)
+BD_ESPERA = Histogram(
+    "notipagos_bd_espera_conexion_segundos", "Espera por una conexión del pool",
+    buckets=BUCKETS_BD,
+)
+BD_CONSULTA = Histogram(
+    "notipagos_bd_consulta_segundos", "Tiempo de las consultas frecuentes",
+    ["consulta"], buckets=BUCKETS_BD,
+)
+BDV_SEGUNDOS = Histogram(
+    "notipagos_bdv_consulta_segundos", "Llamadas al API de Conciliación BDV por código de resultado",
+    ["codigo"], buckets=BUCKETS_BDV,
+)
+EXTRACTOR_SEGUNDOS = Histogram(
+    "notipagos_extractor_segundos", "Extracción de una notificación por banco detectado",
+    ["banco"], buckets=BUCKETS_EXTRACTOR,
+)
+WEBHOOK_PAGOS = Counter(
+    "notipagos_webhook_pagos", "Pagos recibidos por el webhook",
+    ["banco", "resultado"],
+)
+
+
+@contextmanager
+def medir(histograma):
+    """Observa la duración del bloque en un histograma (o hijo con etiquetas)"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.observe(time.perf_counter() - inicio)
+
+
+def exponer():
+    """
+    Métricas en formato de texto de Prometheus.
+
+    Returns:
+        tuple: (bytes, content-type)
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
+
+
+def instrumentar(app):
+    """
+    Mide cada petición de la app Flask.
+
+    Llamar justo después de crear la app: los after_request se ejecutan en
+    orden inverso al registro, así que este corre el último (después de la
+    compresión) y mide la respuesta completa.
+    """
+    from flask import g, request
+
+    # Hijos ya etiquetados por (regla, método, código): labels() cuesta más que observe()
+    series = {}
+
+    @app.before_request
+    def _inicio_peticion():
+        g.metricas_inicio = time.perf_counter()
+
+    @app.after_request
+    def _fin_peticion(response):
+        inicio = g.pop("metricas_inicio", None)
+        if inicio is None:
+            return response
+
+        peticion = request._get_current_object()
+        # La regla (/estilos.<huella>.css), no la URL, para no crear una serie por URL
+        regla = peticion.url_rule.rule if peticion.url_rule else "sin_ruta"
+        clave = (regla, peticion.method, response.status_code)
+        hijos = series.get(clave)
+        if hijos is None:
+            hijos = series[clave] = (
+                HTTP_SEGUNDOS.labels(regla, peticion.method),
+                HTTP_PETICIONES.labels(regla, peticion.method, str(response.status_code)),
+            )
+        hijos[0].observe(time.perf_counter() - inicio)
+        hijos[1].inc()
+        return response
@@ -39,7 +39,8 @@ try:
         ("banco_origen", "VARCHAR(10)"),
         ("estado_bdv", "VARCHAR(10)"),
         ("fecha_validacion", "TIMESTAMP"),
-        ("fecha_pago", "DATE")
+        ("fecha_pago", "DATE"),
+        ("fecha_registro", "TIMESTAMP")
     ]
     
     for columna, tipo in columnas_nuevas:
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Script para crear los índices de búsqueda del panel administrativo
+Ejecución: python migrate_busqueda.py
+
+Requiere haber ejecutado migrate_montos.py (columna monto_num).
+Crea índices GIN de trigramas (pg_trgm) para las búsquedas de subcadena
+y B-tree para las búsquedas con prefijo (ref:, comanda:, banco:, monto:).
+"""
+
+import psycopg2
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+print("\n" + "="*60)
+print("  MIGRACIÓN: Índices de búsqueda en tabla 'pagos'")
+print("="*60 + "\n")
+
+try:
+    # Conectar
+    print("Conectando a BD...")
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode="require" if "neon.tech" in (os.getenv("DB_HOST") or "") else "disable",
+        connect_timeout=5
+    )
+    print("✅ Conexión exitosa\n")
+
+    # CREATE INDEX CONCURRENTLY no admite transacción y no bloquea escrituras
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    print("Activando extensión pg_trgm...")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        print("  ✅ Extensión pg_trgm disponible")
+    except Exception as e:
+        print(f"  ⚠️  pg_trgm: {e}")
+
+    print("\nCreando índices de búsqueda...")
+    indices = [
+        # Subcadena (ILIKE '%texto%')
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trgm_referencia ON pagos USING gin (referencia gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trgm_comanda ON pagos USING gin (comanda gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trgm_emisor ON pagos USING gin (emisor gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_trgm_banco ON pagos USING gin (banco gin_trgm_ops)",
+        # Búsquedas exactas por prefijo
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comanda ON pagos(comanda)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_banco ON pagos(banco)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_monto_num ON pagos(monto_num)"
+    ]
+
+    for idx in indices:
+        try:
+            cur.execute(idx)
+            print(f"  ✅ Índice creado")
+        except Exception as e:
+            print(f"  ⚠️  {e}")
+
+    cur.execute("ANALYZE pagos")
+
+    cur.close()
+    conn.close()
+
+    print("\n" + "="*60)
+    print("  ✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+    print("="*60)
+    print("\nEl buscador del panel ahora usa índices")
+    print()
+
+except psycopg2.OperationalError as e:
+    print(f"❌ Error de conexión: {e}\n")
+    exit(1)
+
+except Exception as e:
+    print(f"❌ Error inesperado: {e}")
+    import traceback
+    traceback.print_exc()
+    exit(1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Script para agregar monto numérico y moneda a la tabla pagos
+Ejecución: python migrate_montos.py [tamaño_lote]
+
+Agrega pagos.monto_num NUMERIC(14,2) y pagos.moneda CHAR(3) y los rellena
+por lotes a partir del texto de pagos.monto, leído con el mismo formato que
+al insertar: el formato_monto del banco en bancos.json para los pagos del
+webhook y el del API BDV para los registrados desde /validar-pago-bdv (con
+banco_origen, columna de migrate_bdv.py). Cada lote se confirma por
+separado, así que la tabla nunca queda bloqueada por mucho tiempo y el
+script puede re-ejecutarse si se interrumpe.
+"""
+
+import sys
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+import os
+
+from montos import normalizar_monto, FORMATO_API_BDV
+from extractor import moneda_de_banco, formato_de_banco
+
+load_dotenv()
+
+TAMANO_LOTE = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+print("\n" + "="*60)
+print("  MIGRACIÓN: Monto numérico y moneda en tabla 'pagos'")
+print("="*60 + "\n")
+
+try:
+    # Conectar
+    print("Conectando a BD...")
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode="require" if "neon.tech" in (os.getenv("DB_HOST") or "") else "disable",
+        connect_timeout=5
+    )
+    print("✅ Conexión exitosa\n")
+
+    cur = conn.cursor()
+
+    # Agregar columnas si no existen (sin DEFAULT: solo cambia el catálogo, no reescribe la tabla)
+    print("Agregando columnas de monto normalizado...")
+
+    columnas_nuevas = [
+        ("monto_num", "NUMERIC(14,2)"),
+        ("moneda", "CHAR(3)")
+    ]
+
+    for columna, tipo in columnas_nuevas:
+        try:
+            cur.execute(f"""
+                ALTER TABLE pagos
+                ADD COLUMN IF NOT EXISTS {columna} {tipo}
+            """)
+            print(f"  ✅ Columna '{columna}' agregada")
+        except Exception as e:
+            print(f"  ⚠️  Columna '{columna}': {e}")
+
+    conn.commit()
+
+    # Rellenar por lotes, recorriendo por id
+    print(f"\nRellenando monto_num/moneda en lotes de {TAMANO_LOTE}...")
+    ultimo_id = 0
+    actualizados = 0
+    invalidos = 0
+
+    while True:
+        cur.execute("""
+            SELECT id, monto, banco, banco_origen IS NOT NULL FROM pagos
+            WHERE id > %s AND moneda IS NULL
+            ORDER BY id
+            LIMIT %s
+        """, (ultimo_id, TAMANO_LOTE))
+        filas = cur.fetchall()
+        if not filas:
+            break
+
+        valores = []
+        for pago_id, monto, banco, desde_api in filas:
+            # Mismo formato que al insertar: el del API BDV o el de la regla del banco en el webhook
+            monto_num = normalizar_monto(monto, FORMATO_API_BDV if desde_api else formato_de_banco(banco))
+            if monto_num is None:
+                invalidos += 1
+            valores.append((pago_id, monto_num, moneda_de_banco(banco)))
+
+        execute_values(cur, """
+            UPDATE pagos AS p
+            SET monto_num = v.monto_num::numeric, moneda = v.moneda
+            FROM (VALUES %s) AS v (id, monto_num, moneda)
+            WHERE p.id = v.id
+        """, valores)
+        conn.commit()
+
+        ultimo_id = filas[-1][0]
+        actualizados += len(filas)
+        print(f"  ✅ {actualizados} registros procesados (hasta id {ultimo_id})")
+
+    if invalidos:
+        print(f"  ⚠️  {invalidos} montos no reconocidos quedaron con monto_num NULL")
+
+    # Crear índices sin bloquear escrituras (CONCURRENTLY no admite transacción)
+    print("\nCreando índices adicionales...")
+    conn.autocommit = True
+    indices = [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_moneda_monto ON pagos(moneda, monto_num)"
+    ]
+
+    for idx in indices:
+        try:
+            cur.execute(idx)
+            print(f"  ✅ Índice creado")
+        except Exception as e:
+            print(f"  ⚠️  {e}")
+
+    cur.close()
+    conn.close()
+
+    print("\n" + "="*60)
+    print("  ✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+    print("="*60)
+    print("\nLa tabla 'pagos' ahora tiene monto_num y moneda")
+    print()
+
+except psycopg2.OperationalError as e:
+    print(f"❌ Error de conexión: {e}\n")
+    exit(1)
+
+except Exception as e:
+    print(f"❌ Error inesperado: {e}")
+    import traceback
+    traceback.print_exc()
+    exit(1)
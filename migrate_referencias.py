@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Script para indexar los últimos 6 dígitos de la referencia
+Ejecución: python migrate_referencias.py
+
+/verificar busca las referencias cortas con right(referencia, 6) = %s.
+Este índice de expresión mantiene esa búsqueda en O(log n) en vez de
+recorrer toda la tabla como hacía LIKE '%123456'.
+"""
+
+import psycopg2
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+print("\n" + "="*60)
+print("  MIGRACIÓN: Índice de sufijo de referencia en 'pagos'")
+print("="*60 + "\n")
+
+try:
+    # Conectar
+    print("Conectando a BD...")
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode="require" if "neon.tech" in (os.getenv("DB_HOST") or "") else "disable",
+        connect_timeout=5
+    )
+    print("✅ Conexión exitosa\n")
+
+    # CREATE INDEX CONCURRENTLY no admite transacción y no bloquea escrituras
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    print("Creando índices de referencia...")
+    indices = [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_referencia_sufijo ON pagos (right(referencia, 6))"
+    ]
+
+    for idx in indices:
+        try:
+            cur.execute(idx)
+            print(f"  ✅ Índice creado")
+        except Exception as e:
+            print(f"  ⚠️  {e}")
+
+    # Actualizar estadísticas para que el planificador use el índice de expresión
+    cur.execute("ANALYZE pagos")
+
+    # Verificar plan de la búsqueda por sufijo
+    print("\nVerificando plan de búsqueda...")
+    cur.execute("EXPLAIN SELECT id FROM pagos WHERE right(referencia, 6) = %s", ("123456",))
+    for (linea,) in cur.fetchall():
+        print(f"  {linea}")
+
+    cur.close()
+    conn.close()
+
+    print("\n" + "="*60)
+    print("  ✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+    print("="*60)
+    print("\nLa búsqueda por últimos 6 dígitos ahora usa índice")
+    print()
+
+except psycopg2.OperationalError as e:
+    print(f"❌ Error de conexión: {e}\n")
+    exit(1)
+
+except Exception as e:
+    print(f"❌ Error inesperado: {e}")
+    import traceback
+    traceback.print_exc()
+    exit(1)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Script para crear el resumen por hora de pagos (reportes de cierre de turno)
+Ejecución: python migrate_reportes.py [--reconstruir | --verificar]
+
+Crea pagos_resumen: una fila por (hora VET, banco, estado, moneda) con la
+cantidad de pagos y la suma de monto_num. /admin/reportes lee rangos de esta
+tabla: un mes son unas pocas centenas de filas en vez de toda la tabla pagos.
+
+El resumen se mantiene de forma incremental:
+- Triggers por sentencia anotan en pagos_resumen_pendientes las horas que
+  tocó cada INSERT, DELETE o UPDATE de banco/estado/moneda/monto/created_at
+  (un canje anota la hora del pago canjeado). Solo INSERT: no hay filas que
+  bloquear entre transacciones. TRUNCATE pagos vacía el resumen y las horas
+  pendientes.
+- actualizar_reportes.py (cron) o el propio /admin/reportes recalculan solo
+  esas horas con un GROUP BY sobre el rango de created_at (idx_created_at).
+
+    (sin opciones)  instala índice, tablas, funciones y triggers, y reconstruye
+    --reconstruir   recalcula pagos_resumen desde cero
+    --verificar     compara pagos_resumen con un GROUP BY real (código 1 si difieren)
+"""
+
+import sys
+import psycopg2
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+MODO = sys.argv[1] if len(sys.argv) > 1 else "--instalar"
+
+INSTALACION = [
+    """
+    CREATE TABLE IF NOT EXISTS pagos_resumen (
+        hora TIMESTAMP NOT NULL,      -- Inicio de la hora en VET (America/Caracas)
+        banco VARCHAR(50) NOT NULL,   -- '' para pagos sin banco
+        estado VARCHAR(50) NOT NULL,
+        moneda CHAR(3) NOT NULL,      -- '' para pagos sin moneda (anteriores a migrate_montos.py)
+        cantidad BIGINT NOT NULL DEFAULT 0,
+        total NUMERIC(18,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (hora, banco, estado, moneda)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pagos_resumen_pendientes (
+        hora TIMESTAMP NOT NULL
+    )
+    """,
+    # created_at se guarda con la zona de la sesión (NOW()); la hora del reporte es la de Caracas
+    """
+    CREATE OR REPLACE FUNCTION pagos_resumen_hora(ts TIMESTAMP) RETURNS TIMESTAMP AS $$
+        SELECT date_trunc('hour', timezone('America/Caracas', ts::timestamptz))
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION pagos_resumen_reconstruir() RETURNS void AS $$
+    BEGIN
+        -- Bloquea escrituras sobre pagos (no lecturas) mientras recalcula
+        LOCK TABLE pagos IN SHARE ROW EXCLUSIVE MODE;
+        DELETE FROM pagos_resumen;
+        DELETE FROM pagos_resumen_pendientes;
+        INSERT INTO pagos_resumen (hora, banco, estado, moneda, cantidad, total)
+        SELECT pagos_resumen_hora(created_at), COALESCE(banco, ''), COALESCE(estado, ''),
+               COALESCE(moneda, ''), COUNT(*), COALESCE(SUM(monto_num), 0)
+        FROM pagos
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION pagos_resumen_marcar() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO pagos_resumen_pendientes (hora)
+            SELECT DISTINCT pagos_resumen_hora(created_at) FROM nuevas WHERE created_at IS NOT NULL;
+
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO pagos_resumen_pendientes (hora)
+            SELECT DISTINCT pagos_resumen_hora(created_at) FROM viejas WHERE created_at IS NOT NULL;
+
+        ELSIF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM pagos_resumen;
+            DELETE FROM pagos_resumen_pendientes;
+
+        ELSE
+            -- UPDATE: solo las filas que cambian de bucket o de monto (hora anterior y nueva)
+            INSERT INTO pagos_resumen_pendientes (hora)
+            SELECT DISTINCT pagos_resumen_hora(t.created_at)
+            FROM viejas v
+            JOIN nuevas n ON n.id = v.id
+            CROSS JOIN LATERAL (VALUES (v.created_at), (n.created_at)) AS t(created_at)
+            WHERE (v.banco, v.estado, v.moneda, v.monto_num, v.created_at)
+                  IS DISTINCT FROM (n.banco, n.estado, n.moneda, n.monto_num, n.created_at)
+              AND t.created_at IS NOT NULL;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS pagos_resumen_insert ON pagos",
+    "DROP TRIGGER IF EXISTS pagos_resumen_update ON pagos",
+    "DROP TRIGGER IF EXISTS pagos_resumen_delete ON pagos",
+    "DROP TRIGGER IF EXISTS pagos_resumen_truncate ON pagos",
+    """
+    CREATE TRIGGER pagos_resumen_insert AFTER INSERT ON pagos
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_resumen_marcar()
+    """,
+    """
+    CREATE TRIGGER pagos_resumen_update AFTER UPDATE ON pagos
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_resumen_marcar()
+    """,
+    """
+    CREATE TRIGGER pagos_resumen_delete AFTER DELETE ON pagos
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_resumen_marcar()
+    """,
+    # TRUNCATE no dispara los triggers de DELETE
+    """
+    CREATE TRIGGER pagos_resumen_truncate AFTER TRUNCATE ON pagos
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_resumen_marcar()
+    """,
+]
+
+print("\n" + "="*60)
+print("  MIGRACIÓN: Resumen por hora en 'pagos_resumen'")
+print("="*60 + "\n")
+
+try:
+    # Conectar
+    print("Conectando a BD...")
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode="require" if "neon.tech" in (os.getenv("DB_HOST") or "") else "disable",
+        connect_timeout=5
+    )
+    print("✅ Conexión exitosa\n")
+
+    cur = conn.cursor()
+
+    if MODO == "--instalar":
+        # CREATE INDEX CONCURRENTLY no admite transacción y no bloquea escrituras
+        print("Creando índice sobre created_at...")
+        conn.autocommit = True
+        cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_created_at ON pagos(created_at)")
+        conn.autocommit = False
+        print("  ✅ Índice creado")
+
+        # Todo en una transacción: triggers y reconstrucción quedan consistentes
+        print("\nCreando tablas, funciones y triggers...")
+        for sentencia in INSTALACION:
+            cur.execute(sentencia)
+        print("  ✅ Triggers instalados")
+
+    if MODO in ("--instalar", "--reconstruir"):
+        print("\nReconstruyendo resumen desde cero...")
+        cur.execute("SELECT pagos_resumen_reconstruir()")
+        conn.commit()
+        cur.execute("SELECT COUNT(*), COUNT(DISTINCT hora) FROM pagos_resumen")
+        filas, horas = cur.fetchone()
+        print(f"  ✅ {filas} filas de resumen ({horas} horas con pagos)")
+
+    # Verificar contra un GROUP BY real (las horas pendientes aún no están al día)
+    print("\nVerificando resumen...")
+    cur.execute("""
+        WITH real AS (
+            SELECT pagos_resumen_hora(created_at) AS hora, COALESCE(banco, '') AS banco,
+                   COALESCE(estado, '') AS estado, COALESCE(moneda, '') AS moneda,
+                   COUNT(*) AS cantidad, COALESCE(SUM(monto_num), 0) AS total
+            FROM pagos
+            WHERE created_at IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        )
+        SELECT COALESCE(r.hora, m.hora)::date, COUNT(*)
+        FROM real r
+        FULL JOIN pagos_resumen m
+          ON m.hora = r.hora AND m.banco = r.banco AND m.estado = r.estado AND m.moneda = r.moneda
+        WHERE (r.cantidad, r.total) IS DISTINCT FROM (m.cantidad, m.total)
+          AND COALESCE(r.hora, m.hora) NOT IN (SELECT hora FROM pagos_resumen_pendientes)
+        GROUP BY 1
+        ORDER BY 1
+    """)
+    diferencias = cur.fetchall()
+    for dia, buckets in diferencias:
+        print(f"  ❌ {dia}: {buckets} buckets con diferencias")
+    cur.execute("SELECT COUNT(DISTINCT hora) FROM pagos_resumen_pendientes")
+    pendientes = cur.fetchone()[0]
+    if pendientes:
+        print(f"  ⚠️  {pendientes} horas pendientes de recalcular (python actualizar_reportes.py)")
+    conn.rollback()
+
+    cur.close()
+    conn.close()
+
+    if diferencias:
+        print(f"\n❌ {len(diferencias)} días con diferencias. Ejecute: python migrate_reportes.py --reconstruir\n")
+        exit(1)
+
+    print("  ✅ Resumen consistente con pagos")
+    print("\n" + "="*60)
+    print("  ✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+    print("="*60)
+    print("\n/admin/reportes lee los totales de pagos_resumen")
+    print("Programar: */5 * * * * python actualizar_reportes.py")
+    print()
+
+except psycopg2.OperationalError as e:
+    print(f"❌ Error de conexión: {e}\n")
+    exit(1)
+
+except Exception as e:
+    print(f"❌ Error inesperado: {e}")
+    import traceback
+    traceback.print_exc()
+    exit(1)
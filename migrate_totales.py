@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Script para materializar los totales del panel en la tabla pagos_totales
+Ejecución: python migrate_totales.py [--reconstruir | --verificar]
+
+Crea pagos_totales (una fila por moneda con la suma de monto_num y la
+cantidad de pagos) y los triggers que la mantienen al día en cada INSERT,
+UPDATE, DELETE y TRUNCATE sobre pagos. Los triggers son por sentencia y usan
+tablas de transición: un INSERT de 200 pagos del webhook hace un solo UPDATE
+por moneda, y un canje (que no cambia monto ni moneda) no toca la tabla.
+
+Costo: todo INSERT en pagos actualiza la fila de su moneda, así que dos lotes
+del webhook con la misma moneda se serializan: el segundo espera el COMMIT
+del primero para sumar sobre esa fila.
+
+/admin lee los totales sin búsqueda directamente de esta tabla: O(1), sin
+recorrer pagos.
+
+    (sin opciones)  instala tabla, funciones y triggers, y reconstruye
+    --reconstruir   recalcula pagos_totales desde cero
+    --verificar     compara pagos_totales con un SUM real (código 1 si difieren)
+"""
+
+import sys
+import psycopg2
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+MODO = sys.argv[1] if len(sys.argv) > 1 else "--instalar"
+
+INSTALACION = [
+    """
+    CREATE TABLE IF NOT EXISTS pagos_totales (
+        moneda CHAR(3) PRIMARY KEY,   -- '' para pagos sin moneda (anteriores a migrate_montos.py)
+        total NUMERIC(18,2) NOT NULL DEFAULT 0,
+        cantidad BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION pagos_totales_reconstruir() RETURNS void AS $$
+    BEGIN
+        -- Bloquea escrituras sobre pagos (no lecturas) mientras recalcula
+        LOCK TABLE pagos IN SHARE ROW EXCLUSIVE MODE;
+        DELETE FROM pagos_totales;
+        INSERT INTO pagos_totales (moneda, total, cantidad)
+        SELECT COALESCE(moneda, ''), COALESCE(SUM(monto_num), 0), COUNT(*)
+        FROM pagos
+        GROUP BY 1;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION pagos_totales_aplicar() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO pagos_totales AS t (moneda, total, cantidad)
+            SELECT COALESCE(moneda, ''), COALESCE(SUM(monto_num), 0), COUNT(*)
+            FROM nuevas GROUP BY 1
+            ON CONFLICT (moneda) DO UPDATE
+            SET total = t.total + EXCLUDED.total, cantidad = t.cantidad + EXCLUDED.cantidad;
+
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO pagos_totales AS t (moneda, total, cantidad)
+            SELECT COALESCE(moneda, ''), -COALESCE(SUM(monto_num), 0), -COUNT(*)
+            FROM viejas GROUP BY 1
+            ON CONFLICT (moneda) DO UPDATE
+            SET total = t.total + EXCLUDED.total, cantidad = t.cantidad + EXCLUDED.cantidad;
+
+        ELSIF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM pagos_totales;
+
+        ELSE
+            -- UPDATE: solo las filas cuyo monto o moneda cambió
+            INSERT INTO pagos_totales AS t (moneda, total, cantidad)
+            SELECT moneda, SUM(total), SUM(cantidad)
+            FROM (
+                SELECT COALESCE(v.moneda, '') AS moneda, -COALESCE(v.monto_num, 0) AS total, -1 AS cantidad
+                FROM viejas v JOIN nuevas n ON n.id = v.id
+                WHERE (v.monto_num, v.moneda) IS DISTINCT FROM (n.monto_num, n.moneda)
+                UNION ALL
+                SELECT COALESCE(n.moneda, ''), COALESCE(n.monto_num, 0), 1
+                FROM viejas v JOIN nuevas n ON n.id = v.id
+                WHERE (v.monto_num, v.moneda) IS DISTINCT FROM (n.monto_num, n.moneda)
+            ) cambios
+            GROUP BY moneda
+            ON CONFLICT (moneda) DO UPDATE
+            SET total = t.total + EXCLUDED.total, cantidad = t.cantidad + EXCLUDED.cantidad;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS pagos_totales_insert ON pagos",
+    "DROP TRIGGER IF EXISTS pagos_totales_update ON pagos",
+    "DROP TRIGGER IF EXISTS pagos_totales_delete ON pagos",
+    "DROP TRIGGER IF EXISTS pagos_totales_truncate ON pagos",
+    """
+    CREATE TRIGGER pagos_totales_insert AFTER INSERT ON pagos
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_totales_aplicar()
+    """,
+    """
+    CREATE TRIGGER pagos_totales_update AFTER UPDATE ON pagos
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_totales_aplicar()
+    """,
+    """
+    CREATE TRIGGER pagos_totales_delete AFTER DELETE ON pagos
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_totales_aplicar()
+    """,
+    # TRUNCATE no dispara los triggers de DELETE: sin este, los totales quedarían desfasados
+    """
+    CREATE TRIGGER pagos_totales_truncate AFTER TRUNCATE ON pagos
+    FOR EACH STATEMENT EXECUTE FUNCTION pagos_totales_aplicar()
+    """,
+]
+
+print("\n" + "="*60)
+print("  MIGRACIÓN: Totales materializados en 'pagos_totales'")
+print("="*60 + "\n")
+
+try:
+    # Conectar
+    print("Conectando a BD...")
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode="require" if "neon.tech" in (os.getenv("DB_HOST") or "") else "disable",
+        connect_timeout=5
+    )
+    print("✅ Conexión exitosa\n")
+
+    cur = conn.cursor()
+
+    if MODO == "--instalar":
+        # Todo en una transacción: triggers y reconstrucción quedan consistentes
+        print("Creando tabla, funciones y triggers...")
+        for sentencia in INSTALACION:
+            cur.execute(sentencia)
+        print("  ✅ Triggers instalados")
+
+    if MODO in ("--instalar", "--reconstruir"):
+        print("\nReconstruyendo totales desde cero...")
+        cur.execute("SELECT pagos_totales_reconstruir()")
+        conn.commit()
+        print("  ✅ Totales reconstruidos")
+
+    # Verificar contra un SUM real
+    print("\nVerificando totales...")
+    cur.execute("""
+        WITH real AS (
+            SELECT COALESCE(moneda, '') AS moneda, COALESCE(SUM(monto_num), 0) AS total, COUNT(*) AS cantidad
+            FROM pagos GROUP BY 1
+        )
+        SELECT COALESCE(r.moneda, t.moneda), t.total, r.total, t.cantidad, r.cantidad
+        FROM real r
+        FULL JOIN pagos_totales t ON t.moneda = r.moneda
+        ORDER BY 1
+    """)
+    diferencias = 0
+    for moneda, total_mat, total_real, cant_mat, cant_real in cur.fetchall():
+        ok = (total_mat or 0) == (total_real or 0) and (cant_mat or 0) == (cant_real or 0)
+        diferencias += not ok
+        print(f"  {'✅' if ok else '❌'} {moneda or 's/m':3s}: {cant_real or 0} pagos, "
+              f"{total_real or 0:,.2f} (materializado: {cant_mat or 0} pagos, {total_mat or 0:,.2f})")
+    conn.rollback()
+
+    cur.close()
+    conn.close()
+
+    if diferencias:
+        print(f"\n❌ {diferencias} monedas con diferencias. Ejecute: python migrate_totales.py --reconstruir\n")
+        exit(1)
+
+    print("\n" + "="*60)
+    print("  ✅ MIGRACIÓN COMPLETADA EXITOSAMENTE")
+    print("="*60)
+    print("\nEl panel lee los totales de pagos_totales")
+    print()
+
+except psycopg2.OperationalError as e:
+    print(f"❌ Error de conexión: {e}\n")
+    exit(1)
+
+except Exception as e:
+    print(f"❌ Error inesperado: {e}")
+    import traceback
+    traceback.print_exc()
+    exit(1)
@@ -0,0 +1,69 @@
+"""
+Normalización de montos de la tabla pagos
+
+El campo ``pagos.monto`` guarda el texto tal como llegó: formato venezolano
+("1.234,56") desde el webhook o formato del API BDV ("1234.56"). Estas
+funciones lo convierten al valor NUMERIC(14,2) de ``pagos.monto_num``.
+La moneda de ``pagos.moneda`` sale de la regla del banco en bancos.json
+(extractor.moneda_de_banco).
+
+Quien conoce el origen del texto debe pasar su formato: el formato_monto del
+banco (extractor.formato_de_banco) o FORMATO_API_BDV. "auto" adivina y con
+un solo punto se equivoca en montos venezolanos: "1.500" (mil quinientos
+bolívares) da 1.50, igual que "12.50" da 12.50.
+"""
+from decimal import Decimal, InvalidOperation
+
+CENTIMOS = Decimal("0.01")
+MONTO_MAXIMO = Decimal("999999999999.99")  # Límite de NUMERIC(14,2)
+
+# El API de Conciliación BDV devuelve "1234.56" (punto decimal, sin miles),
+# aunque las notificaciones del mismo banco por el webhook usen "1.234,56"
+FORMATO_API_BDV = "en"
+
+
+def normalizar_monto(texto, formato="auto"):
+    """
+    Convierte un monto en texto a Decimal con 2 decimales.
+
+    Args:
+        texto (str): Monto tal como llegó
+        formato (str): "ve" (1.234,56), "en" (1,234.56) o "auto" para deducirlo.
+            En "auto" se aceptan "1.234,56", "1234,56", "1234.56", "1,234.56" y "1.234.567";
+            un solo punto se toma como decimal, así que no usar "auto" para texto en
+            formato venezolano ("1.500" sería 1.50, no 1500.00).
+
+    Returns:
+        Decimal | None: None si el texto no es un monto válido
+    """
+    if texto is None:
+        return None
+
+    limpio = str(texto).strip().replace(" ", "")
+    if not limpio:
+        return None
+
+    if formato == "ve":
+        limpio = limpio.replace(".", "").replace(",", ".")
+    elif formato == "en":
+        limpio = limpio.replace(",", "")
+    elif "," in limpio:
+        if "." in limpio and limpio.rindex(".") > limpio.rindex(","):
+            # Formato inglés: 1,234.56
+            limpio = limpio.replace(",", "")
+        else:
+            # Formato venezolano: 1.234,56
+            limpio = limpio.replace(".", "").replace(",", ".")
+    elif limpio.count(".") > 1:
+        # Solo separadores de miles: 1.234.567
+        limpio = limpio.replace(".", "")
+
+    try:
+        valor = Decimal(limpio).quantize(CENTIMOS)
+    except (InvalidOperation, ValueError):
+        return None
+
+    if not valor.is_finite() or valor < 0 or valor > MONTO_MAXIMO:
+        return None
+    return valor
+
@@ -0,0 +1,292 @@
+"""
+Perfilado por muestreo de peticiones bajo demanda (/admin/perfiles)
+Versión: 1.0 - Producción
+
+Para reproducir en producción lo que no se reproduce en local (búsquedas
+lentas de /admin, por ejemplo), una petición se perfila cuando:
+
+- la hace un administrador con sesión y agrega ``?perfil=1`` o la cabecera
+  ``X-Perfil: 1``, o
+- su ruta está en PERFILES_MUESTREO y la sortea (``/admin=0.05`` perfila
+  el 5% de las peticiones a /admin).
+
+Mientras dura la petición, un hilo toma cada PERFILES_INTERVALO_MS la pila
+del hilo que la atiende (sys._current_frames) y los cursores de sus
+conexiones del pool registran cada sentencia SQL con su tiempo. Al terminar
+se guardan en PERFILES_DIR:
+
+    <id>.txt   pilas colapsadas (flamegraph.pl, speedscope.app)
+    <id>.svg   flame graph listo para abrir en el navegador
+    <id>.json  ruta, duración, muestras y sentencias SQL con sus tiempos
+
+La respuesta perfilada lleva la cabecera ``X-Perfil: <id>``. Con PERFILES=0
+(por defecto) no se instala ningún gancho: el único costo es una comparación
+al prestar una conexión del pool. Las respuestas en streaming (exportación
+CSV) se perfilan solo hasta que empiezan a enviarse.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import secrets
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from html import escape
+
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+HABILITADO = os.getenv("PERFILES", "0") == "1"
+DIRECTORIO = os.getenv("PERFILES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfiles"))
+INTERVALO = int(os.getenv("PERFILES_INTERVALO_MS", "5")) / 1000
+MAXIMO_GUARDADOS = int(os.getenv("PERFILES_MAXIMO", "200"))
+MAXIMO_SQL = 500  # Sentencias registradas por perfil
+LARGO_SQL = 2000  # Caracteres guardados de cada sentencia
+
+_local = threading.local()
+
+
+def parsear_muestreo(valor):
+    """
+    "/admin=0.05, /verificar=0.001" -> {"/admin": 0.05, "/verificar": 0.001}
+
+    Las claves son reglas de Flask (/admin/perfiles/<nombre>), no URLs.
+    """
+    muestreo = {}
+    for parte in (valor or "").split(","):
+        if not parte.strip():
+            continue
+        ruta, _, fraccion = parte.strip().rpartition("=")
+        try:
+            muestreo[ruta.strip()] = min(max(float(fraccion), 0.0), 1.0)
+        except ValueError:
+            logger.warning(f"PERFILES_MUESTREO: valor inválido {parte!r}")
+    return muestreo
+
+
+MUESTREO = parsear_muestreo(os.getenv("PERFILES_MUESTREO", ""))
+
+
+class Perfil:
+    """Muestras de pila y sentencias SQL de una petición"""
+
+    def __init__(self, metodo, url, ruta, motivo):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}"
+        self.metodo = metodo
+        self.url = url
+        self.ruta = ruta
+        self.motivo = motivo
+        self.pilas = Counter()
+        self.sql = []
+        self.sql_omitidas = 0
+        self.inicio = time.perf_counter()
+        self.duracion = None
+        self.codigo = None
+        self._hilo = threading.get_ident()
+        self._parar = threading.Event()
+        self._muestreador = threading.Thread(target=self._muestrear, name=f"perfil-{self.id}", daemon=True)
+        self._muestreador.start()
+
+    def _muestrear(self):
+        while not self._parar.wait(INTERVALO):
+            frame = sys._current_frames().get(self._hilo)
+            if frame is None:
+                continue
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            self.pilas[";".join(reversed(pila))] += 1
+
+    def registrar_sql(self, sql, segundos):
+        if len(self.sql) >= MAXIMO_SQL:
+            self.sql_omitidas += 1
+            return
+        if isinstance(sql, bytes):
+            sql = sql.decode("utf-8", "replace")
+        self.sql.append({"sql": " ".join((sql or "").split())[:LARGO_SQL], "ms": round(segundos * 1000, 3)})
+
+    def terminar(self, codigo):
+        self._parar.set()
+        self._muestreador.join()
+        self.duracion = time.perf_counter() - self.inicio
+        self.codigo = codigo
+
+    def resumen(self):
+        return {
+            "id": self.id,
+            "fecha": self.id[:15],
+            "metodo": self.metodo,
+            "url": self.url,
+            "ruta": self.ruta,
+            "motivo": self.motivo,
+            "codigo": self.codigo,
+            "ms": round(self.duracion * 1000, 1),
+            "intervalo_ms": INTERVALO * 1000,
+            "muestras": sum(self.pilas.values()),
+            "sql_ms": round(sum(s["ms"] for s in self.sql), 1),
+            "sql_omitidas": self.sql_omitidas,
+            "sql": self.sql,
+        }
+
+
+class CursorPerfilado(psycopg2.extensions.cursor):
+    """Cursor que anota cada sentencia y su tiempo en el perfil del hilo"""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._anotar(inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._anotar(inicio)
+
+    def _anotar(self, inicio):
+        perfil = getattr(_local, "perfil", None)
+        if perfil is not None:
+            perfil.registrar_sql(self.query, time.perf_counter() - inicio)
+
+
+def cursor_del_hilo():
+    """cursor_factory para una conexión prestada en este hilo (None si no se está perfilando)"""
+    return CursorPerfilado if getattr(_local, "perfil", None) is not None else None
+
+
+def flamegraph_svg(pilas, titulo, ancho=1200, alto_fila=16):
+    """Flame graph SVG autocontenido a partir de pilas colapsadas {"a;b;c": muestras}"""
+    raiz = {"hijos": {}, "valor": 0}
+    for pila, muestras in pilas.items():
+        raiz["valor"] += muestras
+        nodo = raiz
+        for nombre in pila.split(";"):
+            nodo = nodo["hijos"].setdefault(nombre, {"hijos": {}, "valor": 0})
+            nodo["valor"] += muestras
+
+    total = raiz["valor"] or 1
+    rectangulos, profundidad_maxima = [], 0
+    pendientes = [(raiz["hijos"], 0.0, 0)]
+    while pendientes:
+        hijos, x, profundidad = pendientes.pop()
+        for nombre, nodo in sorted(hijos.items()):
+            w = nodo["valor"] / total * ancho
+            if w >= 0.5:  # Marcos de menos de medio píxel no se ven
+                rectangulos.append((nombre, nodo["valor"], x, w, profundidad))
+                profundidad_maxima = max(profundidad_maxima, profundidad)
+                pendientes.append((nodo["hijos"], x, profundidad + 1))
+            x += w
+
+    alto = (profundidad_maxima + 1) * alto_fila + 30
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{alto}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="14">{escape(titulo)} ({total} muestras)</text>',
+    ]
+    for nombre, valor, x, w, profundidad in rectangulos:
+        y = alto - (profundidad + 1) * alto_fila
+        tono = zlib.crc32(nombre.split(" (")[0].encode()) % 55
+        etiqueta = escape(nombre[:int(w / 7)]) if w > 21 else ""
+        partes.append(
+            f'<g><title>{escape(nombre)}: {valor} muestras ({valor / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{alto_fila - 1}" fill="hsl({tono},85%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + 11}">{etiqueta}</text></g>'
+        )
+    partes.append("</svg>")
+    return "\n".join(partes)
+
+
+def guardar(perfil):
+    """Escribe .txt, .svg y .json del perfil y poda los más antiguos"""
+    try:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        base = os.path.join(DIRECTORIO, perfil.id)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.writelines(f"{pila} {muestras}\n" for pila, muestras in perfil.pilas.most_common())
+        with open(base + ".svg", "w", encoding="utf-8") as f:
+            f.write(flamegraph_svg(perfil.pilas, f"{perfil.metodo} {perfil.url}"))
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(perfil.resumen(), f, ensure_ascii=False, indent=1)
+        logger.info(f"Perfil {perfil.id} guardado: {perfil.metodo} {perfil.url} ({perfil.duracion * 1000:.0f} ms)")
+
+        guardados = sorted(n for n in os.listdir(DIRECTORIO) if n.endswith(".json"))
+        for nombre in guardados[:-MAXIMO_GUARDADOS]:
+            for extension in (".json", ".txt", ".svg"):
+                try:
+                    os.remove(os.path.join(DIRECTORIO, nombre[:-5] + extension))
+                except FileNotFoundError:
+                    pass
+    except Exception as e:
+        logger.error(f"No se pudo guardar el perfil {perfil.id}: {e}")
+
+
+def listar():
+    """Resúmenes de los perfiles guardados, del más reciente al más antiguo"""
+    if not os.path.isdir(DIRECTORIO):
+        return []
+    perfiles = []
+    for nombre in sorted((n for n in os.listdir(DIRECTORIO) if n.endswith(".json")), reverse=True):
+        try:
+            with open(os.path.join(DIRECTORIO, nombre), encoding="utf-8") as f:
+                perfiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return perfiles
+
+
+def instalar(app, es_admin):
+    """
+    Registra los ganchos de perfilado en la app (no hace nada con PERFILES=0).
+
+    Args:
+        app: Aplicación Flask
+        es_admin (callable): Devuelve True si la petición actual es de un administrador
+    """
+    if not HABILITADO:
+        return
+
+    from flask import request
+
+    @app.before_request
+    def _iniciar_perfil():
+        regla = request.url_rule.rule if request.url_rule else None
+        if request.args.get("perfil") == "1" or request.headers.get("X-Perfil") == "1":
+            if not es_admin():
+                return
+            motivo = "admin"
+        elif MUESTREO.get(regla, 0.0) > random.random():
+            motivo = "muestreo"
+        else:
+            return
+        _local.perfil = Perfil(request.method, request.full_path.rstrip("?"), regla, motivo)
+
+    @app.after_request
+    def _terminar_perfil(response):
+        perfil = getattr(_local, "perfil", None)
+        if perfil is not None:
+            _local.perfil = None
+            perfil.terminar(response.status_code)
+            response.headers["X-Perfil"] = perfil.id
+            # Escribir el SVG no debe retrasar la respuesta
+            threading.Thread(target=guardar, args=(perfil,), name="guardar-perfil", daemon=True).start()
+        return response
+
+    @app.teardown_request
+    def _limpiar_perfil(error=None):
+        # Si la petición terminó sin pasar por after_request, el muestreador no debe seguir vivo
+        perfil = getattr(_local, "perfil", None)
+        if perfil is not None:
+            _local.perfil = None
+            perfil.terminar(500)
+            guardar(perfil)
+
+    logger.info(f"Perfilado habilitado en {DIRECTORIO} (muestreo: {MUESTREO or 'solo bajo demanda'})")
@@ -0,0 +1,133 @@
+"""
+Reportes de recaudación por banco, día y hora (cierre de turno)
+
+Los reportes no recorren pagos: leen pagos_resumen, una fila por
+(hora VET, banco, estado, moneda) con cantidad y suma de monto_num
+(ver migrate_reportes.py). Un mes son unas pocas centenas de filas.
+
+actualizar_resumen() es el job incremental: toma las horas que los
+triggers anotaron en pagos_resumen_pendientes y recalcula solo esas con un
+GROUP BY sobre el rango de created_at. Lo ejecutan actualizar_reportes.py
+(cron) y /admin/reportes antes de leer.
+"""
+import os
+import logging
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+# Candado consultivo (pg_try_advisory_xact_lock): un solo proceso recalcula a la vez
+CANDADO_RESUMEN = 720020
+
+# Horas recalculadas por transacción; el resto queda para la siguiente vuelta
+HORAS_POR_LOTE = int(os.getenv("REPORTES_HORAS_POR_LOTE", "500"))
+
+AGRUPACIONES = {"dia": "day", "hora": "hour"}
+
+
+def actualizar_resumen(conn, horas_por_lote=HORAS_POR_LOTE):
+    """
+    Recalcula las horas pendientes de pagos_resumen en una transacción.
+
+    Las marcas se consumen con DELETE ... RETURNING: las que insertan
+    transacciones aún no confirmadas no son visibles, quedan en la tabla y
+    se procesan en la siguiente llamada. El GROUP BY es una sentencia
+    posterior, así que ve todo lo confirmado antes de consumir las marcas.
+
+    Args:
+        conn: Conexión de PostgreSQL (esta función hace commit)
+        horas_por_lote (int): Máximo de horas a recalcular en esta llamada
+
+    Returns:
+        int | None: Horas recalculadas, o None si otro proceso está actualizando
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (CANDADO_RESUMEN,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+
+        cur.execute("""
+            WITH lote AS (
+                SELECT DISTINCT hora FROM pagos_resumen_pendientes ORDER BY hora LIMIT %s
+            )
+            DELETE FROM pagos_resumen_pendientes p
+            USING lote
+            WHERE p.hora = lote.hora
+            RETURNING p.hora
+        """, (horas_por_lote,))
+        horas = sorted({fila[0] for fila in cur.fetchall()})
+        if not horas:
+            conn.rollback()
+            return 0
+
+        cur.execute("DELETE FROM pagos_resumen WHERE hora = ANY(%s)", (horas,))
+        # Rango de created_at de cada hora VET (usa idx_created_at)
+        cur.execute("""
+            INSERT INTO pagos_resumen (hora, banco, estado, moneda, cantidad, total)
+            SELECT h.hora, COALESCE(p.banco, ''), COALESCE(p.estado, ''), COALESCE(p.moneda, ''),
+                   COUNT(*), COALESCE(SUM(p.monto_num), 0)
+            FROM unnest(%s::timestamp[]) AS h(hora)
+            JOIN pagos p
+              ON p.created_at >= timezone('America/Caracas', h.hora)::timestamp
+             AND p.created_at < timezone('America/Caracas', h.hora + interval '1 hour')::timestamp
+            GROUP BY 1, 2, 3, 4
+        """, (horas,))
+    conn.commit()
+    logger.info(f"Resumen de reportes: {len(horas)} horas recalculadas ({horas[0]} a {horas[-1]})")
+    return len(horas)
+
+
+def consultar_reporte(cur, desde, hasta, agrupar="dia", banco=None):
+    """
+    Recaudación por período, banco y moneda desde pagos_resumen.
+
+    Args:
+        cur: Cursor de PostgreSQL
+        desde (date): Primer día inclusive (VET)
+        hasta (date): Último día inclusive (VET)
+        agrupar (str): 'dia' u 'hora'
+        banco (str): Banco exacto (BDV, BANESCO, ...) o None para todos
+
+    Returns:
+        tuple: (filas, totales)
+            filas (list): dicts {periodo, banco, moneda, cantidad, total,
+                canjeados, total_canjeado}, ordenados por período y banco
+            totales (dict): {moneda: {cantidad, total, canjeados, total_canjeado}}
+    """
+    condiciones = ["hora >= %s", "hora < %s::date + 1"]
+    params = [desde, hasta]
+    if banco:
+        condiciones.append("banco = %s")
+        params.append(banco.upper())
+
+    cur.execute(f"""
+        SELECT date_trunc('{AGRUPACIONES[agrupar]}', hora) AS periodo, banco, moneda,
+               SUM(cantidad), SUM(total),
+               COALESCE(SUM(cantidad) FILTER (WHERE estado = 'CANJEADO'), 0),
+               COALESCE(SUM(total) FILTER (WHERE estado = 'CANJEADO'), 0)
+        FROM pagos_resumen
+        WHERE {" AND ".join(condiciones)}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    """, tuple(params))
+
+    filas, totales = [], {}
+    for periodo, banco_fila, moneda, cantidad, total, canjeados, total_canjeado in cur.fetchall():
+        filas.append({
+            "periodo": periodo,
+            "banco": banco_fila,
+            "moneda": moneda,
+            "cantidad": cantidad,
+            "total": total,
+            "canjeados": canjeados,
+            "total_canjeado": total_canjeado,
+        })
+        acumulado = totales.setdefault(moneda, {
+            "cantidad": 0, "total": Decimal("0"), "canjeados": 0, "total_canjeado": Decimal("0")
+        })
+        acumulado["cantidad"] += cantidad
+        acumulado["total"] += total
+        acumulado["canjeados"] += canjeados
+        acumulado["total_canjeado"] += total_canjeado
+    return filas, totales